@@ -7,6 +7,9 @@ Pode ser executado múltiplas vezes sem causar problemas.
 import os
 import sqlite3
 import psycopg2
+import cache
+from usuarios_config import USUARIOS
+from usuarios import hash_senha
 
 def add_fcl4_user():
     """Adiciona o usuário FCL4 ao banco de dados"""
@@ -29,11 +32,8 @@ def add_fcl4_user():
         
         cur = conn.cursor()
         
-        # Dados do novo usuário
-        username = 'fcl4'
-        password = 'fcl423'
-        role = 'loja'
-        store_name = 'FCL4'
+        # Dados do novo usuário (mesma definição do init_db.py)
+        username, password, role, store_name = next(u for u in USUARIOS if u[0] == 'fcl4')
         
         # Verificar se o usuário já existe
         print(f"Verificando se o usuário '{username}' já existe...")
@@ -53,13 +53,15 @@ def add_fcl4_user():
             if is_postgres:
                 cur.execute(
                     "INSERT INTO users (username, password, role, store_name) VALUES (%s, %s, %s, %s) ON CONFLICT (username) DO NOTHING;",
-                    (username, password, role, store_name)
+                    (username, hash_senha(password), role, store_name)
                 )
             else:
                 cur.execute(
                     "INSERT OR IGNORE INTO users (username, password, role, store_name) VALUES (?, ?, ?, ?);",
-                    (username, password, role, store_name)
+                    (username, hash_senha(password), role, store_name)
                 )
+            # Avisa os workers do app para descartar os usuários em cache.
+            cache.invalidar(cur, cache.USUARIOS)
             
             conn.commit()
             print(f"✅ Usuário '{username}' adicionado com sucesso!")
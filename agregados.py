@@ -0,0 +1,114 @@
+# agregados.py - Totais diários por produto e loja (tabela agregados_diarios)
+"""
+Uma linha por (data_pedido, produto, loja) com o que a loja contou (caixas e
+fracionado), o pedido final salvo pelo admin, o custo do produto no momento
+da gravação e o valor do pedido final (pedido_final × custo), já calculado
+para o dashboard e o relatório por período não precisarem refazer a conta.
+
+A tabela é mantida incrementalmente por enviar_pedido() e salvar_pedido(),
+na mesma transação que grava pedidos/pedidos_finais, e atende o relatório por
+período sem varrer a tabela pedidos: um período de N dias lê no máximo
+N × produtos × lojas linhas, pela chave primária que começa pela data.
+"""
+
+from datetime import date, timedelta
+
+import queries
+from relatorio_engine import TIPOS_FRACIONADOS
+
+# Maior período aceito pelo relatório consolidado.
+PERIODO_MAXIMO_DIAS = 366
+
+AGRUPAMENTOS = ('dia', 'semana', 'mes', 'total')
+
+
+def atualizar_contagens_loja(cursor, data_pedido, loja, contagem, produtos, custos):
+    """Regrava os totais de `produtos` para a loja no dia.
+
+    `contagem` é o estado completo da loja no dia ({(produto, tipo): quantidade}),
+    `custos` é {produto: custo} do catálogo atual.
+    """
+    linhas = []
+    for produto in sorted(produtos):
+        caixas = contagem.get((produto, 'Caixa'), 0)
+        fracionado = sum(contagem.get((produto, tipo), 0) for tipo in TIPOS_FRACIONADOS)
+        linhas.append((data_pedido, produto, loja, caixas, fracionado, custos.get(produto)))
+    queries.inserir_em_lote(cursor, 'gravar_agregado_contagem', linhas)
+
+
+def atualizar_pedidos_finais(cursor, data_pedido, pedidos, custos):
+    """Substitui os pedidos finais do dia; `pedidos` é [(produto, loja, quantidade)]."""
+    queries.executar(cursor, 'limpar_agregados_pedido_final', (data_pedido,))
+    linhas = []
+    for produto, loja, quantidade in pedidos:
+        custo = custos.get(produto)
+        valor = round(quantidade * float(custo), 2) if custo is not None else None
+        linhas.append((data_pedido, produto, loja, quantidade, custo, valor))
+    queries.inserir_em_lote(cursor, 'gravar_agregado_pedido_final', linhas)
+
+
+def reconstruir_periodo(cursor, inicio, fim):
+    """Recalcula as linhas de `inicio` a `fim` a partir de pedidos e pedidos_finais.
+
+    Usa o custo vigente em cada data (product_cost_history). Para corrigir a
+    tabela depois de uma alteração feita fora do app; roda como tarefa
+    'reconstruir_agregados' do worker. Retorna o número de linhas gravadas.
+    """
+    queries.executar(cursor, 'apagar_agregados_periodo', (inicio, fim))
+    return queries.executar(cursor, 'reconstruir_agregados_periodo', (inicio, fim, inicio, fim)).rowcount
+
+
+def valor_por_loja(cursor, data_pedido, lojas):
+    """[{loja, valor, itens}] do pedido final salvo na data, na ordem de `lojas`, e o total."""
+    queries.executar(cursor, 'valor_por_loja_na_data', (data_pedido,))
+    por_loja = {loja: (float(valor or 0), itens) for loja, valor, itens in cursor.fetchall()}
+    linhas = [{"loja": loja, "valor": round(por_loja.get(loja, (0.0, 0))[0], 2), "itens": por_loja.get(loja, (0.0, 0))[1]}
+              for loja in lojas]
+    return linhas, round(sum(linha["valor"] for linha in linhas), 2)
+
+
+def _semana(data_str):
+    dia = date.fromisoformat(data_str)
+    return (dia - timedelta(days=dia.weekday())).isoformat()
+
+
+def consultar_periodo(cursor, inicio, fim, agrupar='total'):
+    """Totais de [inicio, fim] (datas 'AAAA-MM-DD') por período, produto e loja.
+
+    Retorna linhas {periodo, produto, loja, caixas, fracionado, pedido_final, valor_pedido},
+    onde periodo é a data (dia), a segunda-feira da semana (semana), 'AAAA-MM' (mes)
+    ou a data inicial (total), e valor_pedido é a soma dos valores gravados em cada dia.
+    As somas são feitas pelo banco; só o agrupamento por semana é completado aqui.
+    """
+    if agrupar == 'total':
+        queries.executar(cursor, 'agregados_do_periodo', (inicio, fim))
+        linhas = [(inicio,) + tuple(linha) for linha in cursor.fetchall()]
+    else:
+        queries.executar(cursor, 'agregados_por_mes' if agrupar == 'mes' else 'agregados_por_dia', (inicio, fim))
+        linhas = cursor.fetchall()
+
+    if agrupar == 'semana':
+        semanas = {}
+        for data_str, produto, loja, caixas, fracionado, pedido_final, valor in linhas:
+            chave = (_semana(data_str), produto, loja)
+            total = semanas.get(chave)
+            if total is None:
+                semanas[chave] = [caixas, fracionado, pedido_final, valor]
+                continue
+            total[0] += caixas
+            total[1] += fracionado
+            if pedido_final is not None:
+                total[2] = (total[2] or 0) + pedido_final
+                total[3] = (total[3] or 0) + valor
+        linhas = [chave + tuple(total) for chave, total in semanas.items()]
+
+    return [
+        {
+            "periodo": periodo, "produto": produto, "loja": loja,
+            "caixas": int(caixas), "fracionado": int(fracionado),
+            "pedido_final": int(pedido_final) if pedido_final is not None else None,
+            "valor_pedido": round(float(valor or 0), 2),
+        }
+        for periodo, produto, loja, caixas, fracionado, pedido_final, valor in sorted(linhas, key=lambda l: l[:3])
+        if caixas or fracionado or pedido_final is not None
+    ]
@@ -1,47 +1,71 @@
 # app.py
 
-import sqlite3
-import pandas as pd
-import numpy as np
-import psycopg2
 import os
-import pyodbc
+import io
+import hashlib
 import json
-from flask import Flask, render_template, request, redirect, url_for, session, make_response, flash, jsonify
-from datetime import datetime, date
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from datetime import datetime, date, timedelta
 from functools import wraps
-from fpdf import FPDF
+
+import agregados
+import cache
+import custos
+import database
+import eventos_relatorio
+import instrumentacao
+import jobs
+import pdf_pedido
+import previsao
+import queries
+import relatorio_engine
+import tarefas  # noqa: F401 - registra as tarefas em jobs.TAREFAS (/api/jobs)
+import usuarios
+from lojas_config import DIAS_PEDIDO, LOJAS
+from database import get_db
 
 app = Flask(__name__, static_folder='static')
 app.secret_key = 'chave-super-secreta-para-o-projeto-hortifruti'
+database.init_app(app)
+instrumentacao.init_app(app)
 
-DATABASE = 'hortifruti.db'
-DIAS_PEDIDO = {0: "SEGUNDA-FEIRA", 1: "TERÇA-FEIRA", 2: "QUARTA-FEIRA", 4: "SEXTA-FEIRA", 5: "SÁBADO"}
-LOJAS = ["BCS", "SJN", "FCL2", "MEP", "FCL3", "FCL4"]
+dias_semana = cache.dias_semana
 
 # --- FUNÇÕES DE CONEXÃO E DECORATORS ---
 
-def get_db():
-    db_url = os.environ.get('DATABASE_URL')
-    if db_url:
-        return psycopg2.connect(db_url)
-    else:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
-        return conn
+def usuario_da_sessao():
+    """Usuário logado, conferido no cache de usuários; None (e sessão limpa) se ele não existe mais.
+
+    Role e loja vêm do cache, que só volta ao banco depois de USUARIOS_CACHE_TTL
+    segundos: uma alteração no usuário vale em até esse tempo.
+    """
+    username = session.get('username')
+    if username is None: return None
+    usuario = cache.usuarios.recente(username)
+    if usuario is None:
+        cursor = get_db().cursor()
+        usuario = cache.usuarios.obter(cursor, username)
+        cursor.close()
+    if usuario is None:
+        session.clear()
+        return None
+    if session.get('role') != usuario.role: session['role'] = usuario.role
+    if session.get('store_name') != usuario.store_name: session['store_name'] = usuario.store_name
+    return usuario
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'username' not in session: return redirect(url_for('login'))
+        if usuario_da_sessao() is None: return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'username' not in session: return redirect(url_for('login'))
-        if session.get('role') != 'admin': return "Acesso negado.", 403
+        usuario = usuario_da_sessao()
+        if usuario is None: return redirect(url_for('login'))
+        if usuario.role != 'admin': return "Acesso negado.", 403
         return f(*args, **kwargs)
     return decorated_function
 
@@ -57,21 +81,36 @@ def api_key_required(f):
             return jsonify({"message": "Chave de API inválida ou ausente."}), 401
     return decorated_function
 
+def admin_ou_api_key_required(f):
+    # Com X-API-KEY vale a chave da API (scripts); sem ela, a sessão de um admin.
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.headers.get('X-API-KEY'):
+            return api_key_required(f)(*args, **kwargs)
+        return admin_required(f)(*args, **kwargs)
+    return decorated_function
+
 # --- FUNÇÕES AUXILIARES DE DADOS ---
 
+def get_dias_semana():
+    cursor = get_db().cursor()
+    snapshot = dias_semana.snapshot(cursor)
+    cursor.close()
+    return snapshot
+
 def get_products_for_day(day_id):
-    db = get_db()
-    cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
-    query = "SELECT p.id, p.name, p.unidade_fracionada, p.codigo_interno, p.cost FROM products p JOIN product_availability pa ON p.id = pa.product_id WHERE pa.day_id = %s ORDER BY p.name;" if db_url else "SELECT p.id, p.name, p.unidade_fracionada, p.codigo_interno, p.cost FROM products p JOIN product_availability pa ON p.id = pa.product_id WHERE pa.day_id = ? ORDER BY p.name;"
-    cursor.execute(query, (day_id,))
-    products_data = cursor.fetchall()
-    products_list = [dict(zip([desc[0] for desc in cursor.description], row)) for row in products_data]
-    for p in products_list: p['nome'] = p.pop('name')
+    cursor = get_db().cursor()
+    products_list = cache.catalogo.produtos_do_dia(cursor, day_id)
     cursor.close()
-    db.close()
     return products_list
 
+def custos_da_data(produtos, data_str, day_id):
+    """Preenche p['custo'] com o custo vigente em data_str (o atual para hoje ou sem histórico)."""
+    cursor = get_db().cursor()
+    custos.custos_dos_produtos(cursor, produtos, data_str, day_id)
+    cursor.close()
+    return produtos
+
 def obter_dados_relatorio(data_selecionada_str):
     try:
         data_obj = datetime.strptime(data_selecionada_str, '%Y-%m-%d').date()
@@ -80,79 +119,24 @@ def obter_dados_relatorio(data_selecionada_str):
     
     dia_da_semana = data_obj.weekday()
     
-    # Verificar se o dia da semana está ativo na configuração
-    db = get_db()
-    cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
-    query = "SELECT ativo FROM dias_semana_config WHERE dia_id = %s;" if db_url else "SELECT ativo FROM dias_semana_config WHERE dia_id = ?;"
-    cursor.execute(query, (dia_da_semana,))
-    result = cursor.fetchone()
-    cursor.close()
-    db.close()
-    
-    # Se não encontrou na configuração ou está inativo, usar lógica antiga
-    if not result or not result[0]:
-        if dia_da_semana not in DIAS_PEDIDO: 
-            return "INATIVO", None, None
+    # Verificar se o dia da semana tem relatório (configuração em memória, com fallback para DIAS_PEDIDO)
+    dias = get_dias_semana()
+    if not dias.tem_relatorio(dia_da_semana):
+        return "INATIVO", None, None, None
     
-    nome_dia = DIAS_PEDIDO[dia_da_semana]
-    produtos_do_dia = get_products_for_day(dia_da_semana)
-    
-    for p in produtos_do_dia:
-        p['custo'] = p.get('cost') or 0.0
+    nome_dia = dias.nome(dia_da_semana)
+    produtos_do_dia = custos_da_data(get_products_for_day(dia_da_semana), data_obj.isoformat(), dia_da_semana)
 
     if not produtos_do_dia:
-        return [], nome_dia, data_obj
+        return [], None, nome_dia, data_obj
 
-    produtos_do_dia_nomes = [p['nome'] for p in produtos_do_dia]
-    db = get_db()
-    query_pedidos = f"SELECT produto, tipo, loja, quantidade FROM pedidos WHERE data_pedido = '{data_selecionada_str}'"
-    df_pedidos = pd.read_sql_query(query_pedidos, db)
-    
-    db_url = os.environ.get('DATABASE_URL')
-    query_pedidos_finais = "SELECT produto_nome, loja_nome, quantidade_pedida FROM pedidos_finais WHERE data_pedido = %s" if db_url else "SELECT produto_nome, loja_nome, quantidade_pedida FROM pedidos_finais WHERE data_pedido = ?"
-    df_pedidos_finais = pd.read_sql(query_pedidos_finais, db, params=(data_selecionada_str,))
-    db.close()
-    
-    df_caixas = df_pedidos[df_pedidos['tipo'] == 'Caixa']
-    df_fracionado = df_pedidos[df_pedidos['tipo'].isin(['KG', 'UN'])]
-    pivot_caixas = pd.pivot_table(df_caixas, values='quantidade', index='produto', columns='loja', aggfunc='sum').reindex(index=produtos_do_dia_nomes, columns=LOJAS).fillna(0).astype(int)
-    pivot_fracionado = pd.pivot_table(df_fracionado, values='quantidade', index='produto', columns='loja', aggfunc='sum').reindex(index=produtos_do_dia_nomes, columns=LOJAS).fillna(0).astype(int)
-    
-    pedidos_salvos = {}
-    for index, row in df_pedidos_finais.iterrows():
-        key = f"{row['produto_nome']}_{row['loja_nome']}"
-        pedidos_salvos[key] = row['quantidade_pedida']
-
-    report_data = []
-    for produto in produtos_do_dia:
-        produto_nome = produto['nome']
-        produto_row = {"produto_nome": produto_nome, "custo": f"R$ {produto['custo']:.2f}".replace('.', ','), "lojas": []}
-        for loja_nome in LOJAS:
-            caixa_val = pivot_caixas.loc[produto_nome, loja_nome] if produto_nome in pivot_caixas.index else 0
-            fracao_val = pivot_fracionado.loc[produto_nome, loja_nome] if produto_nome in pivot_fracionado.index else 0
-            fracao_str = "0"
-            if fracao_val > 0:
-                fracao_str = f"{fracao_val} {produto['unidade_fracionada'].lower()}"
-            pedido_key = f"{produto_nome}_{loja_nome}"
-            pedido_salvo_val = pedidos_salvos.get(pedido_key, '')
-            loja_data = {"nome": loja_nome, "caixa": caixa_val, "fracao": fracao_str, "pedido_id": f"pedido_{produto_nome.replace(' ', '_').replace('.', '')}_{loja_nome}", "pedido_salvo": pedido_salvo_val}
-            produto_row["lojas"].append(loja_data)
-        report_data.append(produto_row)
-            
-    return report_data, nome_dia, data_obj
-
-class PDF(FPDF):
-    def __init__(self, orientation='P', unit='mm', format='A4', data_pedido=''):
-        super().__init__(orientation, unit, format)
-        self.data_pedido = data_pedido
-
-    def header(self):
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, 'Pedido de Hortifruti', 0, 1, 'C')
-        self.set_font('Arial', '', 10)
-        self.cell(0, 10, f'Pedido do Dia: {self.data_pedido}', 0, 1, 'C')
-        self.ln(5)
+    cursor = get_db().cursor()
+    grade = relatorio_engine.carregar_grade(cursor, data_selecionada_str, produtos_do_dia, LOJAS)
+    cursor.close()
+    valores = relatorio_engine.calcular_valores(grade)
+    report_data = relatorio_engine.montar_report_data(grade, valores)
+    totais = relatorio_engine.montar_totais(grade, valores)
+    return report_data, totais, nome_dia, data_obj
 
 # --- ROTAS DA APLICAÇÃO ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -162,19 +146,14 @@ def login():
         password = request.form['password']
         db = get_db()
         cursor = db.cursor()
-        db_url = os.environ.get('DATABASE_URL')
-        query = "SELECT * FROM users WHERE username = %s AND password = %s" if db_url else "SELECT * FROM users WHERE username = ? AND password = ?"
-        cursor.execute(query, (username, password))
-        user_data = cursor.fetchone()
-        if user_data: user = dict(zip([desc[0] for desc in cursor.description], user_data))
-        else: user = None
+        user, regravada = usuarios.autenticar(cursor, username, password)
+        if regravada: db.commit()  # senha antiga regravada com hash
         cursor.close()
-        db.close()
         if user:
-            session['username'] = user['username']
-            session['role'] = user['role']
-            session['store_name'] = user['store_name']
-            if user['role'] == 'admin': return redirect(url_for('relatorio'))
+            session['username'] = user.username
+            session['role'] = user.role
+            session['store_name'] = user.store_name
+            if user.role == 'admin': return redirect(url_for('relatorio'))
             else: return redirect(url_for('index'))
         else: return render_template('login.html', error='Usuario ou senha invalidos.')
     return render_template('login.html')
@@ -190,18 +169,9 @@ def index():
     hoje = datetime.now().weekday()
     loja_logada = session.get('store_name')
     
-    # Verificar se o dia da semana está ativo na configuração
-    db = get_db()
-    cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
-    query = "SELECT ativo FROM dias_semana_config WHERE dia_id = %s;" if db_url else "SELECT ativo FROM dias_semana_config WHERE dia_id = ?;"
-    cursor.execute(query, (hoje,))
-    result = cursor.fetchone()
-    cursor.close()
-    db.close()
-    
-    # Se não encontrou na configuração ou está inativo, usar lógica antiga
-    dia_ativo = result and result[0] if result else (hoje in DIAS_PEDIDO)
+    # Verificar se o dia da semana está ativo (configuração em memória, com fallback para DIAS_PEDIDO)
+    dias = get_dias_semana()
+    dia_ativo = dias.ativo(hoje)
     
     # Se o dia não está ativo, mostrar tela inativa baseada no tipo de usuário
     if not dia_ativo:
@@ -218,50 +188,67 @@ def index():
     
     # Se é usuário normal e o dia está ativo, mostrar contagem
     if dia_ativo:
-        nome_dia = DIAS_PEDIDO[hoje]
+        nome_dia = dias.nome(hoje)
         produtos_do_dia = get_products_for_day(hoje)
         db = get_db()
         cursor = db.cursor()
         hoje_str = datetime.now().strftime('%Y-%m-%d')
-        db_url = os.environ.get('DATABASE_URL')
-        query = "SELECT produto, tipo, quantidade FROM pedidos WHERE data_pedido = %s AND loja = %s" if db_url else "SELECT produto, tipo, quantidade FROM pedidos WHERE data_pedido = ? AND loja = ?"
-        cursor.execute(query, (hoje_str, loja_logada))
-        dados_salvos_raw = cursor.fetchall()
-        db.close()
-        dados_salvos = {}
-        if db_url:
-            for row in dados_salvos_raw:
-                produto, tipo, quantidade = row[0], row[1], row[2]
-                if tipo == 'Caixa': dados_salvos[f"caixas_{produto}"] = quantidade
-                else: dados_salvos[f"fracionado_{produto}"] = quantidade
-        else:
-            for row in dados_salvos_raw:
-                if row['tipo'] == 'Caixa': dados_salvos[f"caixas_{row['produto']}"] = row['quantidade']
-                else: dados_salvos[f"fracionado_{row['produto']}"] = row['quantidade']
-        return render_template('index.html', dia=nome_dia, produtos=produtos_do_dia, loja_logada=loja_logada, dados_salvos=dados_salvos)
+        queries.executar(cursor, 'pedidos_da_loja', (hoje_str, loja_logada))
+        dados_salvos = campos_da_contagem(cursor.fetchall())
+        queries.executar(cursor, 'revisao_contagem', (hoje_str, loja_logada))
+        linha = cursor.fetchone()
+        revisao = linha[0] if linha else 0
+        cursor.close()
+        return render_template('index.html', dia=nome_dia, produtos=produtos_do_dia, loja_logada=loja_logada,
+                               dados_salvos=dados_salvos, revisao=revisao)
     else:
         return render_template('inativo.html')
 
+def campos_da_contagem(linhas):
+    """{nome do campo do formulário: quantidade} a partir das linhas (produto, tipo, quantidade) de pedidos."""
+    campos = {}
+    for produto, tipo, quantidade in linhas:
+        if tipo == 'Caixa': campos[f"caixas_{produto}"] = quantidade
+        else: campos[f"fracionado_{produto}"] = quantidade
+    return campos
+
+def gravar_contagem(cursor, data_pedido_str, loja, salvos, alteracoes, produtos_do_dia):
+    """Aplica `alteracoes` ({(produto, tipo): quantidade}, 0 apaga) sobre `salvos`, o que a loja já tem no dia.
+
+    Grava só as linhas que mudaram e atualiza, na mesma transação, os agregados,
+    a versão do relatório e o aviso ao vivo. Retorna os produtos afetados.
+    """
+    contagem = dict(salvos)
+    gravar, apagar = [], []
+    for (produto, tipo), quantidade in alteracoes.items():
+        if quantidade > 0:
+            if salvos.get((produto, tipo)) != quantidade:
+                gravar.append((data_pedido_str, loja, produto, tipo, quantidade))
+            contagem[(produto, tipo)] = quantidade
+        elif (produto, tipo) in salvos:
+            apagar.append((data_pedido_str, loja, produto, tipo))
+            del contagem[(produto, tipo)]
+    if apagar: queries.executar_varios(cursor, 'apagar_pedido', apagar)
+    queries.inserir_em_lote(cursor, 'gravar_pedido', gravar)
+    afetados = {linha[2] for linha in gravar} | {linha[2] for linha in apagar}
+    if afetados:
+        custos_map = {p['nome']: p['cost'] for p in produtos_do_dia}
+        unidades = {p['nome']: p['unidade_fracionada'] for p in produtos_do_dia}
+        agregados.atualizar_contagens_loja(cursor, data_pedido_str, loja, contagem, afetados, custos_map)
+        cache.alterou_relatorio(cursor, data_pedido_str)
+        eventos_relatorio.notificar(cursor, eventos_relatorio.evento_contagem(data_pedido_str, loja, contagem, afetados, unidades))
+    return afetados
+
 @app.route('/enviar', methods=['POST'])
 @login_required
 def enviar_pedido():
     loja = session.get('store_name')
     if not loja: return "Erro: Usuario nao associado a uma loja.", 400
     data_pedido_str = datetime.now().strftime('%Y-%m-%d')
-    db = get_db()
-    cursor = db.cursor()
     hoje_weekday = datetime.now().weekday()
     produtos_do_dia = get_products_for_day(hoje_weekday)
     produtos_map = {p['nome']: p['unidade_fracionada'] for p in produtos_do_dia}
-    db_url = os.environ.get('DATABASE_URL')
-    if db_url:
-        delete_query = "DELETE FROM pedidos WHERE data_pedido = %s AND loja = %s"
-        insert_query = "INSERT INTO pedidos (data_pedido, loja, produto, tipo, quantidade) VALUES (%s, %s, %s, %s, %s)"
-        cursor.execute(delete_query, (data_pedido_str, loja))
-    else:
-        delete_query = "DELETE FROM pedidos WHERE data_pedido = ? AND loja = ?"
-        insert_query = "INSERT INTO pedidos (data_pedido, loja, produto, tipo, quantidade) VALUES (?, ?, ?, ?, ?)"
-        cursor.execute(delete_query, (data_pedido_str, loja))
+    contagem = {}
     for key, quantidade_str in request.form.items():
         if quantidade_str and int(quantidade_str) > 0:
             quantidade = int(quantidade_str)
@@ -273,11 +260,83 @@ def enviar_pedido():
             elif key.startswith('fracionado_'):
                 nome_produto = key.replace('fracionado_', '')
                 if nome_produto in produtos_map: tipo = produtos_map[nome_produto]
-            if tipo and nome_produto: cursor.execute(insert_query, (data_pedido_str, loja, nome_produto, tipo, quantidade))
+            if tipo and nome_produto: contagem[(nome_produto, tipo)] = quantidade
+    db = get_db()
+    cursor = db.cursor()
+    # Trava a linha da revisão da loja antes de ler os pedidos, na mesma ordem do
+    # /api/contagem: gravações simultâneas da mesma loja esperam uma pela outra, sem deadlock.
+    queries.executar(cursor, 'iniciar_revisao_contagem', (data_pedido_str, loja))
+    queries.executar(cursor, 'travar_revisao_contagem', (data_pedido_str, loja))
+    # Compara com o que já foi enviado e grava só as linhas que mudaram
+    queries.executar(cursor, 'pedidos_da_loja', (data_pedido_str, loja))
+    salvos = {(produto, tipo): quantidade for produto, tipo, quantidade in cursor.fetchall()}
+    alteracoes = dict(contagem)
+    alteracoes.update({chave: 0 for chave in salvos if chave not in contagem})
+    if gravar_contagem(cursor, data_pedido_str, loja, salvos, alteracoes, produtos_do_dia):
+        # Um salvamento automático aberto em outra aba com a revisão anterior passa a ser recusado.
+        queries.executar(cursor, 'incrementar_revisao_contagem', (data_pedido_str, loja))
     db.commit()
+    eventos_relatorio.confirmar()
     cursor.close()
-    db.close()
     return redirect(url_for('sucesso'))
+
+@app.route('/api/contagem', methods=['POST'])
+@login_required
+def salvar_contagem_automatica():
+    """Salvamento automático do formulário de contagem: só os campos alterados.
+
+    Corpo: {"revisao": n, "alteracoes": [{"produto", "tipo": "caixas"|"fracionado", "quantidade"}]}.
+    `revisao` é a revisão da contagem que o navegador tem; se outra gravação
+    (outra aba, /enviar) já a avançou, responde 409 com a revisão e a contagem
+    atuais para o navegador se atualizar e reenviar o que falta.
+    """
+    loja = session.get('store_name')
+    if not loja:
+        return jsonify({"status": "error", "message": "Usuário não associado a uma loja."}), 400
+    dados = request.get_json(silent=True) or {}
+    revisao = dados.get('revisao')
+    itens = dados.get('alteracoes')
+    if not isinstance(revisao, int) or isinstance(revisao, bool) or not isinstance(itens, list):
+        return jsonify({"status": "error", "message": "Informe 'revisao' e a lista 'alteracoes'."}), 400
+
+    data_pedido_str = datetime.now().strftime('%Y-%m-%d')
+    produtos_do_dia = get_products_for_day(datetime.now().weekday())
+    produtos_map = {p['nome']: p['unidade_fracionada'] for p in produtos_do_dia}
+    alteracoes = {}
+    for item in itens:
+        produto = item.get('produto') if isinstance(item, dict) else None
+        quantidade = item.get('quantidade') if isinstance(item, dict) else None
+        tipo = item.get('tipo') if isinstance(item, dict) else None
+        if produto not in produtos_map or tipo not in ('caixas', 'fracionado') \
+                or not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade < 0:
+            return jsonify({"status": "error", "message": f"Alteração inválida: {item}"}), 400
+        if tipo == 'fracionado' and not produtos_map[produto]:
+            return jsonify({"status": "error", "message": f"Produto sem unidade fracionada: {produto}"}), 400
+        alteracoes[(produto, 'Caixa' if tipo == 'caixas' else produtos_map[produto])] = quantidade
+
+    db = get_db()
+    cursor = db.cursor()
+    queries.executar(cursor, 'iniciar_revisao_contagem', (data_pedido_str, loja))
+    # A revisão avança (e trava a linha) antes de ler os pedidos: duas gravações
+    # da mesma revisão não passam as duas.
+    if queries.executar(cursor, 'avancar_revisao_contagem', (data_pedido_str, loja, revisao)).rowcount != 1:
+        db.rollback()
+        queries.executar(cursor, 'revisao_contagem', (data_pedido_str, loja))
+        linha = cursor.fetchone()
+        atual = linha[0] if linha else 0
+        queries.executar(cursor, 'pedidos_da_loja', (data_pedido_str, loja))
+        contagem = campos_da_contagem(cursor.fetchall())
+        cursor.close()
+        return jsonify({"status": "conflito", "message": "A contagem foi alterada em outra tela.",
+                        "revisao": atual, "contagem": contagem}), 409
+
+    queries.executar(cursor, 'pedidos_da_loja', (data_pedido_str, loja))
+    salvos = {(produto, tipo): quantidade for produto, tipo, quantidade in cursor.fetchall()}
+    afetados = gravar_contagem(cursor, data_pedido_str, loja, salvos, alteracoes, produtos_do_dia)
+    db.commit()
+    eventos_relatorio.confirmar()
+    cursor.close()
+    return jsonify({"status": "ok", "revisao": revisao + 1, "gravados": len(afetados)})
     
 @app.route('/sucesso')
 @login_required
@@ -288,7 +347,7 @@ def sucesso():
 @admin_required
 def relatorio():
     data_selecionada = request.args.get('data', date.today().strftime('%Y-%m-%d'))
-    report_data, nome_dia, data_obj = obter_dados_relatorio(data_selecionada)
+    report_data, totais, nome_dia, data_obj = obter_dados_relatorio(data_selecionada)
     
     # Se o dia está inativo na configuração
     if report_data == "INATIVO":
@@ -305,9 +364,57 @@ def relatorio():
     # Se há dados, mostrar relatório normal
     return render_template('relatorio.html', 
                            report_data=report_data, 
+                           totais=totais,
                            lojas=LOJAS,
                            data_hoje=data_obj.strftime('%d/%m/%Y'),
-                           data_selecionada=data_selecionada)
+                           data_selecionada=data_selecionada,
+                           relatorio_ao_vivo=eventos_relatorio.disponivel())
+
+@app.route('/api/relatorio')
+@admin_required
+def api_relatorio():
+    # Mesmos dados do /relatorio em JSON, com ETag: se nada mudou para a data, responde 304 sem remontar.
+    data_selecionada = request.args.get('data', date.today().strftime('%Y-%m-%d'))
+    try:
+        data_obj = datetime.strptime(data_selecionada, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"status": "error", "message": "Data inválida."}), 400
+    data_selecionada = data_obj.isoformat()
+
+    cursor = get_db().cursor()
+    etag = cache.etag_relatorio(cursor, data_selecionada, date.today().isoformat())
+    cursor.close()
+    if request.if_none_match.contains(etag):
+        resposta = app.response_class(status=304)
+    else:
+        report_data, totais, nome_dia, _ = obter_dados_relatorio(data_selecionada)
+        resposta = jsonify({
+            "data": data_selecionada,
+            "data_formatada": data_obj.strftime('%d/%m/%Y'),
+            "status": "inativo" if report_data == "INATIVO" else "ok",
+            "nome_dia": nome_dia,
+            "lojas": LOJAS,
+            "report_data": report_data if report_data != "INATIVO" else [],
+            "totais": totais,
+        })
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+@app.route('/relatorio/stream')
+@admin_required
+def relatorio_stream():
+    # Server-sent events com as células alteradas pelas lojas no relatório da data (ver eventos_relatorio.py).
+    data_selecionada = request.args.get('data', date.today().strftime('%Y-%m-%d'))
+    try:
+        data_selecionada = datetime.strptime(data_selecionada, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return "Data inválida.", 400
+    if not eventos_relatorio.disponivel():
+        # Fora do gevent a página nem abre o stream; um EventSource que chegue aqui desiste com o 404.
+        return "Relatório ao vivo disponível só com SERVING_MODE=gevent.", 404
+    return Response(eventos_relatorio.stream(data_selecionada), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/salvar-pedido', methods=['POST'])
 @admin_required
@@ -317,16 +424,25 @@ def salvar_pedido():
     if not pedido_data_str:
         return {"status": "error", "message": "Nenhum dado recebido."}, 400
     pedidos = json.loads(pedido_data_str)
+    try:
+        dia_da_semana = datetime.strptime(data_do_pedido, '%Y-%m-%d').weekday()
+    except ValueError:
+        return {"status": "error", "message": "Data inválida."}, 400
+    custos_map = {p['nome']: p['custo'] for p in custos_da_data(get_products_for_day(dia_da_semana), data_do_pedido, dia_da_semana)}
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
     try:
-        delete_query = "DELETE FROM pedidos_finais WHERE data_pedido = %s" if db_url else "DELETE FROM pedidos_finais WHERE data_pedido = ?"
-        cursor.execute(delete_query, (data_do_pedido,))
-        if pedidos:
-            insert_query = "INSERT INTO pedidos_finais (data_pedido, produto_nome, loja_nome, quantidade_pedida) VALUES (%s, %s, %s, %s)" if db_url else "INSERT INTO pedidos_finais (data_pedido, produto_nome, loja_nome, quantidade_pedida) VALUES (?, ?, ?, ?)"
-            dados_para_inserir = [(data_do_pedido, p['produto'], p['loja'], int(p['pedido'])) for p in pedidos]
-            cursor.executemany(insert_query, dados_para_inserir)
+        queries.executar(cursor, 'apagar_pedidos_finais', (data_do_pedido,))
+        dados_para_inserir = [(data_do_pedido, p['produto'], p['loja'], int(p['pedido'])) for p in pedidos]
+        if dados_para_inserir:
+            queries.executar_varios(cursor, 'inserir_pedido_final', dados_para_inserir)
+        agregados.atualizar_pedidos_finais(cursor, data_do_pedido, [linha[1:] for linha in dados_para_inserir], custos_map)
+        cache.alterou_relatorio(cursor, data_do_pedido)
+        previsao.descartar_seguintes(cursor, data_do_pedido)
+        # O próximo dia de pedido já volta a ter sugestões com este pedido no histórico (worker).
+        proximo = previsao.proximo_dia_ativo(cursor, max(date.fromisoformat(data_do_pedido) + timedelta(days=1), date.today()))
+        if proximo is not None:
+            jobs.enfileirar(cursor, 'sugestoes', {"data": proximo.isoformat(), "lojas": LOJAS}, chave=f"sugestoes:{proximo.isoformat()}")
         db.commit()
         message = {"status": "success", "message": "Pedido salvo com sucesso!"}
     except Exception as e:
@@ -334,26 +450,64 @@ def salvar_pedido():
         message = {"status": "error", "message": f"Erro ao salvar: {e}"}
     finally:
         cursor.close()
-        db.close()
     return message
 
+@app.route('/api/relatorio-periodo')
+@admin_required
+def relatorio_periodo():
+    # Totais consolidados de um período, lidos de agregados_diarios.
+    # ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD&agrupar=dia|semana|mes|total
+    agrupar = request.args.get('agrupar', 'total')
+    try:
+        inicio = datetime.strptime(request.args.get('inicio', ''), '%Y-%m-%d').date()
+        fim = datetime.strptime(request.args.get('fim', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"status": "error", "message": "Informe inicio e fim no formato AAAA-MM-DD."}), 400
+    if agrupar not in agregados.AGRUPAMENTOS:
+        return jsonify({"status": "error", "message": f"agrupar deve ser um de: {', '.join(agregados.AGRUPAMENTOS)}."}), 400
+    if fim < inicio or (fim - inicio).days + 1 > agregados.PERIODO_MAXIMO_DIAS:
+        return jsonify({"status": "error", "message": f"Período inválido (máximo de {agregados.PERIODO_MAXIMO_DIAS} dias)."}), 400
+
+    cursor = get_db().cursor()
+    linhas = agregados.consultar_periodo(cursor, inicio.isoformat(), fim.isoformat(), agrupar)
+    cursor.close()
+    return jsonify({"inicio": inicio.isoformat(), "fim": fim.isoformat(), "agrupar": agrupar, "lojas": LOJAS, "linhas": linhas})
+
+@app.route('/api/historico-custo/<int:product_id>')
+@admin_required
+def historico_custo(product_id):
+    # Linha do tempo do custo do produto: [{de, ate, custo}], ate = null no custo atual.
+    cursor = get_db().cursor()
+    queries.executar(cursor, 'historico_custo_produto', (product_id,))
+    vigencias = [{"de": de, "ate": ate, "custo": float(custo) if custo is not None else None} for de, ate, custo in cursor.fetchall()]
+    cursor.close()
+    return jsonify({"product_id": product_id, "vigencias": vigencias})
+
 # --- ROTAS DO PAINEL DE ADMIN ---
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
-    return render_template('admin/dashboard.html')
+    # Valor do pedido final por loja numa data, lido de agregados_diarios (já calculado ao salvar o pedido).
+    data_selecionada = request.args.get('data', date.today().strftime('%Y-%m-%d'))
+    try:
+        datetime.strptime(data_selecionada, '%Y-%m-%d')
+    except ValueError:
+        data_selecionada = date.today().strftime('%Y-%m-%d')
+    cursor = get_db().cursor()
+    valores_lojas, valor_total = agregados.valor_por_loja(cursor, data_selecionada, LOJAS)
+    cursor.close()
+    for linha in valores_lojas:
+        linha['valor_fmt'] = relatorio_engine.formatar_reais(linha['valor'])
+    return render_template('admin/dashboard.html', data_selecionada=data_selecionada, valores_lojas=valores_lojas,
+                           valor_total=relatorio_engine.formatar_reais(valor_total))
 
 @app.route('/admin/products')
 @admin_required
 def admin_products():
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
-    query = "SELECT p.id, p.name, p.unidade_fracionada, p.codigo_interno, STRING_AGG(CAST(pa.day_id AS TEXT), ',') as days_str FROM products p LEFT JOIN product_availability pa ON p.id = pa.product_id GROUP BY p.id, p.name, p.unidade_fracionada, p.codigo_interno ORDER BY p.name;" if db_url else "SELECT p.id, p.name, p.unidade_fracionada, p.codigo_interno, GROUP_CONCAT(pa.day_id) as days_str FROM products p LEFT JOIN product_availability pa ON p.id = pa.product_id GROUP BY p.id, p.name, p.unidade_fracionada, p.codigo_interno ORDER BY p.name;"
-    cursor.execute(query)
-    products_data = cursor.fetchall()
-    products_list = [dict(zip([desc[0] for desc in cursor.description], row)) for row in products_data]
-    db.close()
+    queries.executar(cursor, 'listar_produtos_admin')
+    products_list = queries.como_dicts(cursor)
     id_to_day_name = {v: k for k, v in DIAS_PEDIDO.items()}
     for product in products_list:
         if product['days_str']:
@@ -372,17 +526,10 @@ def admin_add_product():
         days = request.form.getlist('days')
         db = get_db()
         cursor = db.cursor()
-        db_url = os.environ.get('DATABASE_URL')
         try:
-            if db_url:
-                cursor.execute("INSERT INTO products (name, unidade_fracionada, codigo_interno) VALUES (%s, %s, %s) RETURNING id;", (name, unidade, codigo_interno))
-                product_id = cursor.fetchone()[0]
-            else:
-                cursor.execute("INSERT INTO products (name, unidade_fracionada, codigo_interno) VALUES (?, ?, ?);", (name, unidade, codigo_interno))
-                product_id = cursor.lastrowid
-            for day_id in days:
-                if db_url: cursor.execute("INSERT INTO product_availability (product_id, day_id) VALUES (%s, %s);", (product_id, int(day_id)))
-                else: cursor.execute("INSERT INTO product_availability (product_id, day_id) VALUES (?, ?);", (product_id, int(day_id)))
+            product_id = queries.inserir(cursor, 'inserir_produto', (name, unidade, codigo_interno))
+            queries.executar_varios(cursor, 'inserir_disponibilidade', [(product_id, int(day_id)) for day_id in days])
+            cache.invalidar(cursor, cache.CATALOGO)
             db.commit()
             flash('Produto adicionado com sucesso!', 'success')
         except Exception as e:
@@ -391,7 +538,6 @@ def admin_add_product():
             else: flash(f'Erro ao adicionar produto: {e}', 'danger')
         finally:
             cursor.close()
-            db.close()
         return redirect(url_for('admin_products'))
     dias_semana_ordenado = {k: v for k, v in sorted(DIAS_PEDIDO.items())}
     return render_template('admin/product_form.html', dias_pedido=dias_semana_ordenado, product=None)
@@ -401,18 +547,16 @@ def admin_add_product():
 def admin_edit_product(product_id):
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
     if request.method == 'POST':
         name = request.form['name']
         unidade = request.form['unidade_fracionada']
         codigo_interno = request.form.get('codigo_interno')
         days = request.form.getlist('days')
         try:
-            cursor.execute("UPDATE products SET name = %s, unidade_fracionada = %s, codigo_interno = %s WHERE id = %s;" if db_url else "UPDATE products SET name = ?, unidade_fracionada = ?, codigo_interno = ? WHERE id = ?;", (name, unidade, codigo_interno, product_id))
-            cursor.execute("DELETE FROM product_availability WHERE product_id = %s;" if db_url else "DELETE FROM product_availability WHERE product_id = ?;", (product_id,))
-            for day_id in days:
-                if db_url: cursor.execute("INSERT INTO product_availability (product_id, day_id) VALUES (%s, %s);", (product_id, int(day_id)))
-                else: cursor.execute("INSERT INTO product_availability (product_id, day_id) VALUES (?, ?);", (product_id, int(day_id)))
+            queries.executar(cursor, 'atualizar_produto', (name, unidade, codigo_interno, product_id))
+            queries.executar(cursor, 'apagar_disponibilidade', (product_id,))
+            queries.executar_varios(cursor, 'inserir_disponibilidade', [(product_id, int(day_id)) for day_id in days])
+            cache.invalidar(cursor, cache.CATALOGO)
             db.commit()
             flash('Produto atualizado com sucesso!', 'success')
         except Exception as e:
@@ -420,16 +564,13 @@ def admin_edit_product(product_id):
             flash(f'Erro ao atualizar produto: {e}', 'danger')
         finally:
             cursor.close()
-            db.close()
         return redirect(url_for('admin_products'))
-    cursor.execute("SELECT * FROM products WHERE id = %s;" if db_url else "SELECT * FROM products WHERE id = ?;", (product_id,))
-    product_data = cursor.fetchone()
-    product = dict(zip([desc[0] for desc in cursor.description], product_data))
-    cursor.execute("SELECT day_id FROM product_availability WHERE product_id = %s;" if db_url else "SELECT day_id FROM product_availability WHERE product_id = ?;", (product_id,))
+    queries.executar(cursor, 'buscar_produto', (product_id,))
+    product = queries.como_dicts(cursor, [cursor.fetchone()])[0]
+    queries.executar(cursor, 'dias_do_produto', (product_id,))
     availability_data = cursor.fetchall()
     product['days_ids'] = [row[0] for row in availability_data]
     cursor.close()
-    db.close()
     dias_semana_ordenado = {k: v for k, v in sorted(DIAS_PEDIDO.items())}
     return render_template('admin/product_form.html', dias_pedido=dias_semana_ordenado, product=product)
 
@@ -438,10 +579,11 @@ def admin_edit_product(product_id):
 def admin_delete_product(product_id):
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
     try:
-        cursor.execute("DELETE FROM product_availability WHERE product_id = %s;" if db_url else "DELETE FROM product_availability WHERE product_id = ?;", (product_id,))
-        cursor.execute("DELETE FROM products WHERE id = %s;" if db_url else "DELETE FROM products WHERE id = ?;", (product_id,))
+        queries.executar(cursor, 'apagar_disponibilidade', (product_id,))
+        queries.executar(cursor, 'apagar_historico_custos', (product_id,))
+        queries.executar(cursor, 'apagar_produto', (product_id,))
+        cache.invalidar(cursor, cache.CATALOGO)
         db.commit()
         flash('Produto apagado com sucesso!', 'success')
     except Exception as e:
@@ -449,7 +591,6 @@ def admin_delete_product(product_id):
         flash(f'Erro ao apagar produto: {e}', 'danger')
     finally:
         cursor.close()
-        db.close()
     return redirect(url_for('admin_products'))
 
 # --- ROTAS PARA GERENCIAR DIAS DE CONTAGEM ---
@@ -458,16 +599,12 @@ def admin_delete_product(product_id):
 def admin_dias_contagem():
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
     
     # Buscar configuração dos dias da semana
-    query = "SELECT dia_id, nome_dia, ativo FROM dias_semana_config ORDER BY dia_id;"
-    cursor.execute(query)
-    dias_data = cursor.fetchall()
-    dias_list = [dict(zip([desc[0] for desc in cursor.description], row)) for row in dias_data]
+    queries.executar(cursor, 'listar_dias_semana')
+    dias_list = queries.como_dicts(cursor)
     
     cursor.close()
-    db.close()
     return render_template('admin/dias_contagem.html', dias=dias_list)
 
 # Removidas rotas desnecessárias - apenas ativar/desativar dias da semana
@@ -478,16 +615,12 @@ def admin_lojas():
     """Lista todas as lojas e seus usuários"""
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
     
     # Buscar todos os usuários de loja
-    query = "SELECT username, store_name, role FROM users WHERE role = 'loja' ORDER BY store_name;"
-    cursor.execute(query)
-    users_data = cursor.fetchall()
-    users_list = [dict(zip([desc[0] for desc in cursor.description], row)) for row in users_data]
+    queries.executar(cursor, 'listar_usuarios_loja')
+    users_list = queries.como_dicts(cursor)
     
     cursor.close()
-    db.close()
     
     # Criar dicionário de lojas com seus usuários
     lojas_dict = {}
@@ -504,16 +637,16 @@ def admin_lojas():
 def admin_toggle_dia_contagem(dia_id):
     db = get_db()
     cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
     
     try:
         # Buscar o status atual
-        cursor.execute("SELECT ativo, nome_dia FROM dias_semana_config WHERE dia_id = %s;" if db_url else "SELECT ativo, nome_dia FROM dias_semana_config WHERE dia_id = ?;", (dia_id,))
+        queries.executar(cursor, 'buscar_dia_semana', (dia_id,))
         result = cursor.fetchone()
         if result:
             ativo_atual, nome_dia = result[0], result[1]
             novo_status = not ativo_atual
-            cursor.execute("UPDATE dias_semana_config SET ativo = %s WHERE dia_id = %s;" if db_url else "UPDATE dias_semana_config SET ativo = ? WHERE dia_id = ?;", (novo_status, dia_id))
+            queries.executar(cursor, 'atualizar_dia_semana', (novo_status, dia_id))
+            cache.invalidar(cursor, cache.DIAS_SEMANA)
             db.commit()
             status_text = "ativado" if novo_status else "desativado"
             flash(f'{nome_dia} {status_text} com sucesso!', 'success')
@@ -524,79 +657,156 @@ def admin_toggle_dia_contagem(dia_id):
         flash(f'Erro ao alterar status: {e}', 'danger')
     finally:
         cursor.close()
-        db.close()
     return redirect(url_for('admin_dias_contagem'))
 
-@app.route('/exportar-pedido-pdf', methods=['POST'])
+@app.route('/exportar-pedido-pdf', methods=['GET', 'POST'])
 @admin_required
 def exportar_pedido_pdf():
+    # POST com pedido_data: o que está na tela do relatório (inclusive não salvo).
+    # GET ?data=AAAA-MM-DD, ou POST sem pedido_data: o pedido final salvo em pedidos_finais.
     pedido_data_str = request.form.get('pedido_data')
-    data_do_pedido = request.form.get('data_pedido_pdf', date.today().strftime('%Y-%m-%d'))
-    if not pedido_data_str:
-        return "Nenhum dado de pedido recebido.", 400
-    pedidos = json.loads(pedido_data_str)
-    df = pd.DataFrame(pedidos)
-    tabela_pedido = pd.pivot_table(df, values='pedido', index='produto', columns='loja', aggfunc='sum').fillna(0).astype(int)
-    tabela_pedido = tabela_pedido.reindex(columns=LOJAS).fillna(0).astype(int)
-    pdf = PDF(orientation='P', unit='mm', format='A4', data_pedido=datetime.strptime(data_do_pedido, "%Y-%m-%d").strftime("%d/%m/%Y"))
-    pdf.add_page()
-    pdf.set_font('Arial', size=9)
-    col_widths = [75] + [18] * len(tabela_pedido.columns)
-    line_height = pdf.font_size * 2
-    pdf.set_font('Arial', 'B', 9)
-    headers = ['Produto'] + list(tabela_pedido.columns)
-    for i, header in enumerate(headers):
-        pdf.cell(col_widths[i], line_height, header, border=1, align='C')
-    pdf.ln(line_height)
-    pdf.set_font('Arial', '', 9)
-    for produto, row in tabela_pedido.iterrows():
+    data_do_pedido = request.values.get('data_pedido_pdf') or request.args.get('data') or date.today().strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(data_do_pedido, '%Y-%m-%d')
+    except ValueError:
+        return "Data inválida.", 400
+
+    if pedido_data_str:
         try:
-            produto_encoded = produto.encode('latin-1', 'replace').decode('latin-1')
-        except:
-            produto_encoded = 'Produto Invalido'
-        pdf.cell(col_widths[0], line_height, produto_encoded, border=1)
-        for i, value in enumerate(row):
-            display_value = str(value) if value > 0 else ''
-            pdf.cell(col_widths[i+1], line_height, display_value, border=1, align='C')
-        pdf.ln(line_height)
-    nome_arquivo = f'pedido_hortifruti_{datetime.strptime(data_do_pedido, "%Y-%m-%d").strftime("%d-%m-%Y")}.pdf'
-    pdf_output = pdf.output()
-    final_pdf_bytes = bytes(pdf_output)
-    response = make_response(final_pdf_bytes)
-    response.headers.set('Content-Type', 'application/pdf')
-    response.headers.set('Content-Disposition', 'attachment', filename=nome_arquivo)
-    return response
+            pedidos = pdf_pedido.de_json(pedido_data_str)
+        except (ValueError, KeyError, TypeError):
+            return "Dados de pedido inválidos.", 400
+    else:
+        cursor = get_db().cursor()
+        queries.executar(cursor, 'pedidos_finais_do_dia', (data_do_pedido,))
+        pedidos = cursor.fetchall()
+        cursor.close()
+
+    tabela = pdf_pedido.montar_tabela(pedidos, LOJAS)
+    if not tabela:
+        return "Nenhum dado de pedido recebido.", 400
+    dia_da_semana = datetime.strptime(data_do_pedido, '%Y-%m-%d').weekday()
+    custos_map = {p['nome']: p['custo'] for p in custos_da_data(get_products_for_day(dia_da_semana), data_do_pedido, dia_da_semana)}
+    arquivo = pdf_pedido.abrir_pdf(data_do_pedido, LOJAS, tabela, custos_map)
+    return send_file(arquivo, mimetype='application/pdf', as_attachment=True,
+                     download_name=pdf_pedido.nome_arquivo(data_do_pedido))
 
 @app.route('/api/update-costs', methods=['POST'])
 @api_key_required
 def update_costs():
-    data = request.json
-    if not data or 'costs' not in data:
-        return jsonify({"message": "Dados inválidos."}), 400
-    costs_list = data['costs']
+    # Envio em partes (envio_custos.py): X-Sync-Run + X-Sync-Chunk identificam a parte.
+    # Uma parte já aplicada não é aplicada de novo; a resposta original é devolvida.
+    run_id = request.headers.get('X-Sync-Run')
+    chunk = request.headers.get('X-Sync-Chunk', type=int)
+    parte = (run_id, chunk) if run_id and chunk is not None else None
     db = get_db()
-    cursor = db.cursor()
-    db_url = os.environ.get('DATABASE_URL')
-    updates = 0
+    if parte:
+        cursor = db.cursor()
+        anterior = custos.resultado_da_parte(cursor, *parte)
+        cursor.close()
+        if anterior is not None:
+            anterior["repetido"] = True
+            return jsonify(anterior), 200
+
+    itens = custos.ler_itens(request.stream, request.content_type, request.headers.get('Content-Encoding'))
     try:
-        for item in costs_list:
-            codigo = item.get('codigo_interno')
-            custo = item.get('custo')
-            if codigo and custo is not None:
-                if db_url:
-                    cursor.execute("UPDATE products SET cost = %s WHERE codigo_interno = %s;", (custo, codigo))
-                else: # SQLite
-                    cursor.execute("UPDATE products SET cost = ? WHERE codigo_interno = ?;", (custo, codigo))
-                updates += cursor.rowcount
+        resultado = custos.aplicar_custos(db, itens)
+        resultado["message"] = f"{len(resultado['atualizados'])} produtos tiveram seus custos atualizados com sucesso."
+        cursor = db.cursor()
+        if resultado['atualizados']:
+            cache.invalidar(cursor, cache.CATALOGO)
+        if parte:
+            custos.registrar_parte(cursor, *parte, resultado)
+        cursor.close()
         db.commit()
-    except Exception as e:
+    except custos.PayloadInvalido as e:
+        db.rollback()
+        return jsonify({"message": str(e)}), 400
+    except Exception:
         db.rollback()
-        print(f"Erro ao atualizar custos: {e}")
+        app.logger.exception("Erro ao atualizar custos%s.", f" (envio {run_id}, parte {chunk})" if parte else "")
         return jsonify({"message": "Ocorreu um erro durante a atualização."}), 500
-    finally:
-        cursor.close()
-        db.close()
-    return jsonify({"message": f"{updates} produtos tiveram seus custos atualizados com sucesso."}), 200
+    return jsonify(resultado), 200
+
+# --- TAREFAS EM SEGUNDO PLANO (jobs.py / worker.py) ---
+
+def resposta_job(job_id):
+    """202 Accepted com o id do job e onde acompanhar o andamento."""
+    url = url_for('api_job', job_id=job_id)
+    resposta = jsonify({"status": "enfileirado", "job": job_id, "url": url})
+    resposta.status_code = 202
+    resposta.headers['Location'] = url
+    return resposta
+
+@app.route('/api/jobs', methods=['POST'])
+@admin_required
+def api_enfileirar_job():
+    # {"tipo": "pdf_pedido" | "sugestoes" | "reconstruir_agregados", "payload": {...}}
+    # O mesmo pedido repetido enquanto o job está ativo devolve o mesmo job.
+    dados = request.get_json(silent=True) or {}
+    tipo, payload = dados.get('tipo'), dados.get('payload')
+    tarefa = jobs.TAREFAS.get(tipo)
+    if tarefa is None or not tarefa.admin or not isinstance(payload, dict):
+        return jsonify({"status": "error", "message": "Informe um tipo de tarefa válido e o payload."}), 400
+    payload['lojas'] = LOJAS
+    chave = f"{tipo}:{hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:32]}"
+    db = get_db()
+    cursor = db.cursor()
+    job_id = jobs.enfileirar(cursor, tipo, payload, chave=chave)
+    cursor.close()
+    db.commit()
+    return resposta_job(job_id)
+
+@app.route('/api/jobs/<int:job_id>')
+@admin_ou_api_key_required
+def api_job(job_id):
+    cursor = get_db().cursor()
+    job = jobs.situacao(cursor, job_id)
+    cursor.close()
+    if job is None:
+        return jsonify({"status": "error", "message": "Job não encontrado."}), 404
+    if job["arquivo"]:
+        job["download"] = url_for('api_job_arquivo', job_id=job_id)
+    return jsonify(job)
+
+@app.route('/api/jobs/<int:job_id>/arquivo')
+@admin_ou_api_key_required
+def api_job_arquivo(job_id):
+    cursor = get_db().cursor()
+    gerado = jobs.arquivo(cursor, job_id)
+    cursor.close()
+    if gerado is None:
+        return jsonify({"status": "error", "message": "Arquivo não disponível."}), 404
+    conteudo, resultado = gerado
+    return send_file(io.BytesIO(conteudo), mimetype=resultado.get('mimetype', 'application/octet-stream'),
+                     as_attachment=True, download_name=resultado.get('nome', f'job_{job_id}'))
+
+@app.route('/api/catalog-fingerprint')
+@api_key_required
+def catalog_fingerprint():
+    # Consulta barata para o sincronizar_custos.py decidir se precisa enviar algo.
+    # Com ?custos=1 devolve também {codigo_interno: custo} dos produtos com código.
+    cursor = get_db().cursor()
+    custos_atuais, assinatura = cache.custos_catalogo.obter(cursor)
+    cursor.close()
+    resposta = {"assinatura": assinatura, "total": len(custos_atuais)}
+    if request.args.get('custos') == '1':
+        resposta["custos"] = {codigo: float(custo) if custo is not None else None for codigo, custo in custos_atuais.items()}
+    return jsonify(resposta), 200
+
+@app.route('/admin/metrics')
+@admin_ou_api_key_required
+def admin_metrics():
+    # Histogramas por rota deste processo (instrumentacao.py); cada worker do gunicorn tem os seus.
+    dados = instrumentacao.registro.snapshot()
+    dados["pid"] = os.getpid()
+    dados["pool"] = database.estatisticas()
+    return jsonify(dados)
+
+@app.route('/health')
+def health():
+    ok, mensagem = database.health_check()
+    return jsonify({"status": "ok" if ok else "erro", "mensagem": mensagem, "pool": database.estatisticas()}), 200 if ok else 503
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
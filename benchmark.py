@@ -0,0 +1,1082 @@
+# benchmark.py - Benchmarks de desempenho do fluxo de pedidos
+"""
+Roda localmente, sobre um banco SQLite temporário criado pelo init_db.py e
+populado com histórico sintético. Não toca no hortifruti.db do projeto.
+
+Uso:
+    python benchmark.py suite [--meses 12] [--clientes 4] [--repeticoes 30] [--gravar-baseline] [--tolerancia 0.5]
+        Fluxo de pedidos inteiro sobre o catálogo do produtos_config.py e
+        --meses de histórico para todas as lojas: --clientes clientes
+        simultâneos em cada rota (/, /enviar, /relatorio, /api/relatorio,
+        /salvar-pedido, /exportar-pedido-pdf), com p50/p95/p99 e consultas
+        SQL por requisição (do header Server-Timing). Compara com benchmark_baseline.json e termina
+        com erro se alguma rota ficou mais lenta que a tolerância ou passou
+        a fazer mais consultas; --gravar-baseline regrava o arquivo.
+
+    python benchmark.py relatorio [--meses 12] [--repeticoes 30]
+        Latência do /relatorio conforme o histórico de pedidos cresce mês a
+        mês, com e sem os índices usados pelo relatório.
+
+    python benchmark.py periodo [--meses 12] [--repeticoes 30] [--dias 90]
+        Relatório consolidado dos últimos --dias dias: /api/relatorio-periodo
+        (agregados_diarios) contra a mesma soma feita direto em pedidos.
+
+    python benchmark.py etag [--meses 3] [--repeticoes 30]
+        Troca de data no relatório: página /relatorio inteira, /api/relatorio
+        com resposta completa e /api/relatorio revalidado (304 pelo ETag).
+
+    python benchmark.py autosave [--repeticoes 30]
+        Uma loja com todos os produtos do dia contados altera um campo: o
+        formulário inteiro em /enviar contra só o campo em /api/contagem.
+
+    python benchmark.py previsao [--meses 12] [--repeticoes 30]
+        Sugestões de pedido (previsao.py) para o próximo dia de pedido: o
+        cálculo completo (leitura do histórico, ajuste e gravação) e o ajuste
+        vetorizado com NumPy contra o mesmo ajuste feito célula a célula em
+        Python, no catálogo real e numa grade sintética de 2000 produtos.
+
+    python benchmark.py carga [--clientes 4] [--duracao 15] [--workers 2] [--modos sync,gthread,gevent] [--postgres URL]
+        Carga concorrente num gunicorn local (gunicorn.conf.py) em cada
+        SERVING_MODE: --clientes clientes por loja, para cada uma das 6
+        lojas, alternando / e /enviar, mais --clientes admins no /relatorio,
+        durante --duracao segundos. Mostra requisições/s e p50/p99 por rota.
+        Com --postgres usa esse banco (será populado pelo init_db.py) em vez
+        de um SQLite temporário com --meses de histórico.
+
+    python benchmark.py jobs [--repeticoes 30]
+        Fila de tarefas (jobs.py): o PDF do pedido gerado dentro da requisição
+        (/exportar-pedido-pdf) contra só enfileirar o job (/api/jobs, 202), e
+        a vazão do worker executando a fila, com um e com dois workers.
+
+    python benchmark.py senha [--repeticoes 30]
+        Custo do hash das senhas: tempo de uma verificação PBKDF2-SHA256 para
+        vários números de iterações, com o maior que cabe no orçamento do
+        login (LOGIN_BUDGET_MS), e o POST /login com senha em texto, no
+        primeiro login (regrava com hash) e com hash. Rode na instância do
+        Render para escolher PASSWORD_HASH_ITERATIONS.
+
+    python benchmark.py envio [--itens 20000] [--latencia 40] [--falhas 0.1]
+        Envio de custos para /api/update-costs num servidor local (o próprio
+        app sobre SQLite, com latência e erros 503 simulados): um POST único
+        contra o envio em partes do envio_custos.py, em série e em paralelo,
+        e um envio interrompido seguido da próxima execução.
+
+    python benchmark.py extracao [--linhas 200000]
+        Leitura dos custos do DB2 (um SQLite com as mesmas tabelas, no lugar do
+        DB2): fetchall() + lista de dicionários contra o gerador com fetchmany
+        do sincronizar_custos.py, em tempo e pico de memória, e o fluxo
+        completo (leitura, filtro e envio em partes) contra o servidor local.
+"""
+
+import argparse
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(RAIZ, 'benchmark_baseline.json')
+DIAS_PEDIDO = {0: "SEGUNDA-FEIRA", 1: "TERÇA-FEIRA", 2: "QUARTA-FEIRA", 4: "SEXTA-FEIRA", 5: "SÁBADO"}
+LOJAS = ["BCS", "SJN", "FCL2", "MEP", "FCL3", "FCL4"]
+INDICES_RELATORIO = ["uq_pedidos_data_loja_produto_tipo", "idx_product_availability_dia"]
+
+
+# --- PREPARAÇÃO DO BANCO ---
+
+def criar_banco(diretorio):
+    """Cria um hortifruti.db novo em `diretorio` usando o próprio init_db.py."""
+    env = dict(os.environ, PYTHONPATH=RAIZ)
+    env.pop('DATABASE_URL', None)
+    subprocess.run([sys.executable, os.path.join(RAIZ, 'init_db.py')], cwd=diretorio, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    return os.path.join(diretorio, 'hortifruti.db')
+
+
+def produtos_por_dia(conn):
+    dados = {}
+    for day_id, nome, unidade in conn.execute(
+            "SELECT pa.day_id, p.name, p.unidade_fracionada FROM products p "
+            "JOIN product_availability pa ON p.id = pa.product_id ORDER BY p.name;"):
+        dados.setdefault(day_id, []).append((nome, unidade))
+    return dados
+
+
+def semear_historico(caminho, inicio, fim, rng):
+    """Gera contagens das lojas, pedidos finais e os agregados diários para cada dia de pedido em [inicio, fim)."""
+    conn = sqlite3.connect(caminho)
+    catalogo = produtos_por_dia(conn)
+    pedidos, finais, agregados = [], [], []
+    dia = inicio
+    while dia < fim:
+        produtos = catalogo.get(dia.weekday()) if dia.weekday() in DIAS_PEDIDO else None
+        data_str = dia.strftime('%Y-%m-%d')
+        for nome, unidade in produtos or []:
+            for loja in LOJAS:
+                caixas = rng.randint(1, 12) if rng.random() < 0.6 else 0
+                fracionado = rng.randint(1, 20) if rng.random() < 0.3 else 0
+                final = rng.randint(0, 10) if rng.random() < 0.5 else None
+                if caixas:
+                    pedidos.append((data_str, loja, nome, 'Caixa', caixas))
+                if fracionado:
+                    pedidos.append((data_str, loja, nome, unidade, fracionado))
+                if final is not None:
+                    finais.append((data_str, nome, loja, final))
+                if caixas or fracionado or final is not None:
+                    agregados.append((data_str, nome, loja, caixas, fracionado if unidade in ('KG', 'UN') else 0, final))
+        dia += timedelta(days=1)
+    conn.executemany("INSERT INTO pedidos (data_pedido, loja, produto, tipo, quantidade) VALUES (?, ?, ?, ?, ?);", pedidos)
+    conn.executemany("INSERT INTO pedidos_finais (data_pedido, produto_nome, loja_nome, quantidade_pedida) VALUES (?, ?, ?, ?);", finais)
+    conn.executemany("INSERT INTO agregados_diarios (data_pedido, produto, loja, caixas, fracionado, pedido_final) VALUES (?, ?, ?, ?, ?, ?);", agregados)
+    conn.commit()
+    conn.close()
+    return len(pedidos)
+
+
+def remover_indices(caminho):
+    conn = sqlite3.connect(caminho)
+    for nome in INDICES_RELATORIO:
+        conn.execute(f"DROP INDEX IF EXISTS {nome};")
+    conn.commit()
+    conn.close()
+
+
+def ultimo_dia_de_pedido(antes_de):
+    dia = antes_de - timedelta(days=1)
+    while dia.weekday() not in DIAS_PEDIDO:
+        dia -= timedelta(days=1)
+    return dia
+
+
+# --- APP E MEDIÇÃO ---
+
+def carregar_app(caminho):
+    """Importa o app apontando o pool SQLite para `caminho`."""
+    os.environ.pop('DATABASE_URL', None)
+    os.environ['SQLITE_PATH'] = caminho
+    sys.path.insert(0, RAIZ)
+    import app as modulo_app
+    import database
+    # Troca de banco entre cenários no mesmo processo: descarta as conexões da thread.
+    database.DATABASE = caminho
+    database._pool = None
+    return modulo_app
+
+
+def cliente_admin(modulo_app):
+    cliente = modulo_app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['username'] = 'Igor'
+        sessao['role'] = 'admin'
+    return cliente
+
+
+def medir(funcao, repeticoes):
+    """Executa `funcao` `repeticoes` vezes (após um aquecimento) e devolve as durações em ms."""
+    funcao()
+    duracoes = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+    return duracoes
+
+
+def consultas_da_resposta(resposta):
+    """Comandos SQL da requisição, lidos do header Server-Timing (instrumentacao.py)."""
+    encontrado = re.search(r'desc="(\d+) consultas"', resposta.headers.get('Server-Timing', ''))
+    assert encontrado, "resposta sem Server-Timing"
+    return int(encontrado.group(1))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def plano_da_consulta(caminho, sql, params):
+    conn = sqlite3.connect(caminho)
+    plano = " | ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+    conn.close()
+    return plano
+
+
+class ServidorLocal:
+    """App servido numa porta local (werkzeug, uma thread por requisição), com latência e falhas simuladas."""
+
+    def __init__(self, modulo_app, latencia_ms=0, taxa_falhas=0.0, semente=42):
+        from werkzeug.serving import make_server
+        self.wsgi = modulo_app.app.wsgi_app
+        self.latencia = latencia_ms / 1000
+        self.taxa_falhas = taxa_falhas
+        self.rng = random.Random(semente)
+        self.requisicoes = 0
+        self.servidor = make_server('127.0.0.1', 0, self._app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def _app(self, environ, start_response):
+        self.requisicoes += 1
+        time.sleep(self.latencia)
+        if self.taxa_falhas and self.rng.random() < self.taxa_falhas:
+            environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain')])
+            return [b'indisponivel']
+        return self.wsgi(environ, start_response)
+
+    def parar(self):
+        self.servidor.shutdown()
+
+
+class ServidorGunicorn:
+    """O app no gunicorn com o gunicorn.conf.py do projeto, numa porta local, no SERVING_MODE pedido."""
+
+    def __init__(self, modo, env, workers=2, porta=5081):
+        env = dict(env, SERVING_MODE=modo, WEB_CONCURRENCY=str(workers))
+        env.pop('DB_POOL_MAX', None)
+        self.url = f"http://127.0.0.1:{porta}"
+        self.processo = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+                                          '--bind', f"127.0.0.1:{porta}", '--log-level', 'warning'],
+                                         cwd=RAIZ, env=env)
+        import requests
+        limite = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if self.processo.poll() is not None or time.monotonic() > limite:
+                self.parar()
+                raise RuntimeError(f"gunicorn ({modo}) não subiu.")
+            time.sleep(0.2)
+
+    def parar(self):
+        if self.processo.poll() is None:
+            self.processo.terminate()
+            try:
+                self.processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+
+
+def semear_produtos_com_codigo(caminho, quantidade):
+    """Acrescenta `quantidade` produtos sintéticos com codigo_interno e devolve os códigos."""
+    conn = sqlite3.connect(caminho)
+    codigos = [f"9{i:07d}" for i in range(quantidade)]
+    conn.executemany("INSERT INTO products (name, unidade_fracionada, codigo_interno, cost) VALUES (?, 'KG', ?, 1.00);",
+                     [(f"PRODUTO SINTETICO {codigo}", codigo) for codigo in codigos])
+    conn.commit()
+    conn.close()
+    return codigos
+
+
+def criar_db2_sqlite(caminho, linhas, codigos_do_app, rng):
+    """SQLite com as tabelas do DB2 usadas pelo sincronizar_custos.py (para anexar como schema DBA).
+
+    Gera `linhas` produtos ativos da seção 44 com custo (em centavos, como no DB2);
+    os primeiros recebem os códigos de `codigos_do_app`, os demais códigos que o app não tem.
+    """
+    conn = sqlite3.connect(caminho)
+    conn.executescript("""
+        CREATE TABLE PRODUTO (IDPRODUTO INTEGER PRIMARY KEY, IDSECAO INTEGER, IDGRUPO INTEGER);
+        CREATE TABLE PRODUTO_GRADE (IDPRODUTO INTEGER, IDSUBPRODUTO TEXT, IDCADEIAPRECO INTEGER, FLAGINATIVO TEXT);
+        CREATE TABLE SECAO (IDSECAO INTEGER PRIMARY KEY);
+        CREATE TABLE PRODUTO_CADEIA_PRECO (IDCADEIAPRECO INTEGER PRIMARY KEY);
+        CREATE TABLE POLITICA_PRECO_PRODUTO (IDPRODUTO INTEGER, IDSUBPRODUTO TEXT, IDEMPRESA INTEGER, CUSTOGERENCIAL NUMERIC);
+        CREATE INDEX idx_grade_produto ON PRODUTO_GRADE (IDPRODUTO);
+        CREATE INDEX idx_politica ON POLITICA_PRECO_PRODUTO (IDPRODUTO, IDSUBPRODUTO, IDEMPRESA);
+        INSERT INTO SECAO VALUES (44);
+    """)
+    codigos = list(codigos_do_app) + [f"5{i:07d}" for i in range(max(0, linhas - len(codigos_do_app)))]
+    conn.executemany("INSERT INTO PRODUTO VALUES (?, 44, 4400);", [(i,) for i in range(linhas)])
+    conn.executemany("INSERT INTO PRODUTO_GRADE VALUES (?, ?, NULL, 'F');", [(i, f" {codigos[i]} ") for i in range(linhas)])
+    conn.executemany("INSERT INTO POLITICA_PRECO_PRODUTO VALUES (?, ?, 1, ?);",
+                     [(i, f" {codigos[i]} ", rng.randint(100, 9999)) for i in range(linhas)])
+    conn.commit()
+    conn.close()
+
+
+def conectar_db2_sqlite(caminho):
+    """Conexão em que `DBA.TABELA` funciona como no DB2."""
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute("ATTACH DATABASE ? AS DBA;", (caminho,))
+    return conn
+
+
+def medir_memoria(funcao):
+    """(resultado, segundos, pico de memória alocada em MB) de `funcao()`."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcao()
+        return resultado, time.perf_counter() - inicio, tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+# --- CENÁRIOS ---
+
+def cenario_suite(args):
+    """Latência (p50/p95/p99) e consultas por requisição das rotas do fluxo de pedidos, com baseline em JSON."""
+    import json
+    import platform
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    os.environ['PDF_CACHE_DIR'] = os.path.join(base, 'pdf')
+    try:
+        caminho = criar_banco(base)
+        hoje = date.today()
+        linhas_historico = semear_historico(caminho, hoje - timedelta(days=30 * args.meses), hoje, random.Random(42))
+        conn = sqlite3.connect(caminho)
+        produtos_hoje = [nome for nome, _ in produtos_por_dia(conn).get(hoje.weekday(), [])]
+        conn.close()
+
+        modulo_app = carregar_app(caminho)
+        import pdf_pedido
+        pdf_pedido.PDF_CACHE_DIR = os.environ['PDF_CACHE_DIR']
+        data_str = hoje.isoformat()
+
+        def cliente_loja(i):
+            cliente = modulo_app.app.test_client()
+            loja = LOJAS[i % len(LOJAS)]
+            with cliente.session_transaction() as sessao:
+                sessao['username'] = loja.lower()
+                sessao['role'] = 'loja'
+                sessao['store_name'] = loja
+            return cliente
+
+        def pedido_final(rng):
+            return json.dumps([{'produto': nome, 'loja': loja, 'pedido': rng.randint(0, 9)} for nome in produtos_hoje for loja in LOJAS])
+
+        # rota -> (cliente do i-ésimo usuário simultâneo, requisição feita com (cliente, rng))
+        rotas = {
+            '/': (cliente_loja, lambda c, rng: c.get('/')),
+            '/enviar': (cliente_loja, lambda c, rng: c.post('/enviar', data={f'caixas_{nome}': str(rng.randint(0, 9)) for nome in produtos_hoje})),
+            '/relatorio': (lambda i: cliente_admin(modulo_app), lambda c, rng: c.get(f'/relatorio?data={data_str}')),
+            '/api/relatorio': (lambda i: cliente_admin(modulo_app), lambda c, rng: c.get(f'/api/relatorio?data={data_str}')),
+            '/salvar-pedido': (lambda i: cliente_admin(modulo_app), lambda c, rng: c.post('/salvar-pedido', data={'pedido_data': pedido_final(rng), 'data_pedido_form': data_str})),
+            '/exportar-pedido-pdf': (lambda i: cliente_admin(modulo_app), lambda c, rng: c.post('/exportar-pedido-pdf', data={'pedido_data': pedido_final(rng), 'data_pedido_pdf': data_str})),
+        }
+        if not produtos_hoje:
+            print(f"Nenhum produto cadastrado para hoje (dia {hoje.weekday()}); / e /enviar ficam de fora.")
+            rotas = {rota: rotas[rota] for rota in rotas if rota not in ('/', '/enviar')}
+
+        def medir_rota(rota, criar_cliente, requisicao):
+            amostras = []
+            lock = threading.Lock()
+            barreira = threading.Barrier(args.clientes)
+
+            def usuario(i):
+                cliente, rng = criar_cliente(i), random.Random(i)
+                requisicao(cliente, rng)  # aquecimento
+                barreira.wait()
+                locais = []
+                for _ in range(args.repeticoes):
+                    inicio = time.perf_counter()
+                    resposta = requisicao(cliente, rng)
+                    duracao = (time.perf_counter() - inicio) * 1000
+                    assert resposta.status_code in (200, 302), f"{rota}: HTTP {resposta.status_code}"
+                    locais.append((duracao, consultas_da_resposta(resposta)))
+                with lock:
+                    amostras.extend(locais)
+
+            threads = [threading.Thread(target=usuario, args=(i,)) for i in range(args.clientes)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duracoes = [d for d, _ in amostras]
+            return {"n": len(amostras),
+                    "p50_ms": round(percentil(duracoes, 50), 2),
+                    "p95_ms": round(percentil(duracoes, 95), 2),
+                    "p99_ms": round(percentil(duracoes, 99), 2),
+                    "consultas_por_requisicao": round(sum(q for _, q in amostras) / len(amostras), 1)}
+
+        resultado = {
+            "gerado_em": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "ambiente": {"python": platform.python_version(), "sistema": platform.system(), "maquina": platform.machine(), "cpus": os.cpu_count()},
+            "parametros": {"meses": args.meses, "clientes": args.clientes, "repeticoes": args.repeticoes,
+                           "linhas_pedidos": linhas_historico, "produtos_hoje": len(produtos_hoje), "lojas": len(LOJAS)},
+            "rotas": {},
+        }
+        print(f"{len(LOJAS)} lojas | {args.meses} meses ({linhas_historico} linhas em pedidos) | {len(produtos_hoje)} produtos hoje | "
+              f"{args.clientes} clientes simultâneos × {args.repeticoes} repetições\n")
+        print(f"{'rota':<22} {'p50':>11} {'p95':>11} {'p99':>11} {'consultas':>10}")
+        for rota, (criar_cliente, requisicao) in rotas.items():
+            medida = resultado["rotas"][rota] = medir_rota(rota, criar_cliente, requisicao)
+            print(f"{rota:<22} {medida['p50_ms']:>8.2f} ms {medida['p95_ms']:>8.2f} ms {medida['p99_ms']:>8.2f} ms {medida['consultas_por_requisicao']:>10.1f}")
+
+        regressoes = []
+        if os.path.exists(BASELINE):
+            with open(BASELINE, encoding='utf-8') as f:
+                anterior = json.load(f)
+            print(f"\nComparação com {os.path.basename(BASELINE)} ({anterior['gerado_em']}, tolerância {args.tolerancia:.0%} no p50):")
+            for rota, medida in resultado["rotas"].items():
+                base_rota = anterior["rotas"].get(rota)
+                if base_rota is None:
+                    print(f"  {rota:<22} nova rota")
+                    continue
+                variacao = medida["p50_ms"] / base_rota["p50_ms"] - 1 if base_rota["p50_ms"] else 0.0
+                problemas = []
+                if variacao > args.tolerancia:
+                    problemas.append("mais lenta")
+                if medida["consultas_por_requisicao"] > base_rota["consultas_por_requisicao"]:
+                    problemas.append(f"consultas {base_rota['consultas_por_requisicao']} -> {medida['consultas_por_requisicao']}")
+                if problemas:
+                    regressoes.append(rota)
+                print(f"  {rota:<22} p50 {variacao:+7.1%}  {'⚠️  ' + ', '.join(problemas) if problemas else '✅'}")
+
+        if args.gravar_baseline:
+            with open(BASELINE, 'w', encoding='utf-8') as f:
+                json.dump(resultado, f, ensure_ascii=False, indent=2)
+                f.write('\n')
+            print(f"\n💾 Baseline gravada em {os.path.basename(BASELINE)}")
+        elif regressoes:
+            print(f"\n❌ Regressão em: {', '.join(regressoes)}")
+            sys.exit(1)
+    finally:
+        os.environ.pop('PDF_CACHE_DIR', None)
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_relatorio(args):
+    """Latência do /relatorio com o histórico crescendo de 1 até `--meses` meses."""
+    hoje = date.today()
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        modelo = criar_banco(base)
+        variantes = {}
+        for nome, com_indices in (('com_indices', True), ('sem_indices', False)):
+            caminho = os.path.join(base, f'{nome}.db')
+            shutil.copy(modelo, caminho)
+            if not com_indices:
+                remover_indices(caminho)
+            variantes[nome] = caminho
+
+        modulo_app = carregar_app(variantes['com_indices'])
+        import database
+        data_relatorio = ultimo_dia_de_pedido(hoje).strftime('%Y-%m-%d')
+        print(f"Relatório medido: {data_relatorio} | {args.repeticoes} repetições por ponto\n")
+        print(f"{'meses':>5} {'linhas pedidos':>15} " + " ".join(f"{n + ' p50':>16} {n + ' p95':>16}" for n in variantes))
+
+        sementes = {nome: random.Random(42) for nome in variantes}
+        linhas = 0
+        for mes in range(1, args.meses + 1):
+            inicio = hoje - timedelta(days=30 * mes)
+            fim = hoje - timedelta(days=30 * (mes - 1))
+            resultados = []
+            for nome, caminho in variantes.items():
+                inseridas = semear_historico(caminho, inicio, fim, sementes[nome])
+                database.DATABASE = caminho
+                database._pool = None
+                cliente = cliente_admin(modulo_app)
+                duracoes = medir(lambda: cliente.get(f'/relatorio?data={data_relatorio}'), args.repeticoes)
+                resultados.append((percentil(duracoes, 50), percentil(duracoes, 95)))
+            linhas += inseridas
+            print(f"{mes:>5} {linhas:>15} " + " ".join(f"{p50:>13.2f} ms {p95:>13.2f} ms" for p50, p95 in resultados))
+
+        print("\nPlano da consulta do relatório:")
+        sql = "SELECT produto, loja, tipo, SUM(quantidade) FROM pedidos WHERE data_pedido = ? GROUP BY produto, loja, tipo;"
+        for nome, caminho in variantes.items():
+            print(f"  {nome}: {plano_da_consulta(caminho, sql, (data_relatorio,))}")
+        # Custos de uma data passada: uma consulta por relatório, pela chave (product_id, valid_from).
+        import queries
+        dia = date.fromisoformat(data_relatorio).weekday()
+        print("Plano da consulta dos custos na data (product_cost_history):")
+        print(f"  {plano_da_consulta(variantes['com_indices'], queries.SQL['custos_do_dia_na_data'], (data_relatorio, data_relatorio, dia))}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+# Mesma soma do /api/relatorio-periodo (agrupar=total), feita direto nas tabelas de origem.
+SQL_PERIODO_SEM_AGREGADOS = """
+    SELECT produto, loja, SUM(caixas), SUM(fracionado), SUM(pedido_final)
+    FROM (
+        SELECT produto, loja,
+               CASE WHEN tipo = 'Caixa' THEN quantidade ELSE 0 END AS caixas,
+               CASE WHEN tipo IN ('KG', 'UN') THEN quantidade ELSE 0 END AS fracionado,
+               NULL AS pedido_final
+        FROM pedidos WHERE data_pedido BETWEEN ? AND ?
+        UNION ALL
+        SELECT produto_nome, loja_nome, 0, 0, quantidade_pedida
+        FROM pedidos_finais WHERE data_pedido BETWEEN ? AND ?
+    ) GROUP BY produto, loja;
+"""
+
+
+def cenario_periodo(args):
+    """Relatório consolidado de `--dias` dias com o histórico crescendo de 1 até `--meses` meses."""
+    hoje = date.today()
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        caminho = criar_banco(base)
+        modulo_app = carregar_app(caminho)
+        cliente = cliente_admin(modulo_app)
+        inicio_periodo = (hoje - timedelta(days=args.dias)).strftime('%Y-%m-%d')
+        fim_periodo = (hoje - timedelta(days=1)).strftime('%Y-%m-%d')
+        url = f'/api/relatorio-periodo?inicio={inicio_periodo}&fim={fim_periodo}'
+        print(f"Período medido: {inicio_periodo} a {fim_periodo} | {args.repeticoes} repetições por ponto\n")
+        print(f"{'meses':>5} {'linhas pedidos':>15} {'agregados p50':>16} {'agregados p95':>16} {'pedidos p50':>16} {'pedidos p95':>16}")
+
+        rng = random.Random(42)
+        conn = sqlite3.connect(caminho)
+        linhas = 0
+        for mes in range(1, args.meses + 1):
+            linhas += semear_historico(caminho, hoje - timedelta(days=30 * mes), hoje - timedelta(days=30 * (mes - 1)), rng)
+            resposta = cliente.get(url)
+            assert resposta.status_code == 200, resposta.status_code
+            com = medir(lambda: cliente.get(url), args.repeticoes)
+            params = (inicio_periodo, fim_periodo, inicio_periodo, fim_periodo)
+            sem = medir(lambda: conn.execute(SQL_PERIODO_SEM_AGREGADOS, params).fetchall(), args.repeticoes)
+            print(f"{mes:>5} {linhas:>15} {percentil(com, 50):>13.2f} ms {percentil(com, 95):>13.2f} ms "
+                  f"{percentil(sem, 50):>13.2f} ms {percentil(sem, 95):>13.2f} ms")
+        conn.close()
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_etag(args):
+    """/relatorio (HTML) x /api/relatorio (JSON) x revalidação com If-None-Match (304)."""
+    hoje = date.today()
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        caminho = criar_banco(base)
+        rng = random.Random(42)
+        linhas = sum(semear_historico(caminho, hoje - timedelta(days=30 * mes), hoje - timedelta(days=30 * (mes - 1)), rng)
+                     for mes in range(1, args.meses + 1))
+        modulo_app = carregar_app(caminho)
+        cliente = cliente_admin(modulo_app)
+        data_relatorio = ultimo_dia_de_pedido(hoje).strftime('%Y-%m-%d')
+        resposta = cliente.get(f'/api/relatorio?data={data_relatorio}')
+        assert resposta.status_code == 200, resposta.status_code
+        etag = resposta.headers['ETag']
+        print(f"Relatório de {data_relatorio} | {linhas} linhas em pedidos | {args.repeticoes} repetições\n")
+        print(f"{'requisição':<32} {'p50':>12} {'p95':>12} {'bytes':>9}")
+        casos = (
+            ("/relatorio (HTML)", f'/relatorio?data={data_relatorio}', {}),
+            ("/api/relatorio (200)", f'/api/relatorio?data={data_relatorio}', {}),
+            ("/api/relatorio If-None-Match", f'/api/relatorio?data={data_relatorio}', {'If-None-Match': etag}),
+        )
+        for nome, url, cabecalhos in casos:
+            tamanho = len(cliente.get(url, headers=cabecalhos).data)
+            duracoes = medir(lambda: cliente.get(url, headers=cabecalhos), args.repeticoes)
+            print(f"{nome:<32} {percentil(duracoes, 50):>9.2f} ms {percentil(duracoes, 95):>9.2f} ms {tamanho:>9}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_autosave(args):
+    """/enviar com o formulário inteiro x /api/contagem com o campo alterado."""
+    import json
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        caminho = criar_banco(base)
+        modulo_app = carregar_app(caminho)
+        cliente = modulo_app.app.test_client()
+        with cliente.session_transaction() as sessao:
+            sessao['username'] = 'bcs'
+            sessao['role'] = 'loja'
+            sessao['store_name'] = 'BCS'
+        conn = sqlite3.connect(caminho)
+        hoje = date.today().weekday()
+        produtos = produtos_por_dia(conn).get(hoje, [])
+        conn.close()
+        if not produtos:
+            print(f"Nenhum produto cadastrado para hoje (dia {hoje}); rode em um dia de contagem.")
+            return
+
+        formulario = {}
+        for nome, unidade in produtos:
+            formulario[f'caixas_{nome}'] = '3'
+            if unidade:
+                formulario[f'fracionado_{nome}'] = '2'
+        assert cliente.post('/enviar', data=formulario).status_code == 302
+        primeiro = produtos[0][0]
+        estado = {'valor': 3, 'revisao': 0}
+
+        def formulario_inteiro():
+            estado['valor'] = 7 - estado['valor']
+            formulario[f'caixas_{primeiro}'] = str(estado['valor'])
+            assert cliente.post('/enviar', data=formulario).status_code == 302
+
+        def campo_alterado():
+            estado['valor'] = 7 - estado['valor']
+            corpo = {'revisao': estado['revisao'], 'alteracoes': [{'produto': primeiro, 'tipo': 'caixas', 'quantidade': estado['valor']}]}
+            resposta = cliente.post('/api/contagem', json=corpo)
+            if resposta.status_code == 409:
+                corpo['revisao'] = resposta.get_json()['revisao']
+                resposta = cliente.post('/api/contagem', json=corpo)
+            estado['revisao'] = resposta.get_json()['revisao']
+
+        bytes_formulario = len('&'.join(f"{chave}={valor}" for chave, valor in formulario.items()).encode('utf-8'))
+        bytes_campo = len(json.dumps({'revisao': 0, 'alteracoes': [{'produto': primeiro, 'tipo': 'caixas', 'quantidade': 4}]}).encode('utf-8'))
+        print(f"{len(formulario)} campos preenchidos ({len(produtos)} produtos) | {args.repeticoes} repetições\n")
+        print(f"{'requisição':<32} {'p50':>12} {'p95':>12} {'bytes':>9}")
+        for nome, funcao, tamanho in (("/enviar (formulário inteiro)", formulario_inteiro, bytes_formulario),
+                                      ("/api/contagem (1 campo)", campo_alterado, bytes_campo)):
+            duracoes = medir(funcao, args.repeticoes)
+            print(f"{nome:<32} {percentil(duracoes, 50):>9.2f} ms {percentil(duracoes, 95):>9.2f} ms {tamanho:>9}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_carga(args):
+    """Requisições/s e p50/p99 de /, /enviar e /relatorio com clientes concorrentes, em cada SERVING_MODE."""
+    import requests
+    sys.path.insert(0, RAIZ)
+    from usuarios_config import USUARIOS
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    env = dict(os.environ, PYTHONPATH=RAIZ)
+    try:
+        if args.postgres:
+            env['DATABASE_URL'] = args.postgres
+            subprocess.run([sys.executable, os.path.join(RAIZ, 'init_db.py')], cwd=base, env=env, check=True, stdout=subprocess.DEVNULL)
+            subprocess.run([sys.executable, os.path.join(RAIZ, 'migrate_render.py')], cwd=RAIZ, env=env, check=True, stdout=subprocess.DEVNULL)
+            import psycopg2
+            conn = psycopg2.connect(args.postgres)
+            cursor = conn.cursor()
+            cursor.execute("SELECT p.name, p.unidade_fracionada FROM products p JOIN product_availability pa ON p.id = pa.product_id WHERE pa.day_id = %s;", (date.today().weekday(),))
+            produtos = cursor.fetchall()
+            conn.close()
+            banco = "PostgreSQL"
+        else:
+            caminho = criar_banco(base)
+            hoje = date.today()
+            semear_historico(caminho, hoje - timedelta(days=30 * args.meses), hoje, random.Random(42))
+            env.pop('DATABASE_URL', None)
+            env['SQLITE_PATH'] = caminho
+            conn = sqlite3.connect(caminho)
+            produtos = produtos_por_dia(conn).get(date.today().weekday(), [])
+            conn.close()
+            banco = f"SQLite, {args.meses} meses de histórico"
+        if not produtos:
+            print(f"Nenhum produto cadastrado para hoje (dia {date.today().weekday()}); rode em um dia de contagem.")
+            return
+
+        contas_loja = {loja: (usuario, senha) for usuario, senha, role, loja in USUARIOS if role == 'loja'}
+        admin = next((usuario, senha) for usuario, senha, role, _ in USUARIOS if role == 'admin')
+        modos = [modo.strip() for modo in args.modos.split(',') if modo.strip()]
+        print(f"{len(LOJAS)} lojas × {args.clientes} clientes + {args.clientes} admins | {args.workers} workers | "
+              f"{args.duracao:.0f} s por modo | {len(produtos)} produtos hoje | {banco}\n")
+        print(f"{'modo':<8} {'rota':<10} {'req':>6} {'req/s':>8} {'p50':>11} {'p99':>11} {'erros':>6}")
+
+        for modo in modos:
+            servidor = ServidorGunicorn(modo, env, workers=args.workers)
+            try:
+                sessoes = []
+                for loja in LOJAS:
+                    for _ in range(args.clientes):
+                        sessoes.append((loja, requests.Session()))
+                for _ in range(args.clientes):
+                    sessoes.append((None, requests.Session()))
+                for loja, sessao in sessoes:
+                    usuario, senha = contas_loja[loja] if loja else admin
+                    resposta = sessao.post(f"{servidor.url}/login", data={'username': usuario, 'password': senha}, allow_redirects=False)
+                    assert resposta.status_code == 302, f"login de {usuario} falhou"
+
+                medidas = []
+                medidas_lock = threading.Lock()
+                comecar = threading.Event()
+                fim_em = [0.0]
+
+                def cliente(loja, sessao, semente):
+                    rng = random.Random(semente)
+                    locais = []
+                    comecar.wait()
+                    while time.perf_counter() < fim_em[0]:
+                        if loja is None:
+                            rotas = [('/relatorio', lambda: sessao.get(f"{servidor.url}/relatorio", allow_redirects=False))]
+                        else:
+                            formulario = {f'caixas_{nome}': str(rng.randint(0, 9)) for nome, _ in rng.sample(produtos, min(10, len(produtos)))}
+                            rotas = [('/', lambda: sessao.get(f"{servidor.url}/", allow_redirects=False)),
+                                     ('/enviar', lambda: sessao.post(f"{servidor.url}/enviar", data=formulario, allow_redirects=False))]
+                        for rota, chamar in rotas:
+                            inicio = time.perf_counter()
+                            try:
+                                ok = chamar().status_code in (200, 302)
+                            except requests.RequestException:
+                                ok = False
+                            locais.append((rota, (time.perf_counter() - inicio) * 1000, ok))
+                    with medidas_lock:
+                        medidas.extend(locais)
+
+                threads = [threading.Thread(target=cliente, args=(loja, sessao, i)) for i, (loja, sessao) in enumerate(sessoes)]
+                for thread in threads:
+                    thread.start()
+                inicio = time.perf_counter()
+                fim_em[0] = inicio + args.duracao
+                comecar.set()
+                for thread in threads:
+                    thread.join()
+                segundos = time.perf_counter() - inicio
+            finally:
+                servidor.parar()
+
+            for rota in ('/', '/enviar', '/relatorio', 'total'):
+                linhas = [m for m in medidas if rota in ('total', m[0])]
+                if not linhas:
+                    continue
+                duracoes = [ms for _, ms, _ in linhas]
+                erros = sum(1 for *_, ok in linhas if not ok)
+                print(f"{modo:<8} {rota:<10} {len(linhas):>6} {len(linhas) / segundos:>8.1f} "
+                      f"{percentil(duracoes, 50):>8.1f} ms {percentil(duracoes, 99):>8.1f} ms {erros:>6}")
+            print()
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_jobs(args):
+    """PDF na requisição x job enfileirado, e a vazão do worker (jobs.py)."""
+    import contextlib
+    import io
+    import json
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    os.environ['PDF_CACHE_DIR'] = os.path.join(base, 'pdf')
+    try:
+        caminho = criar_banco(base)
+        modulo_app = carregar_app(caminho)
+        import database
+        import jobs
+        import pdf_pedido
+        pdf_pedido.PDF_CACHE_DIR = os.environ['PDF_CACHE_DIR']
+        cliente = cliente_admin(modulo_app)
+        conn = sqlite3.connect(caminho)
+        dia = ultimo_dia_de_pedido(date.today())
+        produtos = produtos_por_dia(conn).get(dia.weekday(), [])
+        conn.close()
+        data_str = dia.isoformat()
+        estado = {'n': 0}
+
+        def pedidos():
+            # Uma quantidade diferente a cada chamada: o PDF não sai do cache em disco.
+            # (e jobs com payloads iguais seriam o mesmo job).
+            estado['n'] += 1
+            itens = [[nome, loja, 1 + i % 9] for i, (nome, _) in enumerate(produtos) for loja in LOJAS]
+            itens[0][2] += estado['n']
+            return itens
+
+        def pdf_na_requisicao():
+            itens = [{'produto': p, 'loja': l, 'pedido': q} for p, l, q in pedidos()]
+            resposta = cliente.post('/exportar-pedido-pdf', data={'pedido_data': json.dumps(itens), 'data_pedido_pdf': data_str})
+            assert resposta.status_code == 200
+
+        def enfileirar():
+            resposta = cliente.post('/api/jobs', json={'tipo': 'pdf_pedido', 'payload': {'data': data_str, 'pedidos': pedidos()}})
+            assert resposta.status_code == 202
+
+        print(f"PDF de {len(produtos)} produtos × {len(LOJAS)} lojas ({data_str}) | {args.repeticoes} repetições\n")
+        print(f"{'requisição':<36} {'p50':>12} {'p95':>12}")
+        for nome, funcao in (("/exportar-pedido-pdf (na requisição)", pdf_na_requisicao),
+                             ("/api/jobs (enfileira, 202)", enfileirar)):
+            duracoes = medir(funcao, args.repeticoes)
+            print(f"{nome:<36} {percentil(duracoes, 50):>9.2f} ms {percentil(duracoes, 95):>9.2f} ms")
+
+        print(f"\n{'worker':<36} {'jobs':>6} {'tempo':>10} {'jobs/s':>8}")
+        for workers in (1, 2):
+            for _ in range(args.repeticoes):
+                enfileirar()
+            with database.conexao() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pendente';")
+                pendentes = cursor.fetchone()[0]
+                cursor.close()
+            inicio = time.perf_counter()
+            threads = [threading.Thread(target=jobs.rodar, kwargs={'worker': f'bench-{i}', 'uma_vez': True}) for i in range(workers)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            segundos = time.perf_counter() - inicio
+            with database.conexao() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*), SUM(tentativas) FROM jobs WHERE status = 'concluido';")
+                concluidos, tentativas = cursor.fetchone()
+                cursor.close()
+            assert concluidos == tentativas, "job executado mais de uma vez"
+            print(f"{f'{workers} worker(s), fila de {pendentes}':<36} {pendentes:>6} {segundos:>8.2f} s {pendentes / segundos:>8.1f}")
+    finally:
+        os.environ.pop('PDF_CACHE_DIR', None)
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def ajustar_celula_a_celula(pedidos, caixas, alfa):
+    """Mesmas médias de previsao.ajustar, com um loop Python por produto × loja (referência)."""
+    import numpy as np
+    semanas, n_produtos, n_lojas = pedidos.shape
+    previsto = np.full((n_produtos, n_lojas), np.nan)
+    nivel = np.full((n_produtos, n_lojas), np.nan)
+    for i in range(n_produtos):
+        for j in range(n_lojas):
+            soma_pesos = soma_pedido = soma_nivel = 0.0
+            for k in range(semanas):
+                if pedidos[k, i, j] != pedidos[k, i, j]:
+                    continue
+                peso = (1.0 - alfa) ** k
+                soma_pesos += peso
+                soma_pedido += peso * pedidos[k, i, j]
+                soma_nivel += peso * (pedidos[k, i, j] + caixas[k, i, j])
+            if soma_pesos:
+                previsto[i, j] = soma_pedido / soma_pesos
+                nivel[i, j] = soma_nivel / soma_pesos
+    return previsto, nivel
+
+
+def cenario_previsao(args):
+    """previsao.calcular_sugestoes completo e o ajuste vetorizado x célula a célula."""
+    import numpy as np
+    hoje = date.today()
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        caminho = criar_banco(base)
+        rng = random.Random(42)
+        linhas = sum(semear_historico(caminho, hoje - timedelta(days=30 * mes), hoje - timedelta(days=30 * (mes - 1)), rng)
+                     for mes in range(1, args.meses + 1))
+        modulo_app = carregar_app(caminho)
+        import database
+        import previsao
+
+        with database.conexao() as conn:
+            cursor = conn.cursor()
+            dia = previsao.proximo_dia_ativo(cursor, hoje + timedelta(days=1))
+            produtos = [nome for nome, _ in produtos_por_dia(sqlite3.connect(caminho)).get(dia.weekday(), [])]
+            print(f"Sugestões de {dia.isoformat()}: {len(produtos)} produtos × {len(LOJAS)} lojas, "
+                  f"{previsao.SEMANAS} semanas | {linhas} linhas em pedidos | {args.repeticoes} repetições\n")
+
+            def completo():
+                previsao.calcular_sugestoes(cursor, dia.isoformat(), produtos, modulo_app.LOJAS)
+                conn.commit()
+
+            print(f"{'etapa':<40} {'p50':>12} {'p95':>12}")
+            duracoes = medir(completo, args.repeticoes)
+            print(f"{'calcular_sugestoes (ler, ajustar, gravar)':<40} {percentil(duracoes, 50):>9.2f} ms {percentil(duracoes, 95):>9.2f} ms")
+            pedidos, caixas = previsao.carregar_historico(cursor, dia.isoformat(), produtos, modulo_app.LOJAS)
+            cursor.close()
+
+        sintetico = np.where(np.random.default_rng(42).random((previsao.SEMANAS, 2000, len(LOJAS))) < 0.5, np.nan,
+                             np.random.default_rng(7).integers(0, 10, (previsao.SEMANAS, 2000, len(LOJAS))))
+        for nome, (p, c) in (("catálogo real", (pedidos, caixas)), ("2000 produtos", (sintetico, np.ones_like(sintetico)))):
+            vetorizado = medir(lambda: previsao.ajustar(p, c), args.repeticoes)
+            celulas = medir(lambda: ajustar_celula_a_celula(p, c, previsao.ALFA), max(3, args.repeticoes // 10))
+            esperado, obtido = ajustar_celula_a_celula(p, c, previsao.ALFA)[0], previsao.ajustar(p, c)[0]
+            assert np.allclose(esperado, obtido, equal_nan=True)
+            print(f"{'ajuste NumPy, ' + nome:<40} {percentil(vetorizado, 50):>9.2f} ms {percentil(vetorizado, 95):>9.2f} ms")
+            print(f"{'ajuste célula a célula, ' + nome:<40} {percentil(celulas, 50):>9.2f} ms {percentil(celulas, 95):>9.2f} ms")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_senha(args):
+    """Verificação de senha por número de iterações e o login completo."""
+    from werkzeug.security import check_password_hash, generate_password_hash
+    sys.path.insert(0, RAIZ)
+    import usuarios
+
+    print(f"Orçamento do login: {usuarios.ORCAMENTO_LOGIN_MS:.0f} ms | atual: {usuarios.METODO}\n")
+    print(f"{'iterações':>10} {'p50':>12} {'p95':>12}")
+    repeticoes = max(3, args.repeticoes // 3)
+    recomendado = None
+    for iteracoes in (100000, 200000, 300000, 450000, 600000, 800000, 1000000):
+        armazenada = generate_password_hash('senha-de-teste', method=f"pbkdf2:sha256:{iteracoes}")
+        duracoes = medir(lambda: check_password_hash(armazenada, 'senha-de-teste'), repeticoes)
+        dentro = percentil(duracoes, 95) <= usuarios.ORCAMENTO_LOGIN_MS
+        if dentro:
+            recomendado = iteracoes
+        print(f"{iteracoes:>10} {percentil(duracoes, 50):>9.2f} ms {percentil(duracoes, 95):>9.2f} ms {'' if dentro else ' acima do orçamento'}")
+    if recomendado:
+        print(f"\nMaior custo dentro do orçamento (p95): PASSWORD_HASH_ITERATIONS={recomendado}")
+    else:
+        print("\nNenhum custo testado cabe no orçamento.")
+
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        caminho = criar_banco(base)
+        conn = sqlite3.connect(caminho)
+        conn.execute("UPDATE users SET password = 'senha-em-texto' WHERE username = 'bcs';")
+        conn.commit()
+        conn.close()
+        modulo_app = carregar_app(caminho)
+        cliente = modulo_app.app.test_client()
+
+        def login(senha):
+            resposta = cliente.post('/login', data={'username': 'bcs', 'password': senha})
+            assert resposta.status_code == 302, resposta.status_code
+            cliente.get('/logout')
+
+        def medir_uma_vez(funcao):
+            inicio = time.perf_counter()
+            funcao()
+            return (time.perf_counter() - inicio) * 1000
+
+        print(f"\n{'POST /login':<32} {'ms':>12}")
+        print(f"{'senha em texto -> hash':<32} {medir_uma_vez(lambda: login('senha-em-texto')):>9.2f} ms")
+        duracoes = medir(lambda: login('senha-em-texto'), repeticoes)
+        print(f"{'senha com hash (p50)':<32} {percentil(duracoes, 50):>9.2f} ms")
+        print(f"{'senha com hash (p95)':<32} {percentil(duracoes, 95):>9.2f} ms")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_envio(args):
+    """Envio de `--itens` custos: POST único x partes em série x partes em paralelo, e envio interrompido."""
+    import requests
+    import envio_custos
+
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    os.environ['API_SECRET_KEY'] = 'benchmark'
+    try:
+        caminho = criar_banco(base)
+        codigos = semear_produtos_com_codigo(caminho, args.itens)
+        modulo_app = carregar_app(caminho)
+        rng = random.Random(7)
+        rodada = [0]
+
+        def novos_custos():
+            # Custos diferentes a cada rodada, para que todo envio atualize de verdade.
+            rodada[0] += 1
+            return [{"codigo_interno": codigo, "custo": round(rng.uniform(1, 50), 2) + rodada[0]} for codigo in codigos]
+
+        print(f"{args.itens} custos | latência simulada {args.latencia} ms | {args.falhas:.0%} de respostas 503\n")
+        print(f"{'modo':<28} {'tempo':>10} {'requisições':>12} {'atualizados':>12}  resultado")
+
+        def medir_envio(nome, funcao):
+            servidor = ServidorLocal(modulo_app, args.latencia, args.falhas)
+            inicio = time.perf_counter()
+            try:
+                atualizados, resultado = funcao(servidor.url)
+            finally:
+                servidor.parar()
+            print(f"{nome:<28} {time.perf_counter() - inicio:>8.2f} s {servidor.requisicoes:>12} {atualizados:>12}  {resultado}")
+
+        def post_unico(url):
+            resposta = requests.post(f"{url}/api/update-costs", json={"costs": novos_custos()},
+                                     headers={'X-API-KEY': 'benchmark'}, timeout=120)
+            if resposta.status_code != 200:
+                return 0, f"falhou (status {resposta.status_code}), nada aplicado"
+            return len(resposta.json()['atualizados']), "ok"
+
+        def em_partes(paralelo, tentativas=envio_custos.TENTATIVAS, itens=None):
+            def funcao(url):
+                enviador = envio_custos.EnviadorCustos(url, 'benchmark', paralelo=paralelo, tentativas=tentativas,
+                                                       espera_inicial=0.05)
+                try:
+                    resultado = enviador.enviar(itens if itens is not None else novos_custos())
+                finally:
+                    enviador.fechar()
+                return len(resultado.atualizados), resultado.resumo()
+            return funcao
+
+        medir_envio("POST único", post_unico)
+        medir_envio("partes, em série", em_partes(1))
+        medir_envio(f"partes, {envio_custos.PARALELO} em paralelo", em_partes(envio_custos.PARALELO))
+
+        # Envio sem novas tentativas (para no meio), depois a próxima execução com os mesmos custos:
+        # as partes já aplicadas voltam como inalteradas.
+        itens = novos_custos()
+        medir_envio("interrompido (1 tentativa)", em_partes(envio_custos.PARALELO, tentativas=1, itens=itens))
+        medir_envio("próxima execução", em_partes(envio_custos.PARALELO, itens=itens))
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def cenario_extracao(args):
+    """Leitura de `--linhas` custos do DB2 (SQLite no lugar): lista completa x gerador com fetchmany."""
+    os.environ['API_SECRET_KEY'] = 'benchmark'
+    base = tempfile.mkdtemp(prefix='bench_hortifruti_')
+    try:
+        caminho = criar_banco(base)
+        codigos_do_app = semear_produtos_com_codigo(caminho, 2000)
+        caminho_db2 = os.path.join(base, 'db2.db')
+        criar_db2_sqlite(caminho_db2, args.linhas, codigos_do_app, random.Random(3))
+        modulo_app = carregar_app(caminho)
+        sys.path.insert(0, RAIZ)
+        import sincronizar_custos
+
+        def lista_completa():
+            # Como era antes: fetchall() e uma lista de dicionários com o catálogo inteiro do DB2.
+            conn = conectar_db2_sqlite(caminho_db2)
+            cursor = conn.execute(sincronizar_custos.SQL_CUSTOS_DB2)
+            itens = [{"codigo_interno": str(row[0]).strip(), "custo": float(row[1]) / 100.0}
+                     for row in cursor.fetchall() if row[0] and row[1] is not None]
+            conn.close()
+            return len(itens)
+
+        def gerador():
+            conn = conectar_db2_sqlite(caminho_db2)
+            total = sum(1 for _ in sincronizar_custos.iter_costs_from_db2(conn.cursor()))
+            conn.close()
+            return total
+
+        print(f"{args.linhas} linhas no DB2 (SQLite) | 2000 códigos no app\n")
+        print(f"{'modo':<36} {'tempo':>10} {'pico de memória':>16}  itens")
+        for nome, funcao in (("fetchall + lista", lista_completa), ("fetchmany + gerador", gerador)):
+            total, segundos, pico = medir_memoria(funcao)
+            print(f"{nome:<36} {segundos:>8.2f} s {pico:>13.1f} MB  {total}")
+
+        # Fluxo completo: gerador -> filtro dos códigos do app -> envio em partes para o servidor local.
+        servidor = ServidorLocal(modulo_app)
+        try:
+            custos_no_app = {codigo: 1.0 for codigo in codigos_do_app}
+
+            def fluxo_completo():
+                conn = conectar_db2_sqlite(caminho_db2)
+                contagem = {'lidos': 0, 'inalterados': 0, 'nao_encontrados': 0, 'enviados': {}}
+                itens = sincronizar_custos.filtrar_alterados(sincronizar_custos.iter_costs_from_db2(conn.cursor()), custos_no_app, contagem)
+                enviador = sincronizar_custos.EnviadorCustos(servidor.url, 'benchmark')
+                try:
+                    resultado = enviador.enviar(itens)
+                finally:
+                    enviador.fechar()
+                conn.close()
+                return f"{contagem['lidos']} lidos, {resultado.resumo()}"
+
+            resumo, segundos, pico = medir_memoria(fluxo_completo)
+            print(f"{'fetchmany + filtro + envio em partes':<36} {segundos:>8.2f} s {pico:>13.1f} MB  {resumo}")
+        finally:
+            servidor.parar()
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+CENARIOS = {
+    'suite': cenario_suite,
+    'relatorio': cenario_relatorio,
+    'periodo': cenario_periodo,
+    'etag': cenario_etag,
+    'autosave': cenario_autosave,
+    'carga': cenario_carga,
+    'jobs': cenario_jobs,
+    'senha': cenario_senha,
+    'previsao': cenario_previsao,
+    'envio': cenario_envio,
+    'extracao': cenario_extracao,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do app de contagem hortifruti (SQLite local).")
+    parser.add_argument('cenario', choices=sorted(CENARIOS))
+    parser.add_argument('--meses', type=int, default=12, help="meses de histórico a gerar (cenário relatorio)")
+    parser.add_argument('--repeticoes', type=int, default=30, help="repetições por medição")
+    parser.add_argument('--dias', type=int, default=90, help="tamanho do período consolidado (cenário periodo)")
+    parser.add_argument('--itens', type=int, default=20000, help="quantidade de custos enviados (cenário envio)")
+    parser.add_argument('--latencia', type=float, default=40, help="latência simulada por requisição, em ms (cenário envio)")
+    parser.add_argument('--falhas', type=float, default=0.1, help="fração de respostas 503 simuladas (cenário envio)")
+    parser.add_argument('--clientes', type=int, default=4, help="clientes simultâneos por loja (cenário carga)")
+    parser.add_argument('--duracao', type=float, default=15, help="segundos de carga por modo (cenário carga)")
+    parser.add_argument('--workers', type=int, default=2, help="workers do gunicorn (cenário carga)")
+    parser.add_argument('--modos', default='sync,gthread,gevent', help="SERVING_MODEs comparados, separados por vírgula (cenário carga)")
+    parser.add_argument('--postgres', help="URL de um PostgreSQL de teste para o cenário carga (em vez do SQLite temporário)")
+    parser.add_argument('--gravar-baseline', action='store_true', help="regrava benchmark_baseline.json com o resultado (cenário suite)")
+    parser.add_argument('--tolerancia', type=float, default=0.5, help="aumento aceito no p50 em relação à baseline (cenário suite)")
+    parser.add_argument('--linhas', type=int, default=200000, help="linhas geradas no DB2 de teste (cenário extracao)")
+    args = parser.parse_args()
+    CENARIOS[args.cenario](args)
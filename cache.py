@@ -0,0 +1,220 @@
+# cache.py - Caches em memória compartilhados entre as requisições de um worker
+"""
+O catálogo de produtos e a configuração dos dias da semana só mudam quando
+um admin os edita (ou quando a sincronização de custos roda), mas eram
+consultados em toda página de loja, todo envio e todo relatório.
+
+Cada worker do gunicorn guarda sua própria cópia. Para que um worker nunca
+sirva dados velhos depois que outro worker (ou o cron de custos) alterou o
+catálogo, toda alteração incrementa um contador na tabela cache_versao, na
+mesma transação. No início de cada requisição o worker lê esses contadores
+uma vez (uma consulta mínima por chave primária) e recarrega só o que mudou.
+O TTL é uma rede de segurança para alterações feitas fora do app.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from flask import g, has_request_context
+
+import custos
+import queries
+from lojas_config import DIAS_PEDIDO
+
+CATALOGO = 'catalogo'
+DIAS_SEMANA = 'dias_semana'
+USUARIOS = 'usuarios'
+
+TTL_CATALOGO = float(os.environ.get('CATALOGO_CACHE_TTL', 300))
+# Tempo em que a sessão confia no usuário em cache sem consultar o banco: uma
+# alteração de role/loja (ou a remoção do usuário) vale em até esse tempo.
+TTL_USUARIOS = float(os.environ.get('USUARIOS_CACHE_TTL', 60))
+
+
+def versoes(cursor):
+    """Versões atuais de cache_versao ({nome: versao}), lidas uma vez por requisição."""
+    if has_request_context() and '_cache_versoes' in g:
+        return g._cache_versoes
+    queries.executar(cursor, 'versoes_cache')
+    atuais = {nome: versao for nome, versao in cursor.fetchall()}
+    if has_request_context():
+        g._cache_versoes = atuais
+    return atuais
+
+
+def invalidar(cursor, nome):
+    """Incrementa a versão `nome`. Chame na mesma transação da alteração, antes do commit."""
+    queries.executar(cursor, 'incrementar_versao_cache', (nome,))
+    if has_request_context():
+        g.pop('_cache_versoes', None)
+
+
+# --- Versão do relatório de cada data (ETag de /api/relatorio) ---
+
+def versao_relatorio(cursor, data_pedido):
+    """Versão dos pedidos/pedidos finais da data (0 se nada foi gravado nela)."""
+    queries.executar(cursor, 'versao_relatorio', (data_pedido,))
+    linha = cursor.fetchone()
+    return linha[0] if linha else 0
+
+
+def alterou_relatorio(cursor, data_pedido):
+    """Incrementa a versão do relatório da data. Chame na mesma transação da gravação dos pedidos."""
+    queries.executar(cursor, 'incrementar_versao_relatorio', (data_pedido,))
+
+
+def etag_relatorio(cursor, data_pedido, hoje):
+    """ETag do relatório da data: muda quando mudam os pedidos da data, o catálogo (produtos
+    e custos) ou os dias da semana, e quando a data deixa de ser hoje (passa a usar o custo histórico)."""
+    atuais = versoes(cursor)
+    passado = 'p' if data_pedido < hoje else 'h'
+    return (f"rel-{data_pedido}-{versao_relatorio(cursor, data_pedido)}-"
+            f"{atuais.get(CATALOGO, 0)}-{atuais.get(DIAS_SEMANA, 0)}-{passado}")
+
+
+class CatalogoCache:
+    """Produtos disponíveis por dia da semana (get_products_for_day)."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._por_dia = {}
+
+    def produtos_do_dia(self, cursor, day_id):
+        """Lista de produtos do dia; cada chamada recebe cópias que podem ser alteradas."""
+        versao = versoes(cursor).get(CATALOGO, 0)
+        entrada = self._por_dia.get(day_id)
+        if entrada is None or entrada[0] != versao or time.monotonic() - entrada[1] > self.ttl:
+            queries.executar(cursor, 'produtos_do_dia', (day_id,))
+            produtos = queries.como_dicts(cursor)
+            for p in produtos: p['nome'] = p.pop('name')
+            entrada = (versao, time.monotonic(), tuple(produtos))
+            with self._lock:
+                self._por_dia[day_id] = entrada
+        return [dict(p) for p in entrada[2]]
+
+    def limpar(self):
+        with self._lock:
+            self._por_dia.clear()
+
+
+class CustosCache:
+    """Custos do catálogo por codigo_interno e a assinatura deles (/api/catalog-fingerprint)."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entrada = None
+
+    def obter(self, cursor):
+        """(custos {codigo: custo}, assinatura); recalculado só quando o catálogo muda."""
+        versao = versoes(cursor).get(CATALOGO, 0)
+        entrada = self._entrada
+        if entrada is None or entrada[0] != versao or time.monotonic() - entrada[1] > self.ttl:
+            queries.executar(cursor, 'custos_do_catalogo')
+            atuais = MappingProxyType({codigo: custo for codigo, custo in cursor.fetchall()})
+            entrada = self._entrada = (versao, time.monotonic(), atuais, custos.assinatura_custos(atuais))
+        return entrada[2], entrada[3]
+
+
+class SnapshotDiasSemana:
+    """Foto imutável de dias_semana_config, com o fallback para os dias padrão.
+
+    Regra única de ativação: se o dia tem linha em dias_semana_config, vale o
+    campo `ativo`; se não tem, o dia está ativo quando faz parte dos dias padrão
+    (DIAS_PEDIDO).
+    """
+
+    __slots__ = ('versao', 'config', 'padrao')
+
+    def __init__(self, versao, linhas, padrao):
+        self.versao = versao
+        self.config = MappingProxyType({dia_id: (nome, bool(ativo)) for dia_id, nome, ativo in linhas})
+        self.padrao = padrao
+
+    def ativo(self, dia_id):
+        """O dia aceita contagem das lojas?"""
+        if dia_id in self.config:
+            return self.config[dia_id][1]
+        return dia_id in self.padrao
+
+    def tem_relatorio(self, dia_id):
+        """O relatório do dia pode ser aberto? Dias padrão sempre têm relatório, mesmo desativados,
+        para que o histórico continue acessível."""
+        return self.ativo(dia_id) or dia_id in self.padrao
+
+    def nome(self, dia_id):
+        if dia_id in self.padrao:
+            return self.padrao[dia_id]
+        return self.config[dia_id][0] if dia_id in self.config else None
+
+
+class DiasSemanaCache:
+    """Configuração dos dias da semana, recarregada só quando a versão 'dias_semana' muda."""
+
+    def __init__(self, padrao):
+        self.padrao = MappingProxyType(dict(padrao))
+        self._snapshot = None
+
+    def snapshot(self, cursor):
+        versao = versoes(cursor).get(DIAS_SEMANA, 0)
+        atual = self._snapshot
+        if atual is None or atual.versao != versao:
+            queries.executar(cursor, 'listar_dias_semana')
+            atual = self._snapshot = SnapshotDiasSemana(versao, cursor.fetchall(), self.padrao)
+        return atual
+
+
+Usuario = namedtuple('Usuario', 'username senha role store_name')
+
+
+class UsuariosCache:
+    """Usuários por username (senha com hash, role e loja), para o login e a sessão.
+
+    Só guarda usuários que existem; a versão 'usuarios' descarta tudo quando
+    qualquer usuário é gravado. O login sempre confere a versão (obter); a
+    sessão usa o usuário carregado há menos de `ttl` segundos sem consultar
+    nada (recente) e só depois disso passa por obter.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versao = None
+        self._por_nome = {}
+
+    def obter(self, cursor, username):
+        versao = versoes(cursor).get(USUARIOS, 0)
+        if versao != self._versao:
+            with self._lock:
+                self._versao, self._por_nome = versao, {}
+        entrada = self._por_nome.get(username)
+        if entrada is None or time.monotonic() - entrada[0] > self.ttl:
+            queries.executar(cursor, 'usuario_por_nome', (username,))
+            linha = cursor.fetchone()
+            if linha is None:
+                return None
+            entrada = (time.monotonic(), Usuario(*linha))
+            with self._lock:
+                if self._versao == versao:
+                    self._por_nome[username] = entrada
+        return entrada[1]
+
+    def recente(self, username):
+        """Usuário carregado do banco há menos de `ttl` segundos, sem consulta; ou None."""
+        entrada = self._por_nome.get(username)
+        if entrada is None or time.monotonic() - entrada[0] > self.ttl:
+            return None
+        return entrada[1]
+
+    def limpar(self):
+        with self._lock:
+            self._versao, self._por_nome = None, {}
+
+
+catalogo = CatalogoCache(TTL_CATALOGO)
+custos_catalogo = CustosCache(TTL_CATALOGO)
+dias_semana = DiasSemanaCache(DIAS_PEDIDO)
+usuarios = UsuariosCache(TTL_USUARIOS)
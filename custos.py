@@ -0,0 +1,235 @@
+# custos.py - Atualização de custos em lote (usada por /api/update-costs)
+"""
+Em vez de um UPDATE por produto, os custos recebidos são carregados numa
+tabela temporária (COPY no PostgreSQL, ou INSERT em lote quando o gunicorn
+roda com gevent; executemany no SQLite) e aplicados com um único
+`UPDATE ... FROM`.
+
+Cada custo alterado também fecha a vigência do custo anterior e abre uma
+nova em product_cost_history, no mesmo comando para todos os produtos, para
+que relatórios de datas passadas usem o custo daquela data
+(custos_na_data()).
+
+O corpo da requisição é lido em streaming, em qualquer um destes formatos:
+- JSON clássico: {"costs": [{"codigo_interno": "...", "custo": 1.23}, ...]}
+- NDJSON (Content-Type: application/x-ndjson): um objeto por linha
+e opcionalmente comprimido com gzip (Content-Encoding: gzip).
+"""
+
+import gzip
+import hashlib
+import io
+import json
+
+from datetime import date, datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+import queries
+from database import IS_POSTGRES, modo_cooperativo
+
+# Quantidade de itens mandados ao banco de cada vez durante a carga.
+TAMANHO_LOTE = 1000
+
+# Por quantos dias sync_chunks guarda as partes já aplicadas (para reenvios).
+DIAS_RETENCAO_PARTES = 7
+
+TIPOS_NDJSON = ('application/x-ndjson', 'application/jsonl', 'application/ndjson')
+
+
+class PayloadInvalido(ValueError):
+    """Corpo da requisição que não é um JSON/NDJSON de custos válido."""
+
+
+def ler_itens(stream, content_type='', content_encoding=''):
+    """Gera os itens {"codigo_interno", "custo"} do corpo, sem carregar tudo na memória (NDJSON)."""
+    if 'gzip' in (content_encoding or ''):
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    try:
+        if (content_type or '').split(';')[0].strip() in TIPOS_NDJSON:
+            for linha in io.TextIOWrapper(stream, encoding='utf-8'):
+                linha = linha.strip()
+                if linha:
+                    yield json.loads(linha)
+        else:
+            dados = json.load(stream)
+            if not isinstance(dados, dict) or 'costs' not in dados:
+                raise PayloadInvalido("Dados inválidos.")
+            yield from dados['costs']
+    except (ValueError, OSError, EOFError) as e:
+        if isinstance(e, PayloadInvalido):
+            raise
+        raise PayloadInvalido(f"Dados inválidos: {e}") from e
+
+
+def formatar_custo(custo):
+    """Custo como texto com 2 casas ('' para produto sem custo), igual no PostgreSQL (Decimal) e no SQLite (float)."""
+    return '' if custo is None else f"{float(custo):.2f}"
+
+
+def assinatura_custos(custos):
+    """Hash do conjunto {codigo_interno: custo}, independente da ordem.
+
+    O sincronizar_custos.py calcula o mesmo hash sobre o último estado que
+    enviou; se os dois batem, o catálogo do app não mudou desde então.
+    """
+    h = hashlib.sha256()
+    for codigo in sorted(custos):
+        h.update(f"{codigo}\t{formatar_custo(custos[codigo])}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def _normalizar(itens, contagem):
+    """(ordem, codigo, custo) para cada item válido; conta os inválidos em contagem['invalidos']."""
+    for ordem, item in enumerate(itens):
+        codigo = item.get('codigo_interno') if isinstance(item, dict) else None
+        custo = item.get('custo') if isinstance(item, dict) else None
+        if not codigo or custo is None:
+            contagem['invalidos'] += 1
+            continue
+        try:
+            yield ordem, str(codigo).strip(), round(float(custo), 2)
+        except (TypeError, ValueError):
+            contagem['invalidos'] += 1
+
+
+def _lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _escapar_copy(texto):
+    return texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _carregar_tabela_temporaria(cursor, linhas):
+    """Cria custos_recebidos e carrega as linhas (ordem, codigo, custo) em lotes."""
+    if IS_POSTGRES:
+        cursor.execute("CREATE TEMP TABLE custos_recebidos (ordem INTEGER, codigo_interno TEXT, custo NUMERIC(10, 2)) ON COMMIT DROP;")
+        for lote in _lotes(linhas, TAMANHO_LOTE):
+            if modo_cooperativo():
+                # Com o gevent o psycopg2 não aceita COPY: um INSERT com várias linhas por lote.
+                execute_values(cursor, "INSERT INTO custos_recebidos (ordem, codigo_interno, custo) VALUES %s;", lote, page_size=TAMANHO_LOTE)
+                continue
+            buffer = io.StringIO(''.join(f"{ordem}\t{_escapar_copy(codigo)}\t{custo}\n" for ordem, codigo, custo in lote))
+            cursor.copy_expert("COPY custos_recebidos (ordem, codigo_interno, custo) FROM STDIN;", buffer)
+    else:
+        # A conexão SQLite da thread é reaproveitada: a tabela temporária de uma chamada anterior pode existir.
+        cursor.execute("DROP TABLE IF EXISTS temp.custos_recebidos;")
+        cursor.execute("CREATE TEMP TABLE custos_recebidos (ordem INTEGER, codigo_interno TEXT, custo NUMERIC(10, 2));")
+        for lote in _lotes(linhas, TAMANHO_LOTE):
+            cursor.executemany("INSERT INTO custos_recebidos (ordem, codigo_interno, custo) VALUES (?, ?, ?);", lote)
+
+
+def _registrar_historico(cursor, hoje):
+    """Fecha a vigência atual e abre a de `hoje` para os produtos cujo custo vai mudar.
+
+    Roda antes do UPDATE em products (compara com o custo ainda não alterado).
+    Produto ainda sem histórico ganha antes uma vigência "desde sempre" com o
+    custo atual. Duas mudanças no mesmo dia ficam numa vigência só, com o último custo.
+    """
+    queries.executar(cursor, 'iniciar_historico_custos', (hoje,))
+    queries.executar(cursor, 'fechar_historico_custos', (hoje, hoje))
+    queries.executar(cursor, 'abrir_historico_custos', (hoje,))
+
+
+def custos_na_data(cursor, data_str, day_id):
+    """{product_id: custo} vigente em `data_str` para os produtos do dia da semana, numa consulta só.
+
+    Produtos sem histórico naquela data ficam de fora; quem chama usa o custo atual.
+    """
+    queries.executar(cursor, 'custos_do_dia_na_data', (data_str, data_str, day_id))
+    return {product_id: custo for product_id, custo in cursor.fetchall()}
+
+
+def custos_dos_produtos(cursor, produtos, data_str, day_id):
+    """Preenche p['custo'] com o custo vigente em data_str (o atual para hoje ou sem histórico)."""
+    historico = {}
+    if data_str < date.today().isoformat():
+        historico = custos_na_data(cursor, data_str, day_id)
+    for p in produtos:
+        p['custo'] = historico.get(p['id'], p.get('cost')) or 0.0
+    return produtos
+
+
+def _limpar_tabelas_temporarias(cursor):
+    if not IS_POSTGRES:
+        cursor.execute("DROP TABLE IF EXISTS temp.custos_recebidos;")
+        cursor.execute("DROP TABLE IF EXISTS temp.custos_novos;")
+
+
+def aplicar_custos(conn, itens):
+    """Aplica os custos recebidos em products e devolve o resultado por código.
+
+    Se um código aparece mais de uma vez, vale o último valor enviado.
+    Retorna {"atualizados": [...], "inalterados": [...], "desconhecidos": [...], "invalidos": n}.
+    A transação fica aberta; quem chama faz o commit.
+    """
+    cursor = conn.cursor()
+    contagem = {'invalidos': 0}
+    try:
+        _carregar_tabela_temporaria(cursor, _normalizar(itens, contagem))
+
+        # Um valor por código (o último enviado)
+        on_commit = " ON COMMIT DROP" if IS_POSTGRES else ""
+        if not IS_POSTGRES:
+            cursor.execute("DROP TABLE IF EXISTS temp.custos_novos;")
+        cursor.execute(f"CREATE TEMP TABLE custos_novos (codigo_interno TEXT PRIMARY KEY, custo NUMERIC(10, 2)){on_commit};")
+        cursor.execute("""
+            INSERT INTO custos_novos (codigo_interno, custo)
+            SELECT r.codigo_interno, r.custo
+            FROM custos_recebidos r
+            JOIN (SELECT codigo_interno, MAX(ordem) AS ordem FROM custos_recebidos GROUP BY codigo_interno) u
+              ON u.codigo_interno = r.codigo_interno AND u.ordem = r.ordem;
+        """)
+
+        # Classificação antes do UPDATE: produto inexistente, custo igual ou custo novo
+        cursor.execute("""
+            SELECT n.codigo_interno, n.custo, p.id, p.cost
+            FROM custos_novos n
+            LEFT JOIN products p ON p.codigo_interno = n.codigo_interno
+            ORDER BY n.codigo_interno;
+        """)
+        resultado = {"atualizados": [], "inalterados": [], "desconhecidos": [], "invalidos": 0}
+        for codigo, custo_novo, product_id, custo_atual in cursor.fetchall():
+            if product_id is None:
+                resultado["desconhecidos"].append(codigo)
+            elif custo_atual is not None and custo_atual == custo_novo:
+                resultado["inalterados"].append(codigo)
+            else:
+                resultado["atualizados"].append(codigo)
+
+        if resultado["atualizados"]:
+            _registrar_historico(cursor, date.today().isoformat())
+        cursor.execute("""
+            UPDATE products AS p SET cost = n.custo
+            FROM custos_novos n
+            WHERE p.codigo_interno = n.codigo_interno AND (p.cost IS NULL OR p.cost <> n.custo);
+        """)
+        _limpar_tabelas_temporarias(cursor)
+    finally:
+        cursor.close()
+    resultado["invalidos"] = contagem['invalidos']
+    return resultado
+
+
+def resultado_da_parte(cursor, run_id, chunk):
+    """Resultado gravado de uma parte (run_id, chunk) já aplicada, ou None."""
+    queries.executar(cursor, 'buscar_chunk_sync', (run_id, chunk))
+    linha = cursor.fetchone()
+    return json.loads(linha[0]) if linha else None
+
+
+def registrar_parte(cursor, run_id, chunk, resultado):
+    """Marca a parte como aplicada, na mesma transação da atualização dos custos."""
+    agora = datetime.now()
+    if chunk == 0:
+        limite = (agora - timedelta(days=DIAS_RETENCAO_PARTES)).strftime('%Y-%m-%d %H:%M:%S')
+        queries.executar(cursor, 'limpar_chunks_sync', (limite,))
+    queries.executar(cursor, 'registrar_chunk_sync', (run_id, chunk, json.dumps(resultado), agora.strftime('%Y-%m-%d %H:%M:%S')))
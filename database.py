@@ -0,0 +1,392 @@
+# database.py - Pool de conexões compartilhado pelo app e pelos scripts
+"""
+Mantém as conexões abertas entre as requisições em vez de abrir uma conexão
+nova a cada chamada de get_db().
+
+- PostgreSQL (Render): um ThreadedConnectionPool por processo do gunicorn,
+  criado só depois do fork do worker.
+- SQLite (local): uma conexão persistente por thread.
+
+Dentro de uma requisição do Flask, a conexão fica guardada em `g` e é devolvida
+ao pool no teardown. Fora do Flask (scripts, threads de background), use o
+context manager `conexao()`.
+
+Os cursores das conexões do pool registram cada comando na medição da
+requisição em andamento (instrumentacao.py).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from flask import g
+from psycopg2 import pool as pg_pool
+
+import instrumentacao
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+DATABASE = os.environ.get('SQLITE_PATH', 'hortifruti.db')
+IS_POSTGRES = bool(DATABASE_URL)
+
+# Tamanho do pool por worker do gunicorn. Com SERVING_MODE=gthread|gevent o gunicorn.conf.py
+# ajusta DB_POOL_MAX ao modo (threads no gthread, GEVENT_DB_POOL no gevent).
+POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', 4))
+# Tempo máximo esperando uma conexão livre antes de desistir.
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Conexões ociosas há mais tempo que isso passam por um SELECT 1 antes de serem
+# entregues (o Postgres da Render derruba conexões paradas).
+HEALTHCHECK_IDLE = float(os.environ.get('DB_HEALTHCHECK_IDLE', 30))
+
+
+class CursorPostgres(psycopg2.extensions.cursor):
+    """Cursor do psycopg2 que registra o tempo de cada comando na medição da requisição."""
+
+    def execute(self, query, vars=None):
+        medicao = instrumentacao.atual()
+        if medicao is None:
+            return super().execute(query, vars)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            medicao.consulta(query, time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        medicao = instrumentacao.atual()
+        if medicao is None:
+            return super().executemany(query, vars_list)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            medicao.consulta(query, time.perf_counter() - inicio)
+
+    def copy_expert(self, sql, file, size=8192):
+        medicao = instrumentacao.atual()
+        if medicao is None:
+            return super().copy_expert(sql, file, size)
+        inicio = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            medicao.consulta(sql, time.perf_counter() - inicio)
+
+
+class ConexaoPostgres(psycopg2.extensions.connection):
+    """Conexão do psycopg2 que lembra quais consultas já foram preparadas nela (ver queries.py)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = set()
+        self.cursor_factory = CursorPostgres
+
+
+class CursorSQLite(sqlite3.Cursor):
+    """Cursor do sqlite3 que registra o tempo de cada comando na medição da requisição."""
+
+    def execute(self, sql, parameters=()):
+        medicao = instrumentacao.atual()
+        if medicao is None:
+            return super().execute(sql, parameters)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            medicao.consulta(sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, seq_of_parameters):
+        medicao = instrumentacao.atual()
+        if medicao is None:
+            return super().executemany(sql, seq_of_parameters)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            medicao.consulta(sql, time.perf_counter() - inicio)
+
+
+class ConexaoSQLite(sqlite3.Connection):
+    """Conexão do sqlite3 cujos cursores são CursorSQLite."""
+
+    def cursor(self, factory=CursorSQLite):
+        return super().cursor(factory)
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão ficou livre dentro de DB_POOL_TIMEOUT."""
+
+
+class _Metricas:
+    """Contadores do pool, protegidos por lock (um conjunto por processo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.em_uso = 0
+        self.pico_em_uso = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.conexoes_criadas = 0
+        self.conexoes_descartadas = 0
+        self.timeouts = 0
+
+    def checkout(self, espera):
+        with self._lock:
+            self.checkouts += 1
+            self.em_uso += 1
+            self.pico_em_uso = max(self.pico_em_uso, self.em_uso)
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+    def checkin(self):
+        with self._lock:
+            self.em_uso -= 1
+
+    def incrementar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            media = self.espera_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "em_uso": self.em_uso,
+                "pico_em_uso": self.pico_em_uso,
+                "espera_media_ms": round(media * 1000, 3),
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+                "conexoes_criadas": self.conexoes_criadas,
+                "conexoes_descartadas": self.conexoes_descartadas,
+                "timeouts": self.timeouts,
+            }
+
+
+class _PoolPostgres:
+    """ThreadedConnectionPool com espera limitada e health check no checkout.
+
+    O ThreadedConnectionPool do psycopg2 levanta erro na hora quando esgota;
+    o semáforo faz a requisição esperar por uma conexão livre até POOL_TIMEOUT.
+    """
+
+    def __init__(self, metricas):
+        self.metricas = metricas
+        self.pid = os.getpid()
+        self._pool = pg_pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, DATABASE_URL, connection_factory=ConexaoPostgres)
+        self._vagas = threading.BoundedSemaphore(POOL_MAX)
+        self._ultimo_uso = {}
+
+    def checkout(self):
+        inicio = time.perf_counter()
+        if not self._vagas.acquire(timeout=POOL_TIMEOUT):
+            self.metricas.incrementar('timeouts')
+            raise PoolEsgotado(f"Nenhuma conexão livre em {POOL_TIMEOUT}s (DB_POOL_MAX={POOL_MAX}).")
+        try:
+            conn = self._pool.getconn()
+            if not self._saudavel(conn):
+                self._pool.putconn(conn, close=True)
+                self.metricas.incrementar('conexoes_descartadas')
+                conn = self._pool.getconn()
+        except Exception:
+            self._vagas.release()
+            raise
+        if id(conn) not in self._ultimo_uso:
+            self.metricas.incrementar('conexoes_criadas')
+        self.metricas.checkout(time.perf_counter() - inicio)
+        return conn
+
+    def _saudavel(self, conn):
+        if conn.closed:
+            return False
+        ocioso = time.monotonic() - self._ultimo_uso.get(id(conn), 0)
+        if ocioso < HEALTHCHECK_IDLE:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def checkin(self, conn, descartar=False):
+        try:
+            if not descartar and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    descartar = True
+            if descartar or conn.closed:
+                self._ultimo_uso.pop(id(conn), None)
+                self.metricas.incrementar('conexoes_descartadas')
+                self._pool.putconn(conn, close=True)
+            else:
+                self._ultimo_uso[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self.metricas.checkin()
+            self._vagas.release()
+
+    def tamanho(self):
+        return POOL_MAX
+
+
+class _PoolSQLite:
+    """Uma conexão SQLite persistente por thread (sqlite3 não compartilha conexões entre threads)."""
+
+    def __init__(self, metricas):
+        self.metricas = metricas
+        self.pid = os.getpid()
+        self._local = threading.local()
+        self._threads = 0
+        self._lock = threading.Lock()
+
+    def _nova_conexao(self):
+        conn = sqlite3.connect(DATABASE, timeout=POOL_TIMEOUT, factory=ConexaoSQLite)
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._threads += 1
+        self.metricas.incrementar('conexoes_criadas')
+        return conn
+
+    def checkout(self):
+        inicio = time.perf_counter()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._nova_conexao()
+        self.metricas.checkout(time.perf_counter() - inicio)
+        return conn
+
+    def checkin(self, conn, descartar=False):
+        try:
+            if descartar:
+                conn.close()
+                self._local.conn = None
+                self.metricas.incrementar('conexoes_descartadas')
+            elif conn.in_transaction:
+                conn.rollback()
+        finally:
+            self.metricas.checkin()
+
+    def tamanho(self):
+        return self._threads
+
+
+_pool = None
+_pool_lock = threading.Lock()
+metricas = _Metricas()
+
+
+def _get_pool():
+    """Cria o pool sob demanda e recria depois de um fork (ex.: workers do gunicorn)."""
+    global _pool, metricas
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                if _pool is not None:
+                    metricas = _Metricas()
+                _pool = _PoolPostgres(metricas) if IS_POSTGRES else _PoolSQLite(metricas)
+    return _pool
+
+
+def checkout():
+    """Pega uma conexão do pool. Quem chama deve devolver com checkin()."""
+    inicio = time.perf_counter()
+    conn = _get_pool().checkout()
+    instrumentacao.conexao_obtida(time.perf_counter() - inicio)
+    return conn
+
+
+def checkin(conn, descartar=False):
+    """Devolve a conexão ao pool, desfazendo qualquer transação não confirmada."""
+    _get_pool().checkin(conn, descartar=descartar)
+
+
+@contextmanager
+def conexao():
+    """Conexão emprestada do pool para uso fora de uma requisição do Flask."""
+    conn = checkout()
+    descartar = False
+    try:
+        yield conn
+    except (psycopg2.InterfaceError, psycopg2.OperationalError):
+        descartar = True
+        raise
+    finally:
+        checkin(conn, descartar=descartar)
+
+
+# --- GEVENT (SERVING_MODE=gevent) ---
+
+def _esperar_gevent(conn, timeout=None):
+    """Wait callback do psycopg2: espera o socket do banco pelo gevent, liberando os outros greenlets."""
+    from gevent.socket import wait_read, wait_write
+    while True:
+        estado = conn.poll()
+        if estado == psycopg2.extensions.POLL_OK:
+            return
+        if estado == psycopg2.extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif estado == psycopg2.extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Estado inesperado no poll da conexão: {estado}")
+
+
+def usar_gevent():
+    """Torna o psycopg2 cooperativo com o gevent; chamado pelo gunicorn.conf.py em cada worker.
+
+    Sem isso, cada ida ao PostgreSQL bloqueia o worker inteiro, com todos os greenlets dele.
+    """
+    psycopg2.extensions.set_wait_callback(_esperar_gevent)
+
+
+def modo_cooperativo():
+    """O psycopg2 está com wait callback (gevent)? Nesse modo ele não aceita COPY."""
+    return psycopg2.extensions.get_wait_callback() is not None
+
+
+def health_check():
+    """Executa um SELECT 1 numa conexão do pool. Retorna (ok, mensagem)."""
+    try:
+        with conexao() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+            cur.close()
+        return True, "ok"
+    except Exception as e:
+        return False, str(e)
+
+
+def estatisticas():
+    """Métricas do pool deste processo (checkouts, conexões em uso, tempo de espera)."""
+    pool = _get_pool()
+    dados = metricas.snapshot()
+    dados["backend"] = "postgres" if IS_POSTGRES else "sqlite"
+    dados["pid"] = os.getpid()
+    dados["tamanho"] = pool.tamanho()
+    return dados
+
+
+def init_app(app):
+    """Registra o teardown que devolve a conexão da requisição ao pool."""
+
+    @app.teardown_appcontext
+    def _devolver_conexao(exc):
+        conn = g.pop('_db_conn', None)
+        if conn is not None:
+            descartar = isinstance(exc, (psycopg2.InterfaceError, psycopg2.OperationalError))
+            checkin(conn, descartar=descartar)
+
+
+def get_db():
+    """Conexão da requisição atual (uma só por requisição, devolvida no teardown)."""
+    conn = g.get('_db_conn')
+    if conn is None:
+        conn = g._db_conn = checkout()
+    return conn
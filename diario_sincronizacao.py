@@ -0,0 +1,193 @@
+# diario_sincronizacao.py - Diário das sincronizações de custos (JSON lines, só acrescenta)
+"""
+Cada execução do sincronizar_custos.py acrescenta uma linha JSON ao diário
+(ARQUIVO_DIARIO) com:
+
+- run_id, início e status da execução;
+- tempo de cada fase em segundos (catálogo do app, resumo do DB2, leitura do
+  DB2, envio);
+- as contagens (lidos, inalterados, não encontrados, enviados, atualizados);
+- as alterações de custo aplicadas: {codigo_interno: [custo anterior, custo novo]}.
+
+O registro inteiro é montado na memória e gravado com uma única escrita no
+fim do arquivo; nada do que já está gravado é reescrito. Quando o arquivo
+passa de TAMANHO_MAXIMO bytes ou o primeiro registro tem mais de
+IDADE_MAXIMA_DIAS dias, ele vira ARQUIVO_DIARIO.1 (o .1 vira .2, e assim
+por diante, guardando ARQUIVOS_ANTIGOS arquivos).
+
+Consultas, lendo os arquivos do fim para o começo e parando na primeira
+resposta:
+    python diario_sincronizacao.py codigo 310041   # última alteração de custo do código
+    python diario_sincronizacao.py ultimas -n 5    # resumo das últimas execuções
+"""
+
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ARQUIVO_DIARIO = os.getenv('SYNC_JOURNAL_FILE', "sincronizacao_diario.jsonl")
+TAMANHO_MAXIMO = int(os.getenv('SYNC_JOURNAL_MAX_BYTES', 10 * 1024 * 1024))
+IDADE_MAXIMA_DIAS = int(os.getenv('SYNC_JOURNAL_MAX_DAYS', 30))
+ARQUIVOS_ANTIGOS = int(os.getenv('SYNC_JOURNAL_BACKUPS', 5))
+
+TAMANHO_BLOCO = 64 * 1024
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+
+class Cronometro:
+    """Soma o tempo gasto em cada fase: `with cronometro.fase('envio'): ...`."""
+
+    def __init__(self):
+        self.tempos = {}
+
+    def somar(self, fase, segundos):
+        self.tempos[fase] = self.tempos.get(fase, 0.0) + segundos
+
+    @contextmanager
+    def fase(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.somar(nome, time.perf_counter() - inicio)
+
+    def em_segundos(self):
+        return {fase: round(segundos, 3) for fase, segundos in self.tempos.items()}
+
+
+# --- ESCRITA ---
+
+def _arquivos(caminho):
+    """Arquivo atual seguido dos rotacionados, do mais novo para o mais antigo (só os que existem)."""
+    candidatos = [caminho] + [f"{caminho}.{i}" for i in range(1, ARQUIVOS_ANTIGOS + 1)]
+    return [arquivo for arquivo in candidatos if os.path.exists(arquivo)]
+
+
+def _inicio_do_arquivo(caminho):
+    """Data do primeiro registro do arquivo (só a primeira linha é lida), ou None."""
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return datetime.strptime(json.loads(f.readline())['inicio'], FORMATO_DATA)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _precisa_rotacionar(caminho, agora):
+    try:
+        tamanho = os.path.getsize(caminho)
+    except OSError:
+        return False
+    if tamanho >= TAMANHO_MAXIMO:
+        return True
+    inicio = _inicio_do_arquivo(caminho)
+    return inicio is not None and agora - inicio > timedelta(days=IDADE_MAXIMA_DIAS)
+
+
+def _rotacionar(caminho):
+    for i in range(ARQUIVOS_ANTIGOS, 0, -1):
+        origem = caminho if i == 1 else f"{caminho}.{i - 1}"
+        if os.path.exists(origem):
+            os.replace(origem, f"{caminho}.{i}")
+    if ARQUIVOS_ANTIGOS <= 0:
+        os.remove(caminho)
+
+
+def registrar(registro, caminho=None):
+    """Acrescenta o registro (dicionário com 'inicio' em FORMATO_DATA) como uma linha do diário."""
+    caminho = caminho or ARQUIVO_DIARIO
+    if _precisa_rotacionar(caminho, datetime.now()):
+        _rotacionar(caminho)
+    linha = json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + "\n"
+    with open(caminho, "a", encoding="utf-8", buffering=TAMANHO_BLOCO) as f:
+        f.write(linha)
+
+
+def novo_registro(run_id):
+    return {"run_id": run_id, "inicio": datetime.now().strftime(FORMATO_DATA), "status": None,
+            "tempos": {}, "contagens": {}, "alteracoes": {}}
+
+
+# --- CONSULTA ---
+
+def _linhas_do_fim(caminho):
+    """Linhas do arquivo da última para a primeira, lendo blocos a partir do fim."""
+    with open(caminho, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        posicao = f.tell()
+        resto = b''
+        while posicao > 0:
+            tamanho = min(TAMANHO_BLOCO, posicao)
+            posicao -= tamanho
+            f.seek(posicao)
+            partes = (f.read(tamanho) + resto).split(b'\n')
+            resto = partes[0]
+            for linha in reversed(partes[1:]):
+                if linha.strip():
+                    yield linha
+        if resto.strip():
+            yield resto
+
+
+def registros_do_fim(caminho=None, contem=None):
+    """Registros do diário do mais novo para o mais antigo, passando pelos arquivos rotacionados.
+
+    Com `contem` (bytes), só decodifica as linhas em que esse trecho aparece.
+    """
+    for arquivo in _arquivos(caminho or ARQUIVO_DIARIO):
+        for linha in _linhas_do_fim(arquivo):
+            if contem is not None and contem not in linha:
+                continue
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                continue  # linha cortada (execução interrompida no meio da escrita)
+
+
+def ultima_alteracao(codigo, caminho=None):
+    """(registro, [custo anterior, custo novo]) da última execução que alterou o custo do código, ou None."""
+    codigo = str(codigo).strip()
+    trecho = json.dumps(codigo, ensure_ascii=False).encode('utf-8')
+    for registro in registros_do_fim(caminho, contem=trecho):
+        alteracao = registro.get('alteracoes', {}).get(codigo)
+        if alteracao is not None:
+            return registro, alteracao
+    return None
+
+
+def _formatar_custo(custo):
+    return '-' if custo is None else f"R$ {float(custo):.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta o diário das sincronizações de custos.")
+    parser.add_argument('--arquivo', default=ARQUIVO_DIARIO, help="arquivo do diário (padrão: %(default)s)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    por_codigo = comandos.add_parser('codigo', help="última alteração de custo de um código interno")
+    por_codigo.add_argument('codigo_interno')
+    ultimas = comandos.add_parser('ultimas', help="resumo das últimas execuções")
+    ultimas.add_argument('-n', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.comando == 'codigo':
+        encontrado = ultima_alteracao(args.codigo_interno, args.arquivo)
+        if encontrado is None:
+            print(f"Nenhuma alteração de custo registrada para o código {args.codigo_interno}.")
+            return
+        registro, (anterior, novo) = encontrado
+        print(f"Código {args.codigo_interno}: {_formatar_custo(anterior)} -> {_formatar_custo(novo)} "
+              f"em {registro['inicio']} (envio {registro['run_id']})")
+    else:
+        for i, registro in enumerate(registros_do_fim(args.arquivo)):
+            if i >= args.n:
+                break
+            contagens = registro.get('contagens', {})
+            tempos = ' '.join(f"{fase}={segundos:.2f}s" for fase, segundos in registro.get('tempos', {}).items())
+            print(f"{registro['inicio']} {registro.get('status')}: {contagens.get('lidos', 0)} lidos, "
+                  f"{contagens.get('enviados', 0)} enviados, {len(registro.get('alteracoes', {}))} alterados | {tempos}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# envio_custos.py - Envio dos custos para /api/update-costs em partes, em paralelo e com novas tentativas
+"""
+Usado pelo sincronizar_custos.py. A lista de custos é dividida em partes de
+tamanho fixo, enviadas com gzip por sessões HTTP persistentes (keep-alive),
+no máximo `paralelo` de cada vez. Cada parte com erro de rede, 429 ou 5xx é
+reenviada com espera exponencial.
+
+Os itens podem vir de um gerador: as partes são montadas e enviadas
+conforme os itens chegam, com no máximo 2 × `paralelo` partes na memória.
+
+Cada parte leva o id do envio e o número da parte (X-Sync-Run/X-Sync-Chunk):
+o app grava em sync_chunks as partes aplicadas e responde a uma nova
+tentativa da mesma parte sem aplicar de novo. O id é novo a cada execução,
+então nada fica guardado entre execuções: se o envio parar no meio, a
+próxima execução compara de novo os custos do DB2 com os do app e envia só o
+que ainda está diferente (as partes aplicadas já não entram).
+"""
+
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TAMANHO_PARTE = int(os.getenv('SYNC_CHUNK_SIZE', 500))
+PARALELO = int(os.getenv('SYNC_PARALLEL', 3))
+TENTATIVAS = int(os.getenv('SYNC_RETRIES', 5))
+ESPERA_INICIAL = 0.5   # segundos; dobra a cada tentativa
+ESPERA_MAXIMA = 30.0
+TIMEOUT = (5, 60)      # (conexão, resposta)
+
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+
+
+class FalhaDefinitiva(Exception):
+    """Resposta que não adianta repetir (4xx, exceto 429)."""
+
+
+def dividir(itens, tamanho):
+    """Gera listas de até `tamanho` itens, consumindo `itens` (lista ou gerador) aos poucos."""
+    parte = []
+    for item in itens:
+        parte.append(item)
+        if len(parte) >= tamanho:
+            yield parte
+            parte = []
+    if parte:
+        yield parte
+
+
+class ResultadoEnvio:
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.total_partes = 0
+        self.atualizados, self.inalterados, self.desconhecidos = [], [], []
+        self.invalidos = 0
+        self.partes_enviadas = 0
+        self.partes_repetidas = 0    # o app já tinha aplicado (resposta de reenvio)
+        self.falhas = {}             # {parte: mensagem de erro}
+        self.tentativas = 0
+
+    @property
+    def sucesso(self):
+        return not self.falhas
+
+    def somar(self, resposta):
+        self.atualizados += resposta.get('atualizados', [])
+        self.inalterados += resposta.get('inalterados', [])
+        self.desconhecidos += resposta.get('desconhecidos', [])
+        self.invalidos += resposta.get('invalidos', 0)
+
+    def resumo(self):
+        return (f"{len(self.atualizados)} atualizados, {len(self.inalterados)} inalterados, "
+                f"{len(self.desconhecidos)} desconhecidos, {self.partes_enviadas}/{self.total_partes} partes enviadas, "
+                f"{len(self.falhas)} com falha")
+
+
+class EnviadorCustos:
+    def __init__(self, base_url, api_key, tamanho_parte=TAMANHO_PARTE, paralelo=PARALELO, tentativas=TENTATIVAS,
+                 espera_inicial=ESPERA_INICIAL, espera_maxima=ESPERA_MAXIMA, timeout=TIMEOUT):
+        self.url = f"{base_url.rstrip('/')}/api/update-costs"
+        self.api_key = api_key
+        self.tamanho_parte = tamanho_parte
+        self.paralelo = paralelo
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sessoes = []
+        self._lock = threading.Lock()
+
+    # --- sessões HTTP (uma por thread, com keep-alive) ---
+
+    def _sessao(self):
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = requests.Session()
+            sessao.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            sessao.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            sessao.headers.update({'X-API-KEY': self.api_key, 'Content-Type': 'application/json',
+                                   'Content-Encoding': 'gzip', 'Accept-Encoding': 'gzip'})
+            self._local.sessao = sessao
+            with self._lock:
+                self._sessoes.append(sessao)
+        return sessao
+
+    def fechar(self):
+        with self._lock:
+            for sessao in self._sessoes:
+                sessao.close()
+            self._sessoes.clear()
+
+    # --- envio ---
+
+    def _espera(self, tentativa):
+        espera = min(self.espera_maxima, self.espera_inicial * (2 ** tentativa))
+        return espera * random.uniform(0.5, 1.0)
+
+    def _enviar_parte(self, run_id, indice, itens, resultado):
+        corpo = gzip.compress(json.dumps({"costs": itens}).encode('utf-8'))
+        cabecalhos = {'X-Sync-Run': run_id, 'X-Sync-Chunk': str(indice)}
+        ultimo_erro = None
+        for tentativa in range(self.tentativas):
+            if tentativa:
+                time.sleep(self._espera(tentativa - 1))
+            with self._lock:
+                resultado.tentativas += 1
+            try:
+                resposta = self._sessao().post(self.url, data=corpo, headers=cabecalhos, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                ultimo_erro = f"falha de conexão: {e}"
+                continue
+            if resposta.status_code == 200:
+                return resposta.json()
+            if resposta.status_code not in STATUS_REPETIR:
+                raise FalhaDefinitiva(f"status {resposta.status_code}: {resposta.text[:200]}")
+            ultimo_erro = f"status {resposta.status_code}"
+        raise FalhaDefinitiva(f"{self.tentativas} tentativas sem sucesso ({ultimo_erro})")
+
+    def _concluir(self, futuros, resultado, todos=False):
+        """Processa as partes terminadas (ou todas, com todos=True)."""
+        prontos, _ = wait(futuros, return_when=ALL_COMPLETED if todos else FIRST_COMPLETED)
+        for futuro in prontos:
+            i = futuros.pop(futuro)
+            try:
+                resposta = futuro.result()
+            except (FalhaDefinitiva, requests.exceptions.RequestException, ValueError) as e:
+                resultado.falhas[i] = str(e)
+                continue
+            resultado.somar(resposta)
+            resultado.partes_enviadas += 1
+            if resposta.get('repetido'):
+                resultado.partes_repetidas += 1
+
+    def enviar(self, itens, run_id=None):
+        """Envia os itens {"codigo_interno", "custo"} (lista ou gerador) em partes. Retorna um ResultadoEnvio.
+
+        `run_id` identifica o envio no app (X-Sync-Run); sem ele, é gerado um novo.
+        """
+        # Um id novo a cada execução: o app só deduplica as tentativas de uma mesma parte dentro do envio.
+        resultado = ResultadoEnvio(run_id or uuid.uuid4().hex)
+        futuros = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.paralelo)) as executor:
+            for i, parte in enumerate(dividir(itens, self.tamanho_parte)):
+                resultado.total_partes += 1
+                while len(futuros) >= 2 * max(1, self.paralelo):
+                    self._concluir(futuros, resultado)
+                futuros[executor.submit(self._enviar_parte, resultado.run_id, i, parte, resultado)] = i
+            if futuros:
+                self._concluir(futuros, resultado, todos=True)
+        return resultado
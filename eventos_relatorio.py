@@ -0,0 +1,219 @@
+# eventos_relatorio.py - Atualizações do relatório em tempo real (server-sent events)
+"""
+Quando uma loja envia a contagem (/enviar), as células que mudaram são
+publicadas para os admins com o relatório daquela data aberto
+(/relatorio/stream), em vez de eles recarregarem a página.
+
+- Cada worker tem um Broker em memória: uma fila por conexão aberta,
+  separadas por data do relatório.
+- No PostgreSQL, o evento sai com pg_notify na mesma transação da contagem
+  (só é entregue se ela for confirmada) e cada worker tem uma thread com
+  LISTEN no canal CANAL, que repassa ao seu Broker. Assim a loja atendida por
+  um worker chega ao admin conectado em outro.
+- No SQLite (local, um processo só), o evento fica guardado na requisição e é
+  entregue ao Broker depois do commit (confirmar()).
+
+O stream só fica ligado com SERVING_MODE=gevent (disponivel()): nos modos
+gthread e sync cada conexão aberta prenderia uma thread do worker (ou o
+worker inteiro), e algumas abas do relatório bastariam para esgotá-lo. Nesses
+modos a página consulta /api/relatorio com ETag e nada é publicado.
+
+Cada conexão dura no máximo SSE_MAX_SEGUNDOS; o EventSource do navegador
+reconecta sozinho. Um evento maior que o limite do NOTIFY, ou uma fila cheia,
+vira um aviso para o navegador recarregar os dados pela /api/relatorio.
+"""
+
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from flask import g, has_request_context
+
+from database import DATABASE_URL, IS_POSTGRES, modo_cooperativo
+from relatorio_engine import TIPOS_FRACIONADOS
+
+CANAL = 'relatorio'
+MAX_SEGUNDOS = float(os.environ.get('SSE_MAX_SEGUNDOS', 300))
+INTERVALO_PING = 15.0
+TAMANHO_FILA = 100
+# O payload do NOTIFY tem limite de 8000 bytes.
+LIMITE_NOTIFY = 7900
+
+RECARREGAR = 'recarregar'
+
+
+class Broker:
+    """Publica eventos para as filas de quem acompanha o relatório de cada data."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filas = {}
+
+    def assinar(self, data_pedido):
+        fila = queue.Queue(maxsize=TAMANHO_FILA)
+        with self._lock:
+            self._filas.setdefault(data_pedido, set()).add(fila)
+        return fila
+
+    def cancelar(self, data_pedido, fila):
+        with self._lock:
+            filas = self._filas.get(data_pedido)
+            if filas is not None:
+                filas.discard(fila)
+                if not filas:
+                    del self._filas[data_pedido]
+
+    def publicar(self, evento):
+        with self._lock:
+            filas = list(self._filas.get(evento.get('data'), ()))
+        for fila in filas:
+            try:
+                fila.put_nowait(evento)
+            except queue.Full:
+                # Navegador lento: descarta o que estava pendente e pede para recarregar tudo.
+                with fila.mutex:
+                    fila.queue.clear()
+                fila.put_nowait({'data': evento.get('data'), 'tipo': RECARREGAR})
+
+    def assinantes(self):
+        with self._lock:
+            return sum(len(filas) for filas in self._filas.values())
+
+
+broker = Broker()
+
+
+def disponivel():
+    """O relatório ao vivo está ligado neste worker? Só no gevent, onde um stream parado é só um greenlet."""
+    return modo_cooperativo()
+
+
+# --- PUBLICAÇÃO ---
+
+def evento_contagem(data_pedido, loja, contagem, produtos, unidades):
+    """Células (caixa e fracionado) da loja para os `produtos` alterados, no formato do relatório.
+
+    `contagem` é o estado completo da loja no dia ({(produto, tipo): quantidade}) e
+    `unidades` é {produto: unidade_fracionada}.
+    """
+    celulas = []
+    for produto in sorted(produtos):
+        caixa = contagem.get((produto, 'Caixa'), 0)
+        fracao = sum(contagem.get((produto, tipo), 0) for tipo in TIPOS_FRACIONADOS)
+        unidade = (unidades.get(produto) or '').lower()
+        celulas.append({"produto": produto, "caixa": caixa, "fracao": f"{fracao} {unidade}" if fracao > 0 else "0"})
+    return {"data": data_pedido, "tipo": "contagem", "loja": loja, "celulas": celulas}
+
+
+def notificar(cursor, evento):
+    """Publica o evento quando a transação atual for confirmada. Chame antes do commit.
+
+    Sem o relatório ao vivo (disponivel()), ninguém assina: não publica nada.
+    """
+    if not disponivel():
+        return
+    texto = json.dumps(evento, ensure_ascii=False, separators=(',', ':'))
+    if len(texto.encode('utf-8')) > LIMITE_NOTIFY:
+        evento = {'data': evento.get('data'), 'tipo': RECARREGAR}
+        texto = json.dumps(evento)
+    if IS_POSTGRES:
+        cursor.execute("SELECT pg_notify(%s, %s);", (CANAL, texto))
+    elif has_request_context():
+        g.setdefault('_eventos_relatorio', []).append(evento)
+    else:
+        broker.publicar(evento)
+
+
+def confirmar():
+    """Entrega ao Broker os eventos guardados na requisição (SQLite). Chame depois do commit."""
+    if has_request_context():
+        for evento in g.pop('_eventos_relatorio', []):
+            broker.publicar(evento)
+
+
+# --- LISTEN/NOTIFY (PostgreSQL) ---
+
+_ouvinte = None
+_ouvinte_lock = threading.Lock()
+
+
+def _escutar():
+    """Thread do worker: recebe os NOTIFY do canal e repassa ao Broker; reconecta se cair."""
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CANAL};")
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notificacao = conn.notifies.pop(0)
+                    try:
+                        broker.publicar(json.loads(notificacao.payload))
+                    except ValueError:
+                        continue
+        except Exception as e:
+            print(f"Aviso: escuta do canal '{CANAL}' interrompida ({e}); reconectando em 5s.")
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def iniciar_escuta():
+    """Inicia a thread de LISTEN deste worker (uma só, na primeira conexão ao stream)."""
+    global _ouvinte
+    if not IS_POSTGRES:
+        return
+    if _ouvinte is None or _ouvinte[0] != os.getpid() or not _ouvinte[1].is_alive():
+        with _ouvinte_lock:
+            if _ouvinte is None or _ouvinte[0] != os.getpid() or not _ouvinte[1].is_alive():
+                thread = threading.Thread(target=_escutar, name='escuta-relatorio', daemon=True)
+                thread.start()
+                _ouvinte = (os.getpid(), thread)
+
+
+# --- STREAM ---
+
+def _sse(evento):
+    return f"event: {evento.get('tipo', 'contagem')}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+def stream(data_pedido, max_segundos=MAX_SEGUNDOS):
+    """Gerador do corpo text/event-stream para o relatório da data.
+
+    Não usa o banco nem o contexto da requisição: a conexão da requisição já
+    volta ao pool antes de o stream começar.
+    """
+    iniciar_escuta()
+
+    def gerar():
+        # A fila só é criada quando o envio começa: um gerador nunca iniciado não
+        # passaria pelo finally e deixaria a fila registrada no Broker.
+        fila = broker.assinar(data_pedido)
+        fim = time.monotonic() + max_segundos
+        try:
+            # retry: espera do EventSource antes de reconectar quando a conexão fecha.
+            yield "retry: 2000\n\n"
+            while True:
+                restante = fim - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    evento = fila.get(timeout=min(INTERVALO_PING, restante))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(evento)
+        finally:
+            broker.cancelar(data_pedido, fila)
+
+    return gerar()
@@ -0,0 +1,52 @@
+# gunicorn.conf.py - Configuração do gunicorn (Procfile: gunicorn app:app -c gunicorn.conf.py)
+"""
+SERVING_MODE escolhe como cada worker do gunicorn atende as requisições. As
+rotas do app passam a maior parte do tempo esperando o PostgreSQL (relatório,
+salvamento automático, API de custos) ou paradas num stream SSE, então o
+worker precisa atender outras enquanto uma espera:
+
+- sync (padrão): uma requisição por vez por worker, como sempre foi; o
+  deploy só muda quando SERVING_MODE é definido.
+- gthread: GUNICORN_THREADS threads por worker (padrão 8). O pool
+  de conexões (ThreadedConnectionPool) já é seguro entre threads.
+- gevent: um greenlet por requisição, até GEVENT_CONNECTIONS por worker
+  (padrão 100). O psycopg2 fica cooperativo (database.usar_gevent), então
+  uma consulta esperando o banco não trava os outros greenlets; as
+  requisições dividem GEVENT_DB_POOL conexões (padrão 10). Só neste modo o
+  relatório ao vivo (SSE) fica ligado; nos outros a página consulta o
+  /api/relatorio a cada 30 s.
+
+No gthread e no gevent, DB_POOL_MAX acompanha o modo (threads ou
+GEVENT_DB_POOL), a menos que já esteja definido no ambiente; no sync fica
+como antes (o padrão do database.py). O número de workers continua vindo de
+WEB_CONCURRENCY e a porta de PORT (padrões do próprio gunicorn).
+
+Compare os modos com `python benchmark.py carga`.
+"""
+
+import os
+
+MODOS = ('sync', 'gthread', 'gevent')
+MODO = os.environ.get('SERVING_MODE', 'sync')
+if MODO not in MODOS:
+    raise ValueError(f"SERVING_MODE deve ser um de: {', '.join(MODOS)} (recebido: {MODO!r}).")
+
+THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+CONEXOES_GEVENT = int(os.environ.get('GEVENT_CONNECTIONS', 100))
+POOL_GEVENT = int(os.environ.get('GEVENT_DB_POOL', 10))
+
+worker_class = MODO
+if MODO == 'gthread':
+    threads = THREADS
+    os.environ.setdefault('DB_POOL_MAX', str(THREADS))
+elif MODO == 'gevent':
+    worker_connections = CONEXOES_GEVENT
+    os.environ.setdefault('DB_POOL_MAX', str(POOL_GEVENT))
+
+
+def post_worker_init(worker):
+    # Depois do monkey patch do gevent e da carga do app, antes da primeira requisição.
+    if MODO == 'gevent':
+        import database
+        database.usar_gevent()
+    worker.log.info(f"Worker {worker.pid}: SERVING_MODE={MODO}, DB_POOL_MAX={os.environ.get('DB_POOL_MAX', 'padrão')}")
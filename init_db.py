@@ -2,21 +2,11 @@
 import os
 import sqlite3
 import psycopg2
+import cache
 from produtos_config import PRODUTOS
-
-# --- DEFINIÇÃO DOS USUÁRIOS ---
-USUARIOS = [
-    ('bcs', 'bcs123', 'loja', 'BCS'),
-    ('sjn', 'sjn123', 'loja', 'SJN'),
-    ('mep', 'mep123', 'loja', 'MEP'),
-    ('fcl1', 'fcl123', 'loja', 'FCL1'),
-    ('fcl2', 'fcl223', 'loja', 'FCL2'),
-    ('fcl3', 'fcl323', 'loja', 'FCL3'),
-    ('fcl4', 'fcl423', 'loja', 'FCL4'),
-    ('Igor', 'S4nt4n4', 'admin', None),
-    ('Gabriel', 'G1a2l', 'admin', None),
-    ('Paulo', 'paulo123', 'admin', None)
-]
+from usuarios_config import USUARIOS
+from usuarios import hash_senha
+from migrations import aplicar_migracoes
 
 # --- LÓGICA DE CONEXÃO E CRIAÇÃO ---
 db_url = os.environ.get('DATABASE_URL')
@@ -37,8 +27,16 @@ cur.execute(f'''CREATE TABLE IF NOT EXISTS product_availability (product_id INTE
 cur.execute(f'''CREATE TABLE IF NOT EXISTS pedidos_finais (id {SQL_TYPE["SERIAL_PK"]}, data_pedido TEXT NOT NULL, produto_nome TEXT NOT NULL, loja_nome TEXT NOT NULL, quantidade_pedida INTEGER NOT NULL, UNIQUE (data_pedido, produto_nome, loja_nome));''')
 cur.execute('''CREATE TABLE IF NOT EXISTS dias_semana_config (dia_id INTEGER PRIMARY KEY, nome_dia TEXT NOT NULL, ativo BOOLEAN DEFAULT TRUE);''')
 
+# --- MIGRAÇÕES VERSIONADAS (índices, novas tabelas) ---
+print("Aplicando migrações versionadas...")
+aplicar_migracoes(conn, is_postgres)
+
 # --- LÓGICA PARA POPULAR AS TABELAS ---
-cur.executemany(SQL_TYPE["INSERT_USER"], USUARIOS)
+# Senhas gravadas só como hash; usuários que já existem não são alterados.
+# Depois das migrações, que criam cache_versao: a versão 'usuarios' avisa os
+# workers do app para descartar os usuários em cache.
+cur.executemany(SQL_TYPE["INSERT_USER"], [(username, hash_senha(senha), role, loja) for username, senha, role, loja in USUARIOS])
+cache.invalidar(cur, cache.USUARIOS)
 conn.commit()
 
 # --- LÓGICA DE CARGA DE PRODUTOS CORRIGIDA ---
@@ -48,6 +46,7 @@ is_production = bool(os.environ.get('DATABASE_URL'))
 if not is_production:
     print("Limpando dados de produtos antigos...")
     cur.execute("DELETE FROM product_availability;")
+    cur.execute("DELETE FROM product_cost_history;")
     cur.execute("DELETE FROM products;")
 else:
     print("⚠️  Ambiente de produção detectado. Preservando dados existentes.")
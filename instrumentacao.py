@@ -0,0 +1,243 @@
+# instrumentacao.py - Tempo de banco, de conexão e de template de cada requisição
+"""
+Mede cada requisição do Flask sem mexer nas rotas:
+
+- banco: os cursores das conexões do pool (database.py) contam os comandos
+  executados (execute, executemany, COPY) e somam o tempo gasto neles,
+  guardando o mais lento;
+- conexão: tempo esperando uma conexão livre do pool (database.checkout);
+- render: tempo dos templates Jinja (sinais do Flask);
+- total: do before_request ao after_request (num stream SSE, só até a
+  resposta começar).
+
+A medição da requisição fica num ContextVar (uma por thread ou greenlet);
+fora de uma requisição (worker, scripts) o cursor só confere que não há
+medição e executa direto. O custo por comando são duas leituras do relógio.
+
+Cada resposta leva o header Server-Timing (aparece na aba Network do
+navegador) e os números entram nos histogramas por rota deste processo,
+vistos em /admin/metrics. Requisições acima de SLOW_REQUEST_MS (padrão
+1000 ms) vão para o log com o comando mais lento.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import before_render_template, g, request, template_rendered
+
+LENTA_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+# Limites superiores das faixas dos histogramas (a última faixa é "+Inf").
+FAIXAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+FAIXAS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Tamanho máximo do texto do comando mais lento guardado.
+TAMANHO_SQL = 300
+
+_atual = ContextVar('medicao', default=None)
+
+
+class Medicao:
+    """Números de uma requisição."""
+
+    __slots__ = ('inicio', 'consultas', 'tempo_db', 'mais_lenta', 'sql_mais_lento', 'tempo_conexao', 'tempo_render', '_inicio_render')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.mais_lenta = 0.0
+        self.sql_mais_lento = None
+        self.tempo_conexao = 0.0
+        self.tempo_render = 0.0
+        self._inicio_render = None
+
+    def consulta(self, sql, segundos):
+        self.consultas += 1
+        self.tempo_db += segundos
+        if segundos > self.mais_lenta:
+            # O texto só é formatado no fim (texto_sql), e só o do mais lento.
+            self.mais_lenta = segundos
+            self.sql_mais_lento = sql
+
+    def texto_sql(self):
+        sql = self.sql_mais_lento
+        if sql is None:
+            return None
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        elif not isinstance(sql, str):
+            sql = str(sql)
+        return ' '.join(sql[:TAMANHO_SQL * 2].split())[:TAMANHO_SQL]
+
+
+def atual():
+    """Medição da requisição em andamento, ou None."""
+    return _atual.get()
+
+
+def conexao_obtida(segundos):
+    """Chamado por database.checkout() com o tempo que levou para obter a conexão."""
+    medicao = _atual.get()
+    if medicao is not None:
+        medicao.tempo_conexao += segundos
+
+
+class Histograma:
+    """Contagem por faixa, com soma e máximo; percentis estimados pelo limite da faixa (até o máximo visto)."""
+
+    def __init__(self, faixas):
+        self.faixas = faixas
+        self.contagens = [0] * (len(faixas) + 1)
+        self.n = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.faixas, valor)] += 1
+        self.n += 1
+        self.soma += valor
+        self.maximo = max(self.maximo, valor)
+
+    def percentil(self, p):
+        if not self.n:
+            return 0
+        alvo = p / 100 * self.n
+        acumulado = 0
+        for faixa, contagem in zip(self.faixas, self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return min(faixa, round(self.maximo, 2))
+        return round(self.maximo, 2)
+
+    def snapshot(self):
+        return {
+            "media": round(self.soma / self.n, 2) if self.n else 0,
+            "max": round(self.maximo, 2),
+            "p50": self.percentil(50),
+            "p95": self.percentil(95),
+            "p99": self.percentil(99),
+            # [[limite, contagem], ...]: contagem dos valores até o limite e acima do anterior.
+            "faixas": [[f, c] for f, c in zip(self.faixas + ('+Inf',), self.contagens)],
+        }
+
+
+class _Rota:
+    def __init__(self):
+        self.requisicoes = 0
+        self.erros = 0
+        self.total = Histograma(FAIXAS_MS)
+        self.db = Histograma(FAIXAS_MS)
+        self.consultas = Histograma(FAIXAS_CONSULTAS)
+        self.conexao_ms = 0.0
+        self.conexao_max_ms = 0.0
+        self.render_ms = 0.0
+        self.mais_lenta_ms = 0.0
+        self.sql_mais_lento = None
+
+
+class Registro:
+    """Histogramas por rota ("METODO /regra") deste processo, protegidos por lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._lock:
+            self.desde = time.strftime('%Y-%m-%d %H:%M:%S')
+            self._rotas = {}
+
+    def registrar(self, rota, status, total_ms, medicao):
+        db_ms, conexao_ms = medicao.tempo_db * 1000, medicao.tempo_conexao * 1000
+        mais_lenta_ms = medicao.mais_lenta * 1000
+        with self._lock:
+            dados = self._rotas.get(rota)
+            if dados is None:
+                dados = self._rotas[rota] = _Rota()
+            dados.requisicoes += 1
+            if status >= 500:
+                dados.erros += 1
+            dados.total.observar(total_ms)
+            dados.db.observar(db_ms)
+            dados.consultas.observar(medicao.consultas)
+            dados.conexao_ms += conexao_ms
+            dados.conexao_max_ms = max(dados.conexao_max_ms, conexao_ms)
+            dados.render_ms += medicao.tempo_render * 1000
+            if mais_lenta_ms > dados.mais_lenta_ms:
+                dados.mais_lenta_ms = mais_lenta_ms
+                dados.sql_mais_lento = medicao.texto_sql()
+
+    def snapshot(self):
+        """{"desde", "rotas": [{"rota", ...}]}, rotas ordenadas pelo tempo total gasto nelas."""
+        with self._lock:
+            rotas = sorted(self._rotas.items(), key=lambda item: item[1].total.soma, reverse=True)
+            return {
+                "desde": self.desde,
+                "rotas": [{
+                    "rota": rota,
+                    "requisicoes": d.requisicoes,
+                    "erros": d.erros,
+                    "tempo_ms": d.total.snapshot(),
+                    "db_ms": d.db.snapshot(),
+                    "consultas": d.consultas.snapshot(),
+                    "conexao_media_ms": round(d.conexao_ms / d.requisicoes, 3),
+                    "conexao_max_ms": round(d.conexao_max_ms, 3),
+                    "render_media_ms": round(d.render_ms / d.requisicoes, 2),
+                    "consulta_mais_lenta": {"ms": round(d.mais_lenta_ms, 2), "sql": d.sql_mais_lento},
+                } for rota, d in rotas],
+            }
+
+
+registro = Registro()
+
+
+def server_timing(medicao, total_ms):
+    """Valor do header Server-Timing da requisição."""
+    return (f'db;dur={medicao.tempo_db * 1000:.2f};desc="{medicao.consultas} consultas", '
+            f'conexao;dur={medicao.tempo_conexao * 1000:.2f}, '
+            f'render;dur={medicao.tempo_render * 1000:.2f}, '
+            f'total;dur={total_ms:.2f}')
+
+
+def init_app(app):
+    """Liga a medição ao ciclo das requisições do app."""
+
+    @app.before_request
+    def _iniciar_medicao():
+        g._medicao = Medicao()
+        _atual.set(g._medicao)
+
+    @app.after_request
+    def _registrar_medicao(resposta):
+        medicao = g.get('_medicao')
+        if medicao is None:
+            return resposta
+        total_ms = (time.perf_counter() - medicao.inicio) * 1000
+        # 404/405 ficam todos juntos: o número de rotas registradas não depende do que chega.
+        rota = f"{request.method} {request.url_rule.rule}" if request.url_rule else '(sem rota)'
+        resposta.headers['Server-Timing'] = server_timing(medicao, total_ms)
+        registro.registrar(rota, resposta.status_code, total_ms, medicao)
+        if total_ms >= LENTA_MS:
+            app.logger.warning("Requisição lenta: %s em %.0f ms (%d consultas, %.0f ms no banco; mais lenta %.0f ms: %s)",
+                               rota, total_ms, medicao.consultas, medicao.tempo_db * 1000, medicao.mais_lenta * 1000, medicao.texto_sql())
+        return resposta
+
+    @app.teardown_request
+    def _encerrar_medicao(exc):
+        _atual.set(None)
+
+    def _inicio_render(sender, template, context, **extra):
+        medicao = _atual.get()
+        if medicao is not None:
+            medicao._inicio_render = time.perf_counter()
+
+    def _fim_render(sender, template, context, **extra):
+        medicao = _atual.get()
+        if medicao is not None and medicao._inicio_render is not None:
+            medicao.tempo_render += time.perf_counter() - medicao._inicio_render
+            medicao._inicio_render = None
+
+    before_render_template.connect(_inicio_render, app, weak=False)
+    template_rendered.connect(_fim_render, app, weak=False)
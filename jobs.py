@@ -0,0 +1,229 @@
+# jobs.py - Fila de tarefas em segundo plano, guardada no próprio banco (tabela jobs)
+"""
+O trabalho pesado (PDF do pedido, sugestões, reconstrução dos agregados)
+não precisa prender uma thread do gunicorn: a rota grava um job na tabela jobs e responde na hora com o id; o worker
+(worker.py, processo separado no Procfile) executa e grava o resultado, que a
+página consulta em /api/jobs/<id>. Não há broker: a fila é a própria tabela,
+no PostgreSQL do Render ou no SQLite local.
+
+- Reserva: um único UPDATE atômico marca o próximo job disponível como
+  'executando', com lease de LEASE_SEGUNDOS e o nome do worker. No
+  PostgreSQL o SELECT interno usa FOR UPDATE SKIP LOCKED, então vários
+  workers dividem a fila sem esperar um pelo outro.
+- Execução: o handler recebe a conexão e o payload; as escritas dele e a
+  conclusão do job vão na mesma transação, e a conclusão só vale se o worker
+  ainda tem a lease. Se o worker morrer no meio, nada do job fica gravado e,
+  quando a lease vence, outro worker o executa de novo.
+- Erro: o job volta para 'pendente' com espera exponencial (ESPERA_BASE,
+  2×, 4×...) até max_tentativas; depois fica 'falhou', com o erro gravado.
+  FalhaDefinitiva (payload inválido, por exemplo) falha sem nova tentativa.
+- Chave: enfileirar com `chave` não cria um segundo job enquanto houver um
+  ativo com a mesma chave (clique duplo no botão do PDF, reenvio de uma parte).
+
+Jobs concluídos ou com falha são apagados depois de RETENCAO_DIAS.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import queries
+from database import conexao
+
+LEASE_SEGUNDOS = int(os.environ.get('JOBS_LEASE_SEGUNDOS', 300))
+TENTATIVAS = int(os.environ.get('JOBS_TENTATIVAS', 3))
+INTERVALO = float(os.environ.get('JOBS_INTERVALO', 1.0))
+# Espera antes da 2ª tentativa; dobra a cada nova falha.
+ESPERA_BASE = 30
+RETENCAO_DIAS = 7
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+FALHOU = 'falhou'
+
+Job = namedtuple('Job', 'id tipo payload tentativas max_tentativas')
+Tarefa = namedtuple('Tarefa', 'funcao admin')
+
+# {tipo: Tarefa}, preenchido pelo decorator tarefa() (tarefas.py).
+TAREFAS = {}
+
+
+class FalhaDefinitiva(Exception):
+    """Erro que não adianta tentar de novo: o job vai direto para 'falhou'."""
+
+
+def tarefa(nome, admin=False):
+    """Registra funcao(conn, payload) -> dict como handler dos jobs do tipo `nome`.
+
+    Com admin=True o tipo pode ser enfileirado por um admin em POST /api/jobs.
+    Uma chave "arquivo" (bytes) no resultado vai para a coluna jobs.arquivo,
+    baixada em /api/jobs/<id>/arquivo; o resto é gravado como JSON.
+    """
+    def registrar(funcao):
+        TAREFAS[nome] = Tarefa(funcao, admin)
+        return funcao
+    return registrar
+
+
+def _agora(segundos=0):
+    return (datetime.now() + timedelta(seconds=segundos)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# --- WEB: ENFILEIRAR E CONSULTAR ---
+
+def enfileirar(cursor, tipo, payload, chave=None, max_tentativas=TENTATIVAS):
+    """Cria o job e devolve o id (o do job ativo com a mesma `chave`, se houver). Quem chama faz o commit."""
+    if tipo not in TAREFAS:
+        raise ValueError(f"Tarefa desconhecida: {tipo}")
+    agora = _agora()
+    params = (tipo, json.dumps(payload, ensure_ascii=False), chave, max_tentativas, agora, agora, agora)
+    if chave is None:
+        return queries.inserir(cursor, 'criar_job', params)
+    # O job ativo com a chave pode terminar entre o INSERT ignorado e o SELECT: tenta de novo.
+    for _ in range(3):
+        queries.executar(cursor, 'criar_job_unico', params)
+        queries.executar(cursor, 'job_ativo_por_chave', (chave,))
+        linha = cursor.fetchone()
+        if linha is not None:
+            return linha[0]
+    raise RuntimeError(f"Não foi possível enfileirar o job com chave {chave}.")
+
+
+def situacao(cursor, job_id):
+    """Estado do job para a API ({id, tipo, status, ...}), ou None se não existe."""
+    queries.executar(cursor, 'buscar_job', (job_id,))
+    linha = cursor.fetchone()
+    if linha is None:
+        return None
+    (id_, tipo, status, tentativas, max_tentativas, resultado, erro, criado_em, atualizado_em, tem_arquivo) = linha
+    return {"id": id_, "tipo": tipo, "status": status, "tentativas": tentativas, "max_tentativas": max_tentativas,
+            "resultado": json.loads(resultado) if resultado else None, "erro": erro,
+            "criado_em": criado_em, "atualizado_em": atualizado_em, "arquivo": bool(tem_arquivo)}
+
+
+def arquivo(cursor, job_id):
+    """(bytes, resultado) do arquivo gerado por um job concluído, ou None."""
+    queries.executar(cursor, 'arquivo_job', (job_id,))
+    linha = cursor.fetchone()
+    if linha is None or linha[0] is None:
+        return None
+    return bytes(linha[0]), json.loads(linha[1]) if linha[1] else {}
+
+
+# --- WORKER: RESERVAR E EXECUTAR ---
+
+def reservar(conn, worker, lease=LEASE_SEGUNDOS):
+    """Reserva o próximo job disponível para `worker` (já confirmado no banco), ou None."""
+    cursor = conn.cursor()
+    try:
+        agora = _agora()
+        queries.executar(cursor, 'expirar_jobs', (agora, agora))
+        queries.executar(cursor, 'reservar_job', (worker, _agora(lease), agora, agora, agora))
+        linhas = cursor.fetchall()
+        conn.commit()
+    finally:
+        cursor.close()
+    if not linhas:
+        return None
+    id_, tipo, payload, tentativas, max_tentativas = linhas[0]
+    return Job(id_, tipo, json.loads(payload), tentativas, max_tentativas)
+
+
+def executar(conn, job, worker):
+    """Roda o handler do job e grava o resultado na mesma transação das escritas dele.
+
+    Retorna True se o job foi concluído.
+    """
+    inicio = time.perf_counter()
+    try:
+        tarefa_do_job = TAREFAS.get(job.tipo)
+        if tarefa_do_job is None:
+            raise FalhaDefinitiva(f"Tarefa desconhecida: {job.tipo}")
+        resultado = dict(tarefa_do_job.funcao(conn, job.payload) or {})
+        conteudo = resultado.pop('arquivo', None)
+        cursor = conn.cursor()
+        concluido = queries.executar(cursor, 'concluir_job', (json.dumps(resultado, ensure_ascii=False), conteudo, _agora(), job.id, worker)).rowcount
+        cursor.close()
+        if not concluido:
+            # A lease venceu e outro worker assumiu o job: as escritas deste são descartadas.
+            conn.rollback()
+            print(f"⚠️  Job {job.id} ({job.tipo}) perdeu a lease; resultado descartado.")
+            return False
+        conn.commit()
+        print(f"✅ Job {job.id} ({job.tipo}) concluído em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return True
+    except Exception as e:
+        conn.rollback()
+        erro = f"{type(e).__name__}: {e}"
+        cursor = conn.cursor()
+        definitiva = isinstance(e, FalhaDefinitiva) or job.tentativas >= job.max_tentativas
+        espera = ESPERA_BASE * 2 ** (job.tentativas - 1)
+        if definitiva:
+            gravado = queries.executar(cursor, 'falhar_job', (erro, _agora(), job.id, worker)).rowcount
+        else:
+            gravado = queries.executar(cursor, 'reagendar_job', (erro, _agora(espera), _agora(), job.id, worker)).rowcount
+        cursor.close()
+        conn.commit()
+        if not gravado:
+            print(f"⚠️  Job {job.id} ({job.tipo}) perdeu a lease; erro descartado: {erro}")
+        elif definitiva:
+            print(f"❌ Job {job.id} ({job.tipo}) falhou: {erro}")
+        else:
+            print(f"⚠️  Job {job.id} ({job.tipo}) falhou na tentativa {job.tentativas}/{job.max_tentativas}; nova tentativa em {espera}s: {erro}")
+        return False
+
+
+def limpar(conn, dias=RETENCAO_DIAS):
+    """Apaga os jobs terminados há mais de `dias` dias."""
+    cursor = conn.cursor()
+    apagados = queries.executar(cursor, 'limpar_jobs', (_agora(-dias * 86400),)).rowcount
+    cursor.close()
+    conn.commit()
+    return apagados
+
+
+def processar(conn, worker, parar=None):
+    """Executa os jobs disponíveis até a fila esvaziar (ou `parar` ser sinalizado). Retorna quantos rodaram."""
+    executados = 0
+    while parar is None or not parar.is_set():
+        job = reservar(conn, worker)
+        if job is None:
+            break
+        executar(conn, job, worker)
+        executados += 1
+    return executados
+
+
+def nome_do_worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def rodar(worker=None, intervalo=INTERVALO, parar=None, uma_vez=False):
+    """Laço do worker: processa a fila, espera `intervalo` segundos e repete até `parar`.
+
+    Com uma_vez=True processa o que houver e retorna (cron ou testes locais).
+    Um job em andamento termina antes de o laço parar.
+    """
+    worker = worker or nome_do_worker()
+    parar = parar or threading.Event()
+    ultima_limpeza = 0.0
+    total = 0
+    while not parar.is_set():
+        try:
+            with conexao() as conn:
+                total += processar(conn, worker, parar)
+                if time.monotonic() - ultima_limpeza > 3600:
+                    limpar(conn)
+                    ultima_limpeza = time.monotonic()
+        except Exception as e:
+            # Banco fora do ar, conexão caída: tenta de novo no próximo ciclo.
+            print(f"⚠️  Erro no worker {worker}: {e}")
+        if uma_vez:
+            break
+        parar.wait(intervalo)
+    return total
@@ -0,0 +1,8 @@
+# lojas_config.py - Lojas e dias de pedido padrão
+
+# Usado pelo app e pelos scripts (previsao.py no cron) sem importar o Flask.
+LOJAS = ["BCS", "SJN", "FCL2", "MEP", "FCL3", "FCL4"]
+
+# Dias da semana com pedido quando não há linha em dias_semana_config
+# (cache.SnapshotDiasSemana).
+DIAS_PEDIDO = {0: "SEGUNDA-FEIRA", 1: "TERÇA-FEIRA", 2: "QUARTA-FEIRA", 4: "SEXTA-FEIRA", 5: "SÁBADO"}
@@ -8,6 +8,8 @@ import os
 import sqlite3
 import psycopg2
 
+from migrations import aplicar_migracoes
+
 def migrate_database():
     """Migra o banco de dados adicionando a tabela dias_semana_config"""
     
@@ -114,9 +116,15 @@ def migrate_database():
         
         # Commit das alterações
         conn.commit()
+        
+        # 5. Aplicar migrações versionadas (índices, novas tabelas)
+        print("\nAplicando migrações versionadas...")
+        novas_migracoes = aplicar_migracoes(conn, is_postgres)
+        
         print(f"\n✅ Migração concluída com sucesso!")
         print(f"   - {dias_inseridos} novos dias inseridos")
         print(f"   - {len(dias_config)} dias configurados no total")
+        print(f"   - {len(novas_migracoes)} migrações versionadas aplicadas")
         
         return True
         
@@ -0,0 +1,166 @@
+# migrations.py - Migrações versionadas do banco de dados
+"""
+Cada migração tem um número de versão e só é aplicada uma vez: as versões já
+aplicadas ficam registradas na tabela schema_migrations.
+
+É chamado pelo migrate_render.py (a cada deploy, pelo Procfile) e pelo
+init_db.py (banco local novo). Pode ser executado múltiplas vezes sem causar
+problemas.
+
+Para adicionar uma migração, acrescente uma tupla ao fim de MIGRACOES:
+    (versao, descricao, [comandos])
+Cada comando é uma string SQL igual nos dois bancos, ou um dicionário
+{'postgres': ..., 'sqlite': ...} quando a sintaxe muda.
+"""
+
+from datetime import datetime
+
+MIGRACOES = [
+    (1, "Índices para as consultas por data/loja em pedidos e por dia em product_availability", [
+        # index(), enviar_pedido() e o relatório filtram por data_pedido (e loja).
+        "CREATE INDEX IF NOT EXISTS idx_pedidos_data_loja_produto ON pedidos (data_pedido, loja, produto);",
+        # Toda consulta de catálogo filtra por day_id; a PK (product_id, day_id) não serve para isso.
+        "CREATE INDEX IF NOT EXISTS idx_product_availability_dia ON product_availability (day_id, product_id);",
+        # pedidos_finais não precisa de índice novo: o UNIQUE (data_pedido, produto_nome, loja_nome)
+        # já cria um índice com data_pedido na frente, que atende o filtro por data.
+        "ANALYZE;",
+    ]),
+    (2, "Chave única (data_pedido, loja, produto, tipo) em pedidos para gravar contagens com upsert", [
+        # Mantém só a linha mais recente de eventuais duplicatas antes de criar a chave única.
+        "DELETE FROM pedidos WHERE id NOT IN (SELECT MAX(id) FROM pedidos GROUP BY data_pedido, loja, produto, tipo);",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_pedidos_data_loja_produto_tipo ON pedidos (data_pedido, loja, produto, tipo);",
+        # O índice único começa com as mesmas colunas; o índice da migração 1 ficou redundante.
+        "DROP INDEX IF EXISTS idx_pedidos_data_loja_produto;",
+    ]),
+    (3, "Tabela cache_versao para invalidar os caches em memória de todos os workers", [
+        "CREATE TABLE IF NOT EXISTS cache_versao (nome TEXT PRIMARY KEY, versao INTEGER NOT NULL DEFAULT 0);",
+        {
+            'postgres': "INSERT INTO cache_versao (nome, versao) VALUES ('catalogo', 0) ON CONFLICT (nome) DO NOTHING;",
+            'sqlite': "INSERT OR IGNORE INTO cache_versao (nome, versao) VALUES ('catalogo', 0);",
+        },
+    ]),
+    (4, "Versão de cache para a configuração dos dias da semana", [
+        {
+            'postgres': "INSERT INTO cache_versao (nome, versao) VALUES ('dias_semana', 0) ON CONFLICT (nome) DO NOTHING;",
+            'sqlite': "INSERT OR IGNORE INTO cache_versao (nome, versao) VALUES ('dias_semana', 0);",
+        },
+    ]),
+    (5, "Tabela agregados_diarios (totais por dia, produto e loja) para o relatório por período", [
+        # No SQLite, WITHOUT ROWID guarda as linhas na ordem da chave: um período é uma leitura contígua.
+        {
+            'postgres': "CREATE TABLE IF NOT EXISTS agregados_diarios (data_pedido TEXT NOT NULL, produto TEXT NOT NULL, loja TEXT NOT NULL, caixas INTEGER NOT NULL DEFAULT 0, fracionado INTEGER NOT NULL DEFAULT 0, pedido_final INTEGER, custo NUMERIC(10, 2), PRIMARY KEY (data_pedido, produto, loja));",
+            'sqlite': "CREATE TABLE IF NOT EXISTS agregados_diarios (data_pedido TEXT NOT NULL, produto TEXT NOT NULL, loja TEXT NOT NULL, caixas INTEGER NOT NULL DEFAULT 0, fracionado INTEGER NOT NULL DEFAULT 0, pedido_final INTEGER, custo NUMERIC(10, 2), PRIMARY KEY (data_pedido, produto, loja)) WITHOUT ROWID;",
+        },
+        # Carga inicial a partir do histórico; o custo é o atual do produto (não há histórico de custos).
+        """
+        INSERT INTO agregados_diarios (data_pedido, produto, loja, caixas, fracionado, pedido_final, custo)
+        SELECT t.data_pedido, t.produto, t.loja, SUM(t.caixas), SUM(t.fracionado), MAX(t.pedido_final), MAX(p.cost)
+        FROM (
+            SELECT data_pedido, produto, loja,
+                   CASE WHEN tipo = 'Caixa' THEN quantidade ELSE 0 END AS caixas,
+                   CASE WHEN tipo IN ('KG', 'UN') THEN quantidade ELSE 0 END AS fracionado,
+                   CAST(NULL AS INTEGER) AS pedido_final
+            FROM pedidos
+            UNION ALL
+            SELECT data_pedido, produto_nome, loja_nome, 0, 0, quantidade_pedida
+            FROM pedidos_finais
+        ) t
+        LEFT JOIN products p ON p.name = t.produto
+        GROUP BY t.data_pedido, t.produto, t.loja;
+        """,
+    ]),
+    (6, "Tabela sync_chunks: partes já aplicadas de cada envio de custos (reenvio idempotente)", [
+        "CREATE TABLE IF NOT EXISTS sync_chunks (run_id TEXT NOT NULL, chunk INTEGER NOT NULL, resultado TEXT NOT NULL, recebido_em TEXT NOT NULL, PRIMARY KEY (run_id, chunk));",
+    ]),
+    (7, "Tabela product_cost_history: custo de cada produto por período de vigência", [
+        # Vigência [valid_from, valid_to) em datas 'AAAA-MM-DD'; valid_to NULL é o custo atual.
+        # A chave (product_id, valid_from) atende a busca do custo de uma data, produto a produto.
+        {
+            'postgres': "CREATE TABLE IF NOT EXISTS product_cost_history (product_id INTEGER NOT NULL, valid_from TEXT NOT NULL, valid_to TEXT, cost NUMERIC(10, 2), PRIMARY KEY (product_id, valid_from));",
+            'sqlite': "CREATE TABLE IF NOT EXISTS product_cost_history (product_id INTEGER NOT NULL, valid_from TEXT NOT NULL, valid_to TEXT, cost NUMERIC(10, 2), PRIMARY KEY (product_id, valid_from)) WITHOUT ROWID;",
+        },
+        # Não há histórico anterior: o custo atual vale desde sempre.
+        "INSERT INTO product_cost_history (product_id, valid_from, valid_to, cost) SELECT id, '0001-01-01', NULL, cost FROM products;",
+    ]),
+    (8, "Coluna valor_pedido (pedido final × custo) em agregados_diarios", [
+        "ALTER TABLE agregados_diarios ADD COLUMN valor_pedido NUMERIC(12, 2);",
+        "UPDATE agregados_diarios SET valor_pedido = ROUND(pedido_final * custo, 2) WHERE pedido_final IS NOT NULL AND custo IS NOT NULL;",
+    ]),
+    (9, "Tabela relatorio_versao: versão dos pedidos de cada data (ETag de /api/relatorio)", [
+        "CREATE TABLE IF NOT EXISTS relatorio_versao (data_pedido TEXT PRIMARY KEY, versao INTEGER NOT NULL DEFAULT 0);",
+    ]),
+    (10, "Tabela contagem_revisao: revisão da contagem de cada loja no dia (salvamento automático)", [
+        "CREATE TABLE IF NOT EXISTS contagem_revisao (data_pedido TEXT NOT NULL, loja TEXT NOT NULL, revisao INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (data_pedido, loja));",
+    ]),
+    (11, "Versão 'usuarios' em cache_versao (cache de usuários do login)", [
+        {
+            'postgres': "INSERT INTO cache_versao (nome, versao) VALUES ('usuarios', 0) ON CONFLICT (nome) DO NOTHING;",
+            'sqlite': "INSERT OR IGNORE INTO cache_versao (nome, versao) VALUES ('usuarios', 0);",
+        },
+    ]),
+    (12, "Tabela sugestoes_pedido: pedido sugerido por data, produto e loja (previsao.py)", [
+        {
+            'postgres': "CREATE TABLE IF NOT EXISTS sugestoes_pedido (data_pedido TEXT NOT NULL, produto TEXT NOT NULL, loja TEXT NOT NULL, pedido_previsto REAL, nivel REAL, semanas INTEGER NOT NULL DEFAULT 0, gerado_em TEXT NOT NULL, PRIMARY KEY (data_pedido, produto, loja));",
+            'sqlite': "CREATE TABLE IF NOT EXISTS sugestoes_pedido (data_pedido TEXT NOT NULL, produto TEXT NOT NULL, loja TEXT NOT NULL, pedido_previsto REAL, nivel REAL, semanas INTEGER NOT NULL DEFAULT 0, gerado_em TEXT NOT NULL, PRIMARY KEY (data_pedido, produto, loja)) WITHOUT ROWID;",
+        },
+    ]),
+    (13, "Tabela jobs: fila de tarefas em segundo plano (jobs.py / worker.py)", [
+        {
+            'postgres': "CREATE TABLE IF NOT EXISTS jobs (id SERIAL PRIMARY KEY, tipo TEXT NOT NULL, payload TEXT NOT NULL, chave TEXT, status TEXT NOT NULL DEFAULT 'pendente', tentativas INTEGER NOT NULL DEFAULT 0, max_tentativas INTEGER NOT NULL DEFAULT 3, disponivel_em TEXT NOT NULL, lease_ate TEXT, worker TEXT, resultado TEXT, arquivo BYTEA, erro TEXT, criado_em TEXT NOT NULL, atualizado_em TEXT NOT NULL);",
+            'sqlite': "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT NOT NULL, payload TEXT NOT NULL, chave TEXT, status TEXT NOT NULL DEFAULT 'pendente', tentativas INTEGER NOT NULL DEFAULT 0, max_tentativas INTEGER NOT NULL DEFAULT 3, disponivel_em TEXT NOT NULL, lease_ate TEXT, worker TEXT, resultado TEXT, arquivo BLOB, erro TEXT, criado_em TEXT NOT NULL, atualizado_em TEXT NOT NULL);",
+        },
+        "CREATE INDEX IF NOT EXISTS idx_jobs_fila ON jobs (status, disponivel_em);",
+        # Um job ativo por chave: enfileirar duas vezes a mesma tarefa devolve o mesmo job.
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_chave_ativa ON jobs (chave) WHERE status IN ('pendente', 'executando');",
+    ]),
+]
+
+
+def _criar_tabela_controle(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TEXT NOT NULL
+        );
+    """)
+
+
+def versoes_aplicadas(cur):
+    """Conjunto das versões já registradas em schema_migrations."""
+    _criar_tabela_controle(cur)
+    cur.execute("SELECT versao FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def aplicar_migracoes(conn, is_postgres):
+    """Aplica, em ordem, as migrações ainda não registradas. Retorna as versões aplicadas."""
+    cur = conn.cursor()
+    placeholder = '%s' if is_postgres else '?'
+    aplicadas = versoes_aplicadas(cur)
+    conn.commit()
+
+    novas = []
+    for versao, descricao, comandos in MIGRACOES:
+        if versao in aplicadas:
+            print(f"  ⏭️  Migração {versao} já aplicada")
+            continue
+        print(f"  ▶️  Aplicando migração {versao}: {descricao}")
+        try:
+            for comando in comandos:
+                if isinstance(comando, dict):
+                    comando = comando['postgres' if is_postgres else 'sqlite']
+                cur.execute(comando)
+            cur.execute(
+                f"INSERT INTO schema_migrations (versao, descricao, aplicada_em) VALUES ({placeholder}, {placeholder}, {placeholder});",
+                (versao, descricao, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        novas.append(versao)
+        print(f"  ✅ Migração {versao} aplicada")
+
+    cur.close()
+    return novas
@@ -0,0 +1,197 @@
+# pdf_pedido.py - PDF do pedido final (usado por /exportar-pedido-pdf)
+"""
+Monta a tabela produto x loja direto da lista de pedidos, sem pandas, e
+desenha o PDF com as fontes padrão do FPDF (Arial embutida, nada para
+carregar do disco).
+
+Com os custos dos produtos, o PDF traz também o valor estimado de cada
+produto e os totais por loja e geral (relatorio_engine.ValoresPedido).
+
+O arquivo gerado fica em cache no disco (PDF_CACHE_DIR), com nome formado
+pela data e por um hash do conteúdo da tabela: baixar de novo o mesmo pedido
+só devolve o arquivo pronto, e qualquer alteração no pedido gera outro hash.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+
+from fpdf import FPDF
+
+from relatorio_engine import ValoresPedido, formatar_reais
+
+# Muda quando o layout muda, para não servir PDFs antigos do cache.
+VERSAO_LAYOUT = 2
+
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hortifruti_pdf'))
+
+LARGURA_PRODUTO = 60
+LARGURA_LOJA = 18
+LARGURA_VALOR = 22
+TAMANHO_FONTE = 9
+
+
+class PDF(FPDF):
+    def __init__(self, orientation='P', unit='mm', format='A4', data_pedido=''):
+        super().__init__(orientation, unit, format)
+        self.data_pedido = data_pedido
+
+    def header(self):
+        self.set_font('Arial', 'B', 15)
+        self.cell(0, 10, 'Pedido de Hortifruti', 0, 1, 'C')
+        self.set_font('Arial', '', 10)
+        self.cell(0, 10, f'Pedido do Dia: {self.data_pedido}', 0, 1, 'C')
+        self.ln(5)
+
+
+@lru_cache(maxsize=2048)
+def _texto_pdf(texto):
+    """Texto em latin-1 (o que as fontes padrão do FPDF aceitam), guardado entre chamadas."""
+    try:
+        return texto.encode('latin-1', 'replace').decode('latin-1')
+    except Exception:
+        return 'Produto Invalido'
+
+
+@lru_cache(maxsize=8)
+def _cabecalho(lojas, com_valor):
+    """Larguras e títulos das colunas para uma tupla de lojas (e a coluna de valor, se houver)."""
+    larguras = [LARGURA_PRODUTO] + [LARGURA_LOJA] * len(lojas)
+    titulos = ['Produto'] + [_texto_pdf(loja) for loja in lojas]
+    if com_valor:
+        larguras.append(LARGURA_VALOR)
+        titulos.append('Valor')
+    return larguras, titulos
+
+
+def montar_tabela(pedidos, lojas):
+    """[(produto, [quantidade por loja])] ordenado por produto, a partir de (produto, loja, quantidade).
+
+    Quantidades do mesmo produto/loja são somadas; lojas fora de `lojas` são
+    ignoradas e produtos sem nenhuma quantidade positiva ficam de fora.
+    """
+    coluna = {loja: i for i, loja in enumerate(lojas)}
+    linhas = {}
+    for produto, loja, quantidade in pedidos:
+        i = coluna.get(loja)
+        if i is None:
+            continue
+        linha = linhas.get(produto)
+        if linha is None:
+            linha = linhas[produto] = [0] * len(lojas)
+        linha[i] += int(quantidade or 0)
+    return [(produto, linhas[produto]) for produto in sorted(linhas) if any(q > 0 for q in linhas[produto])]
+
+
+def de_json(pedido_data_str):
+    """Itens (produto, loja, quantidade) do JSON enviado pelo relatório: [{produto, loja, pedido}, ...]."""
+    return [(item['produto'], item['loja'], int(item['pedido'])) for item in json.loads(pedido_data_str)]
+
+
+def _custos_da_tabela(tabela, custos):
+    """Custo de cada produto da tabela, na ordem da tabela (None sem custos)."""
+    if custos is None:
+        return None
+    return [float(custos.get(produto) or 0) for produto, _ in tabela]
+
+
+def hash_conteudo(data_pedido, lojas, tabela, custos=None):
+    conteudo = json.dumps([VERSAO_LAYOUT, data_pedido, list(lojas), tabela, _custos_da_tabela(tabela, custos)],
+                          ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:16]
+
+
+def _valor_curto(valor):
+    """Valor sem o 'R$ ', para caber na coluna de uma loja."""
+    return formatar_reais(valor)[3:] if valor else ''
+
+
+def gerar_pdf(data_pedido, lojas, tabela, destino, custos=None):
+    """Desenha o PDF do pedido e grava em `destino` (caminho de arquivo).
+
+    `custos` ({produto: custo}) acrescenta a coluna de valor e a linha de totais.
+    """
+    pdf = PDF(orientation='P', unit='mm', format='A4', data_pedido=datetime.strptime(data_pedido, "%Y-%m-%d").strftime("%d/%m/%Y"))
+    pdf.add_page()
+    pdf.set_font('Arial', size=TAMANHO_FONTE)
+    line_height = pdf.font_size * 2
+    col_widths, headers = _cabecalho(tuple(lojas), custos is not None)
+    valores = None
+    if custos is not None and tabela:
+        valores = ValoresPedido([quantidades for _, quantidades in tabela], _custos_da_tabela(tabela, custos))
+
+    pdf.set_font('Arial', 'B', TAMANHO_FONTE)
+    for largura, header in zip(col_widths, headers):
+        pdf.cell(largura, line_height, header, border=1, align='C')
+    pdf.ln(line_height)
+
+    pdf.set_font('Arial', '', TAMANHO_FONTE)
+    for i, (produto, quantidades) in enumerate(tabela):
+        pdf.cell(col_widths[0], line_height, _texto_pdf(produto), border=1)
+        for largura, quantidade in zip(col_widths[1:], quantidades):
+            pdf.cell(largura, line_height, str(quantidade) if quantidade > 0 else '', border=1, align='C')
+        if valores is not None:
+            pdf.cell(LARGURA_VALOR, line_height, _valor_curto(valores.por_produto[i]), border=1, align='R')
+        pdf.ln(line_height)
+
+    if valores is not None:
+        pdf.set_font('Arial', 'B', TAMANHO_FONTE)
+        pdf.cell(col_widths[0], line_height, 'Valor do pedido (R$)', border=1)
+        for largura, valor in zip(col_widths[1:], valores.por_loja.tolist()):
+            pdf.cell(largura, line_height, _valor_curto(valor), border=1, align='C')
+        pdf.cell(LARGURA_VALOR, line_height, _valor_curto(valores.total), border=1, align='R')
+        pdf.ln(line_height)
+    pdf.output(destino)
+
+
+def abrir_pdf(data_pedido, lojas, tabela, custos=None):
+    """PDF do pedido aberto para leitura ('rb'), gerando o arquivo só se ainda não estiver no cache.
+
+    O arquivo é aberto antes de qualquer limpeza: se outra exportação do mesmo
+    dia apagar esta versão em seguida, o arquivo já aberto continua legível.
+    """
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    prefixo = f"pedido_{data_pedido}_"
+    caminho = os.path.join(PDF_CACHE_DIR, f"{prefixo}{hash_conteudo(data_pedido, lojas, tabela, custos)}.pdf")
+    try:
+        return open(caminho, 'rb')
+    except FileNotFoundError:
+        pass
+
+    # Grava num arquivo temporário e renomeia: outro worker nunca lê um PDF pela metade.
+    fd, temporario = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    arquivo = None
+    try:
+        gerar_pdf(data_pedido, lojas, tabela, temporario, custos)
+        if os.name == 'nt':
+            # No Windows um arquivo aberto não pode ser renomeado (nem apagado pela limpeza de outra requisição).
+            os.replace(temporario, caminho)
+            arquivo = open(caminho, 'rb')
+        else:
+            # Aberto antes do rename: o arquivo já é desta requisição quando aparece no cache.
+            arquivo = open(temporario, 'rb')
+            os.replace(temporario, caminho)
+    except Exception:
+        if arquivo is not None:
+            arquivo.close()
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+        raise
+
+    # Versões anteriores do pedido do mesmo dia não serão mais pedidas.
+    for nome in os.listdir(PDF_CACHE_DIR):
+        if nome.startswith(prefixo) and nome.endswith('.pdf') and os.path.join(PDF_CACHE_DIR, nome) != caminho:
+            try:
+                os.unlink(os.path.join(PDF_CACHE_DIR, nome))
+            except OSError:
+                # Já apagado por outra requisição, ou aberto por ela no Windows.
+                pass
+    return arquivo
+
+
+def nome_arquivo(data_pedido):
+    return f'pedido_hortifruti_{datetime.strptime(data_pedido, "%Y-%m-%d").strftime("%d-%m-%Y")}.pdf'
@@ -0,0 +1,174 @@
+# previsao.py - Sugestão do pedido de cada produto × loja a partir do histórico
+"""
+Para a data do pedido, olha as últimas SEMANAS ocorrências do mesmo dia da
+semana (o pedido de sábado segue o de outros sábados) em agregados_diarios,
+que já tem, por data, produto e loja, o que a loja contou em caixas e o pedido
+final salvo pelo admin. Semanas sem pedido final salvo não entram na conta.
+
+Duas médias exponenciais (peso ALFA na semana mais recente), calculadas com
+NumPy de uma vez para todas as células, em arrays semana × produto × loja:
+
+- pedido_previsto: média dos pedidos finais;
+- nivel: média de (pedido final + caixas contadas), o estoque que a loja
+  costuma ter depois de receber o pedido.
+
+No relatório, quando a loja já enviou a contagem do dia, a sugestão é
+nivel - caixas contadas (completa o estoque de costume); antes disso, é o
+pedido_previsto.
+
+As sugestões ficam em sugestoes_pedido (uma linha por célula, NULL quando não
+há histórico). O relatório só as lê; quem calcula é o cron:
+    python previsao.py                    # completa as de hoje e do próximo dia de pedido ativo
+    python previsao.py --data 2025-10-18  # recalcula a data inteira
+Salvar o pedido final de uma data apaga as sugestões das datas seguintes e
+enfileira o job `sugestoes` (tarefas.py) do próximo dia de pedido, que as
+recalcula com esse pedido no histórico.
+"""
+
+import argparse
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import cache
+import queries
+
+SEMANAS = int(os.environ.get('PREVISAO_SEMANAS', 12))
+ALFA = float(os.environ.get('PREVISAO_ALFA', 0.3))
+
+
+def datas_do_historico(data_pedido, semanas=SEMANAS):
+    """Mesmo dia da semana nas `semanas` anteriores, da mais recente para a mais antiga."""
+    dia = date.fromisoformat(data_pedido)
+    return [(dia - timedelta(weeks=k)).isoformat() for k in range(1, semanas + 1)]
+
+
+def carregar_historico(cursor, data_pedido, produtos, lojas, semanas=SEMANAS):
+    """Arrays (semana, produto, loja): pedidos finais (NaN sem pedido salvo) e caixas contadas."""
+    indice_produto = {nome: i for i, nome in enumerate(produtos)}
+    indice_loja = {loja: j for j, loja in enumerate(lojas)}
+    pedidos = np.full((semanas, len(produtos), len(lojas)), np.nan)
+    caixas = np.zeros((semanas, len(produtos), len(lojas)))
+    datas = datas_do_historico(data_pedido, semanas)
+    indice_semana = {data: k for k, data in enumerate(datas)}
+    # Todas as datas do período com o mesmo dia da semana são exatamente as do histórico.
+    dia_da_semana = (date.fromisoformat(data_pedido).weekday() + 1) % 7
+    queries.executar(cursor, 'historico_previsao', (datas[-1], datas[0], dia_da_semana))
+    linhas = [(indice_semana.get(str(data)), indice_produto.get(produto), indice_loja.get(loja), caixa, pedido)
+              for data, produto, loja, caixa, pedido in cursor.fetchall()]
+    linhas = [linha for linha in linhas if None not in linha[:3]]
+    if linhas:
+        k, i, j, caixa, pedido = (np.array(coluna) for coluna in zip(*linhas))
+        pedidos[k, i, j] = pedido.astype(np.float64)
+        caixas[k, i, j] = caixa.astype(np.float64)
+    return pedidos, caixas
+
+
+def ajustar(pedidos, caixas, alfa=ALFA):
+    """Médias exponenciais ao longo do eixo das semanas (0 = mais recente), ignorando as sem pedido.
+
+    Retorna (pedido_previsto, nivel, semanas_observadas), arrays produto × loja;
+    as médias são NaN onde não há nenhuma semana observada.
+    """
+    observada = ~np.isnan(pedidos)
+    pesos = (1.0 - alfa) ** np.arange(pedidos.shape[0], dtype=np.float64)
+    pesos = pesos[:, None, None] * observada
+    soma_pesos = pesos.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        previsto = (pesos * np.nan_to_num(pedidos)).sum(axis=0) / soma_pesos
+        nivel = (pesos * (np.nan_to_num(pedidos) + caixas)).sum(axis=0) / soma_pesos
+    return previsto, nivel, observada.sum(axis=0)
+
+
+def _ou_nulo(valor):
+    return None if np.isnan(valor) else round(float(valor), 2)
+
+
+def calcular_sugestoes(cursor, data_pedido, produtos, lojas):
+    """Calcula e grava as sugestões da data para todos os produtos × lojas. Chame antes do commit."""
+    pedidos, caixas = carregar_historico(cursor, data_pedido, produtos, lojas)
+    previsto, nivel, observadas = ajustar(pedidos, caixas)
+    gerado_em = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    linhas = [(data_pedido, produto, loja, _ou_nulo(previsto[i, j]), _ou_nulo(nivel[i, j]), int(observadas[i, j]), gerado_em)
+              for i, produto in enumerate(produtos) for j, loja in enumerate(lojas)]
+    queries.inserir_em_lote(cursor, 'gravar_sugestao', linhas)
+    cache.alterou_relatorio(cursor, data_pedido)
+    return len(linhas)
+
+
+def garantir_sugestoes(cursor, data_pedido, produtos, lojas):
+    """Calcula as sugestões da data se faltar alguma célula (data nova ou produto novo no dia).
+
+    Retorna True se gravou algo (quem chama faz o commit).
+    """
+    if not produtos:
+        return False
+    queries.executar(cursor, 'celulas_sugestoes_do_dia', (data_pedido,))
+    # Compara as células, não a contagem: trocar um produto do dia por outro mantém o total.
+    if {(produto, loja) for produto in produtos for loja in lojas} <= {tuple(linha) for linha in cursor.fetchall()}:
+        return False
+    calcular_sugestoes(cursor, data_pedido, produtos, lojas)
+    return True
+
+
+def descartar_seguintes(cursor, data_pedido):
+    """Apaga as sugestões das datas depois de `data_pedido` (o histórico delas mudou)."""
+    queries.executar(cursor, 'apagar_sugestoes_depois', (data_pedido,))
+
+
+# --- CLI (cron) ---
+
+def proximo_dia_ativo(cursor, a_partir_de):
+    """Primeira data a partir de `a_partir_de` em dia de pedido ativo (cache.dias_semana) e com produtos; None se não há."""
+    dias = cache.dias_semana.snapshot(cursor)
+    for k in range(7):
+        dia = a_partir_de + timedelta(days=k)
+        if dias.ativo(dia.weekday()) and cache.catalogo.produtos_do_dia(cursor, dia.weekday()):
+            return dia
+    return None
+
+
+def main():
+    from database import conexao
+    from lojas_config import LOJAS
+
+    parser = argparse.ArgumentParser(description="Calcula as sugestões de pedido de uma data.")
+    parser.add_argument('--data', help="data do pedido AAAA-MM-DD, recalculada inteira (padrão: completa as de hoje e do próximo dia de pedido ativo)")
+    args = parser.parse_args()
+
+    with conexao() as conn:
+        cursor = conn.cursor()
+        try:
+            if args.data:
+                dia = date.fromisoformat(args.data)
+                produtos = [p['nome'] for p in cache.catalogo.produtos_do_dia(cursor, dia.weekday())]
+                if not produtos:
+                    print(f"⚠️  Nenhum produto disponível em {dia.isoformat()}.")
+                    return
+                inicio = datetime.now()
+                total = calcular_sugestoes(cursor, dia.isoformat(), produtos, LOJAS)
+                conn.commit()
+                segundos = (datetime.now() - inicio).total_seconds()
+                print(f"✅ {total} sugestões calculadas para {dia.isoformat()} ({len(produtos)} produtos × {len(LOJAS)} lojas) em {segundos:.2f}s")
+                return
+            hoje = date.today()
+            proximo = proximo_dia_ativo(cursor, hoje + timedelta(days=1))
+            if proximo is None:
+                print("❌ Nenhum dia de pedido ativo.")
+                return
+            # Hoje só conta se for dia de pedido ativo (proximo_dia_ativo a partir de hoje devolve hoje).
+            dias = [hoje, proximo] if proximo_dia_ativo(cursor, hoje) == hoje else [proximo]
+            for dia in dias:
+                produtos = [p['nome'] for p in cache.catalogo.produtos_do_dia(cursor, dia.weekday())]
+                if garantir_sugestoes(cursor, dia.isoformat(), produtos, LOJAS):
+                    conn.commit()
+                    print(f"✅ Sugestões calculadas para {dia.isoformat()} ({len(produtos)} produtos × {len(LOJAS)} lojas)")
+                else:
+                    print(f"ℹ️  {dia.isoformat()}: sugestões já completas")
+        finally:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    main()
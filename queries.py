@@ -0,0 +1,237 @@
+# queries.py - Consultas nomeadas, traduzidas uma única vez para o banco ativo
+"""
+Cada consulta do app é escrita uma vez só, no dialeto do SQLite, e traduzida
+para o PostgreSQL na primeira vez que é usada:
+
+- placeholders `?` viram `%s`;
+- `GROUP_CONCAT(expr)` vira `STRING_AGG(CAST(expr AS TEXT), ',')`;
+- `INSERT OR IGNORE` vira `INSERT ... ON CONFLICT DO NOTHING`;
+- inserts marcados com `RETURNING id` devolvem o id via `RETURNING` no
+  PostgreSQL e via `cursor.lastrowid` no SQLite.
+
+Quando a tradução não basta (ex.: `FOR UPDATE SKIP LOCKED`, que o SQLite não
+tem), a versão do PostgreSQL fica em SQL_POSTGRES, com o mesmo nome.
+
+No PostgreSQL, as consultas de HOT_PATH são preparadas no servidor
+(`PREPARE`) uma vez por conexão do pool e depois chamadas com `EXECUTE`, sem
+planejar de novo a cada requisição. No SQLite o próprio módulo sqlite3 já
+guarda o statement compilado na conexão persistente de cada thread.
+"""
+
+import re
+
+from psycopg2.extras import execute_batch, execute_values
+
+from database import IS_POSTGRES
+
+SQL = {
+    # --- Catálogo ---
+    'produtos_do_dia': "SELECT p.id, p.name, p.unidade_fracionada, p.codigo_interno, p.cost FROM products p JOIN product_availability pa ON p.id = pa.product_id WHERE pa.day_id = ? ORDER BY p.name;",
+    'listar_produtos_admin': "SELECT p.id, p.name, p.unidade_fracionada, p.codigo_interno, GROUP_CONCAT(pa.day_id) as days_str FROM products p LEFT JOIN product_availability pa ON p.id = pa.product_id GROUP BY p.id, p.name, p.unidade_fracionada, p.codigo_interno ORDER BY p.name;",
+    'buscar_produto': "SELECT * FROM products WHERE id = ?;",
+    'inserir_produto': "INSERT INTO products (name, unidade_fracionada, codigo_interno) VALUES (?, ?, ?) RETURNING id;",
+    'atualizar_produto': "UPDATE products SET name = ?, unidade_fracionada = ?, codigo_interno = ? WHERE id = ?;",
+    'apagar_produto': "DELETE FROM products WHERE id = ?;",
+    'dias_do_produto': "SELECT day_id FROM product_availability WHERE product_id = ?;",
+    'inserir_disponibilidade': "INSERT INTO product_availability (product_id, day_id) VALUES (?, ?);",
+    'apagar_disponibilidade': "DELETE FROM product_availability WHERE product_id = ?;",
+    'custos_do_catalogo': "SELECT codigo_interno, cost FROM products WHERE codigo_interno IS NOT NULL AND codigo_interno <> '';",
+
+    # --- Histórico de custos (product_cost_history) ---
+    # iniciar/fechar/abrir usam a tabela temporária custos_novos de custos.aplicar_custos().
+    'iniciar_historico_custos': "INSERT INTO product_cost_history (product_id, valid_from, valid_to, cost) SELECT p.id, '0001-01-01', ?, p.cost FROM custos_novos n JOIN products p ON p.codigo_interno = n.codigo_interno WHERE (p.cost IS NULL OR p.cost <> n.custo) AND NOT EXISTS (SELECT 1 FROM product_cost_history h WHERE h.product_id = p.id);",
+    'fechar_historico_custos': "UPDATE product_cost_history SET valid_to = ? WHERE valid_to IS NULL AND valid_from < ? AND product_id IN (SELECT p.id FROM custos_novos n JOIN products p ON p.codigo_interno = n.codigo_interno WHERE p.cost IS NULL OR p.cost <> n.custo);",
+    'abrir_historico_custos': "INSERT INTO product_cost_history (product_id, valid_from, valid_to, cost) SELECT p.id, ?, NULL, n.custo FROM custos_novos n JOIN products p ON p.codigo_interno = n.codigo_interno WHERE p.cost IS NULL OR p.cost <> n.custo ON CONFLICT (product_id, valid_from) DO UPDATE SET cost = excluded.cost, valid_to = NULL;",
+    'custos_do_dia_na_data': "SELECT h.product_id, h.cost FROM product_availability pa JOIN product_cost_history h ON h.product_id = pa.product_id AND h.valid_from <= ? AND (h.valid_to IS NULL OR h.valid_to > ?) WHERE pa.day_id = ?;",
+    'historico_custo_produto': "SELECT valid_from, valid_to, cost FROM product_cost_history WHERE product_id = ? ORDER BY valid_from;",
+    'apagar_historico_custos': "DELETE FROM product_cost_history WHERE product_id = ?;",
+
+    # --- Versões dos caches em memória (cache.py) ---
+    'versoes_cache': "SELECT nome, versao FROM cache_versao;",
+    'incrementar_versao_cache': "UPDATE cache_versao SET versao = versao + 1 WHERE nome = ?;",
+    'versao_relatorio': "SELECT versao FROM relatorio_versao WHERE data_pedido = ?;",
+    'incrementar_versao_relatorio': "INSERT INTO relatorio_versao (data_pedido, versao) VALUES (?, 1) ON CONFLICT (data_pedido) DO UPDATE SET versao = relatorio_versao.versao + 1;",
+
+    # --- Dias da semana ---
+    'buscar_dia_semana': "SELECT ativo, nome_dia FROM dias_semana_config WHERE dia_id = ?;",
+    'listar_dias_semana': "SELECT dia_id, nome_dia, ativo FROM dias_semana_config ORDER BY dia_id;",
+    'atualizar_dia_semana': "UPDATE dias_semana_config SET ativo = ? WHERE dia_id = ?;",
+
+    # --- Pedidos das lojas ---
+    'pedidos_da_loja': "SELECT produto, tipo, quantidade FROM pedidos WHERE data_pedido = ? AND loja = ?;",
+    'totais_pedidos_do_dia': "SELECT produto, loja, tipo, SUM(quantidade) FROM pedidos WHERE data_pedido = ? GROUP BY produto, loja, tipo;",
+    'gravar_pedido': "INSERT INTO pedidos (data_pedido, loja, produto, tipo, quantidade) VALUES (?, ?, ?, ?, ?) ON CONFLICT (data_pedido, loja, produto, tipo) DO UPDATE SET quantidade = excluded.quantidade;",
+    'apagar_pedido': "DELETE FROM pedidos WHERE data_pedido = ? AND loja = ? AND produto = ? AND tipo = ?;",
+
+    # --- Sugestões de pedido (previsao.py) ---
+    # Todas as semanas do histórico numa consulta: o período inteiro, só o dia da semana do pedido (0 = domingo).
+    'historico_previsao': "SELECT data_pedido, produto, loja, caixas, pedido_final FROM agregados_diarios WHERE data_pedido BETWEEN ? AND ? AND CAST(strftime('%w', data_pedido) AS INTEGER) = ? AND pedido_final IS NOT NULL;",
+    'gravar_sugestao': "INSERT INTO sugestoes_pedido (data_pedido, produto, loja, pedido_previsto, nivel, semanas, gerado_em) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (data_pedido, produto, loja) DO UPDATE SET pedido_previsto = excluded.pedido_previsto, nivel = excluded.nivel, semanas = excluded.semanas, gerado_em = excluded.gerado_em;",
+    'celulas_sugestoes_do_dia': "SELECT produto, loja FROM sugestoes_pedido WHERE data_pedido = ?;",
+    'sugestoes_do_dia': "SELECT produto, loja, pedido_previsto, nivel FROM sugestoes_pedido WHERE data_pedido = ?;",
+    'apagar_sugestoes_depois': "DELETE FROM sugestoes_pedido WHERE data_pedido > ?;",
+
+    # --- Revisão da contagem (salvamento automático) ---
+    'revisao_contagem': "SELECT revisao FROM contagem_revisao WHERE data_pedido = ? AND loja = ?;",
+    # Trava a linha da loja até o commit (no SQLite a transação de escrita já é exclusiva).
+    'travar_revisao_contagem': "SELECT revisao FROM contagem_revisao WHERE data_pedido = ? AND loja = ?;",
+    'iniciar_revisao_contagem': "INSERT INTO contagem_revisao (data_pedido, loja, revisao) VALUES (?, ?, 0) ON CONFLICT (data_pedido, loja) DO NOTHING;",
+    # Só avança se o cliente partiu da revisão atual; 0 linhas afetadas = revisão velha.
+    'avancar_revisao_contagem': "UPDATE contagem_revisao SET revisao = revisao + 1 WHERE data_pedido = ? AND loja = ? AND revisao = ?;",
+    'incrementar_revisao_contagem': "INSERT INTO contagem_revisao (data_pedido, loja, revisao) VALUES (?, ?, 1) ON CONFLICT (data_pedido, loja) DO UPDATE SET revisao = contagem_revisao.revisao + 1;",
+
+    # --- Pedido final (admin) ---
+    'pedidos_finais_do_dia': "SELECT produto_nome, loja_nome, quantidade_pedida FROM pedidos_finais WHERE data_pedido = ?;",
+    'apagar_pedidos_finais': "DELETE FROM pedidos_finais WHERE data_pedido = ?;",
+    'inserir_pedido_final': "INSERT INTO pedidos_finais (data_pedido, produto_nome, loja_nome, quantidade_pedida) VALUES (?, ?, ?, ?);",
+
+    # --- Totais diários (agregados.py) ---
+    'gravar_agregado_contagem': "INSERT INTO agregados_diarios (data_pedido, produto, loja, caixas, fracionado, custo) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (data_pedido, produto, loja) DO UPDATE SET caixas = excluded.caixas, fracionado = excluded.fracionado, custo = COALESCE(excluded.custo, agregados_diarios.custo), valor_pedido = ROUND(agregados_diarios.pedido_final * COALESCE(excluded.custo, agregados_diarios.custo), 2);",
+    'limpar_agregados_pedido_final': "UPDATE agregados_diarios SET pedido_final = NULL, valor_pedido = NULL WHERE data_pedido = ? AND pedido_final IS NOT NULL;",
+    'gravar_agregado_pedido_final': "INSERT INTO agregados_diarios (data_pedido, produto, loja, pedido_final, custo, valor_pedido) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (data_pedido, produto, loja) DO UPDATE SET pedido_final = excluded.pedido_final, custo = COALESCE(excluded.custo, agregados_diarios.custo), valor_pedido = ROUND(excluded.pedido_final * COALESCE(excluded.custo, agregados_diarios.custo), 2);",
+    'agregados_por_dia': "SELECT data_pedido, produto, loja, SUM(caixas), SUM(fracionado), SUM(pedido_final), SUM(valor_pedido) FROM agregados_diarios WHERE data_pedido BETWEEN ? AND ? GROUP BY data_pedido, produto, loja;",
+    'agregados_por_mes': "SELECT SUBSTR(data_pedido, 1, 7), produto, loja, SUM(caixas), SUM(fracionado), SUM(pedido_final), SUM(valor_pedido) FROM agregados_diarios WHERE data_pedido BETWEEN ? AND ? GROUP BY SUBSTR(data_pedido, 1, 7), produto, loja;",
+    'agregados_do_periodo': "SELECT produto, loja, SUM(caixas), SUM(fracionado), SUM(pedido_final), SUM(valor_pedido) FROM agregados_diarios WHERE data_pedido BETWEEN ? AND ? GROUP BY produto, loja;",
+    'valor_por_loja_na_data': "SELECT loja, SUM(valor_pedido), COUNT(pedido_final) FROM agregados_diarios WHERE data_pedido = ? GROUP BY loja;",
+    # Reconstrução de um período a partir de pedidos e pedidos_finais, com o custo vigente em cada data (tarefas.py).
+    'apagar_agregados_periodo': "DELETE FROM agregados_diarios WHERE data_pedido BETWEEN ? AND ?;",
+    'reconstruir_agregados_periodo': "INSERT INTO agregados_diarios (data_pedido, produto, loja, caixas, fracionado, pedido_final, custo, valor_pedido) SELECT a.data_pedido, a.produto, a.loja, a.caixas, a.fracionado, a.pedido_final, a.custo, ROUND(a.pedido_final * a.custo, 2) FROM (SELECT t.data_pedido, t.produto, t.loja, SUM(t.caixas) AS caixas, SUM(t.fracionado) AS fracionado, MAX(t.pedido_final) AS pedido_final, MAX(COALESCE(h.cost, p.cost)) AS custo FROM (SELECT data_pedido, produto, loja, CASE WHEN tipo = 'Caixa' THEN quantidade ELSE 0 END AS caixas, CASE WHEN tipo IN ('KG', 'UN') THEN quantidade ELSE 0 END AS fracionado, CAST(NULL AS INTEGER) AS pedido_final FROM pedidos WHERE data_pedido BETWEEN ? AND ? UNION ALL SELECT data_pedido, produto_nome, loja_nome, 0, 0, quantidade_pedida FROM pedidos_finais WHERE data_pedido BETWEEN ? AND ?) t LEFT JOIN products p ON p.name = t.produto LEFT JOIN product_cost_history h ON h.product_id = p.id AND h.valid_from <= t.data_pedido AND (h.valid_to IS NULL OR h.valid_to > t.data_pedido) GROUP BY t.data_pedido, t.produto, t.loja) a;",
+
+    # --- Envio de custos em partes (sync_chunks) ---
+    'buscar_chunk_sync': "SELECT resultado FROM sync_chunks WHERE run_id = ? AND chunk = ?;",
+    'registrar_chunk_sync': "INSERT INTO sync_chunks (run_id, chunk, resultado, recebido_em) VALUES (?, ?, ?, ?);",
+    'limpar_chunks_sync': "DELETE FROM sync_chunks WHERE recebido_em < ?;",
+
+    # --- Fila de tarefas (jobs.py) ---
+    'criar_job': "INSERT INTO jobs (tipo, payload, chave, max_tentativas, disponivel_em, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id;",
+    # Com chave: não cria outro se já houver um job ativo com a mesma chave (uq_jobs_chave_ativa).
+    'criar_job_unico': "INSERT OR IGNORE INTO jobs (tipo, payload, chave, max_tentativas, disponivel_em, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?);",
+    'job_ativo_por_chave': "SELECT id FROM jobs WHERE chave = ? AND status IN ('pendente', 'executando');",
+    # Pega o próximo job disponível (ou um cuja lease venceu) num único UPDATE atômico.
+    # No PostgreSQL a versão de SQL_POSTGRES pula as linhas travadas por outro worker.
+    'reservar_job': "UPDATE jobs SET status = 'executando', worker = ?, lease_ate = ?, tentativas = tentativas + 1, atualizado_em = ? WHERE id = (SELECT id FROM jobs WHERE (status = 'pendente' AND disponivel_em <= ?) OR (status = 'executando' AND lease_ate < ? AND tentativas < max_tentativas) ORDER BY disponivel_em, id LIMIT 1) RETURNING id, tipo, payload, tentativas, max_tentativas;",
+    'expirar_jobs': "UPDATE jobs SET status = 'falhou', erro = 'lease expirada sem conclusão', lease_ate = NULL, atualizado_em = ? WHERE status = 'executando' AND lease_ate < ? AND tentativas >= max_tentativas;",
+    # concluir/reagendar/falhar só valem se o worker ainda tem a lease do job.
+    'concluir_job': "UPDATE jobs SET status = 'concluido', resultado = ?, arquivo = ?, erro = NULL, lease_ate = NULL, atualizado_em = ? WHERE id = ? AND worker = ? AND status = 'executando';",
+    'reagendar_job': "UPDATE jobs SET status = 'pendente', erro = ?, disponivel_em = ?, lease_ate = NULL, atualizado_em = ? WHERE id = ? AND worker = ? AND status = 'executando';",
+    'falhar_job': "UPDATE jobs SET status = 'falhou', erro = ?, lease_ate = NULL, atualizado_em = ? WHERE id = ? AND worker = ? AND status = 'executando';",
+    'buscar_job': "SELECT id, tipo, status, tentativas, max_tentativas, resultado, erro, criado_em, atualizado_em, arquivo IS NOT NULL FROM jobs WHERE id = ?;",
+    'arquivo_job': "SELECT arquivo, resultado FROM jobs WHERE id = ? AND status = 'concluido';",
+    'limpar_jobs': "DELETE FROM jobs WHERE status IN ('concluido', 'falhou') AND atualizado_em < ?;",
+
+    # --- Usuários ---
+    'usuario_por_nome': "SELECT username, password, role, store_name FROM users WHERE username = ?;",
+    # Só troca a senha se ela ainda for a que foi conferida no login.
+    'atualizar_senha_usuario': "UPDATE users SET password = ? WHERE username = ? AND password = ?;",
+    'listar_usuarios_loja': "SELECT username, store_name, role FROM users WHERE role = 'loja' ORDER BY store_name;",
+}
+
+# Versões específicas do PostgreSQL, usadas no lugar da tradução automática.
+SQL_POSTGRES = {
+    'historico_previsao': "SELECT data_pedido, produto, loja, caixas, pedido_final FROM agregados_diarios WHERE data_pedido BETWEEN %s AND %s AND EXTRACT(DOW FROM CAST(data_pedido AS DATE)) = %s AND pedido_final IS NOT NULL;",
+    'travar_revisao_contagem': "SELECT revisao FROM contagem_revisao WHERE data_pedido = %s AND loja = %s FOR UPDATE;",
+    # FOR UPDATE SKIP LOCKED: dois workers nunca esperam um pelo outro nem pegam o mesmo job.
+    'reservar_job': "UPDATE jobs SET status = 'executando', worker = %s, lease_ate = %s, tentativas = tentativas + 1, atualizado_em = %s WHERE id = (SELECT id FROM jobs WHERE (status = 'pendente' AND disponivel_em <= %s) OR (status = 'executando' AND lease_ate < %s AND tentativas < max_tentativas) ORDER BY disponivel_em, id LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING id, tipo, payload, tentativas, max_tentativas;",
+}
+
+# Consultas executadas em quase toda requisição: preparadas no servidor (PostgreSQL).
+HOT_PATH = {'versoes_cache', 'versao_relatorio', 'produtos_do_dia', 'pedidos_da_loja', 'totais_pedidos_do_dia', 'pedidos_finais_do_dia'}
+
+_GROUP_CONCAT = re.compile(r"GROUP_CONCAT\(([^()]+)\)")
+_VALUES = re.compile(r"VALUES \([^()]*\)")
+_RETURNING_ID = re.compile(r"\s+RETURNING id\s*;?\s*$")
+
+_traduzidas = {}
+_preparadas = {}
+
+
+def _para_postgres(sql):
+    sql = sql.replace('%', '%%').replace('?', '%s')
+    sql = _GROUP_CONCAT.sub(r"STRING_AGG(CAST(\1 AS TEXT), ',')", sql)
+    if sql.startswith('INSERT OR IGNORE'):
+        sql = sql.replace('INSERT OR IGNORE', 'INSERT', 1).rstrip(' ;') + ' ON CONFLICT DO NOTHING;'
+    return sql
+
+
+def _para_sqlite(sql):
+    return _RETURNING_ID.sub(';', sql)
+
+
+def sql(nome):
+    """Texto da consulta `nome` já no dialeto do banco ativo (traduzido uma vez e guardado)."""
+    texto = _traduzidas.get(nome)
+    if texto is None:
+        if IS_POSTGRES:
+            texto = SQL_POSTGRES.get(nome) or _para_postgres(SQL[nome])
+        else:
+            texto = _para_sqlite(SQL[nome])
+        _traduzidas[nome] = texto
+    return texto
+
+
+def _comando_prepare(nome):
+    """`PREPARE` da consulta com os parâmetros numerados ($1, $2...) e o `EXECUTE` correspondente."""
+    if nome not in _preparadas:
+        partes = SQL[nome].rstrip(' ;').split('?')
+        texto = partes[0] + ''.join(f"${i}{parte}" for i, parte in enumerate(partes[1:], start=1))
+        parametros = ', '.join(['%s'] * (len(partes) - 1))
+        _preparadas[nome] = (f"PREPARE {nome} AS {texto};", f"EXECUTE {nome} ({parametros});" if parametros else f"EXECUTE {nome};")
+    return _preparadas[nome]
+
+
+def executar(cursor, nome, params=()):
+    """Executa a consulta nomeada no cursor, usando o statement preparado quando houver."""
+    if IS_POSTGRES and nome in HOT_PATH:
+        conn = cursor.connection
+        prepare, execute = _comando_prepare(nome)
+        if nome not in conn.preparadas:
+            cursor.execute(prepare)
+            conn.preparadas.add(nome)
+        cursor.execute(execute, params)
+    else:
+        cursor.execute(sql(nome), params)
+    return cursor
+
+
+def executar_varios(cursor, nome, seq_params):
+    """Executa a consulta nomeada para cada conjunto de parâmetros.
+
+    No PostgreSQL usa execute_batch, que manda vários comandos por ida ao
+    servidor em vez de um por linha como o executemany do psycopg2.
+    """
+    if IS_POSTGRES:
+        execute_batch(cursor, sql(nome), seq_params, page_size=200)
+    else:
+        cursor.executemany(sql(nome), seq_params)
+    return cursor
+
+
+def inserir_em_lote(cursor, nome, linhas):
+    """INSERT (ou upsert) de várias linhas de uma vez.
+
+    No PostgreSQL vira um único `INSERT ... VALUES (...), (...), ...` com
+    execute_values; no SQLite, que roda local, um executemany.
+    """
+    if not linhas:
+        return cursor
+    if IS_POSTGRES:
+        execute_values(cursor, _VALUES.sub('VALUES %s', sql(nome), count=1), linhas, page_size=500)
+    else:
+        cursor.executemany(sql(nome), linhas)
+    return cursor
+
+
+def inserir(cursor, nome, params):
+    """Executa um INSERT marcado com `RETURNING id` e devolve o id da nova linha."""
+    cursor.execute(sql(nome), params)
+    if IS_POSTGRES:
+        return cursor.fetchone()[0]
+    return cursor.lastrowid
+
+
+def como_dicts(cursor, linhas=None):
+    """Linhas do último SELECT como dicionários {coluna: valor}."""
+    if linhas is None:
+        linhas = cursor.fetchall()
+    colunas = [desc[0] for desc in cursor.description]
+    return [dict(zip(colunas, linha)) for linha in linhas]
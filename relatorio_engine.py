@@ -0,0 +1,173 @@
+# relatorio_engine.py - Agregação do relatório de contagem sem pandas
+"""
+Monta a grade produto × loja do relatório a partir de um único
+`SELECT ... GROUP BY produto, loja, tipo` e dos pedidos finais do dia.
+
+Os totais ficam num array denso indexado por (tipo, produto, loja), o que evita
+os pivot_tables do pandas e as buscas `.loc` célula a célula.
+
+O valor estimado do pedido (pedido final × custo) é calculado sobre a mesma
+grade, de uma vez para todas as células, e somado por produto, por loja e no
+total. A sugestão de pedido (previsao.py) também: nivel - caixas para as
+lojas que já contaram, pedido previsto para as demais.
+"""
+
+import numpy as np
+
+import queries
+
+CAIXA = 0
+FRACIONADO = 1
+TIPOS_FRACIONADOS = ('KG', 'UN')
+
+# Valor usado na grade de pedidos finais para "nenhum pedido salvo".
+SEM_PEDIDO = -1
+
+
+class GradeRelatorio:
+    """Quantidades de um dia em arrays densos.
+
+    - `contagem[tipo, i, j]`: soma contada pela loja j para o produto i
+      (tipo CAIXA ou FRACIONADO);
+    - `pedido[i, j]`: quantidade do pedido final salvo, ou SEM_PEDIDO;
+    - `previsto[i, j]` e `nivel[i, j]`: sugestões de previsao.py (NaN sem histórico).
+    """
+
+    def __init__(self, produtos, lojas):
+        self.produtos = produtos
+        self.lojas = lojas
+        self.indice_produto = {p['nome']: i for i, p in enumerate(produtos)}
+        self.indice_loja = {loja: j for j, loja in enumerate(lojas)}
+        self.contagem = np.zeros((2, len(produtos), len(lojas)), dtype=np.int64)
+        self.pedido = np.full((len(produtos), len(lojas)), SEM_PEDIDO, dtype=np.int64)
+        self.previsto = np.full((len(produtos), len(lojas)), np.nan)
+        self.nivel = np.full((len(produtos), len(lojas)), np.nan)
+
+    def _posicao(self, produto, loja):
+        i = self.indice_produto.get(produto)
+        j = self.indice_loja.get(loja)
+        if i is None or j is None:
+            return None
+        return i, j
+
+    def somar_contagens(self, linhas):
+        """Acumula linhas (produto, loja, tipo, quantidade) vindas do GROUP BY."""
+        for produto, loja, tipo, quantidade in linhas:
+            if tipo == 'Caixa':
+                t = CAIXA
+            elif tipo in TIPOS_FRACIONADOS:
+                t = FRACIONADO
+            else:
+                continue
+            pos = self._posicao(produto, loja)
+            if pos is not None:
+                self.contagem[t, pos[0], pos[1]] += int(quantidade)
+
+    def preencher_pedidos(self, linhas):
+        """Grava linhas (produto_nome, loja_nome, quantidade_pedida) dos pedidos finais."""
+        for produto, loja, quantidade in linhas:
+            pos = self._posicao(produto, loja)
+            if pos is not None:
+                self.pedido[pos] = int(quantidade)
+
+    def preencher_sugestoes(self, linhas):
+        """Grava linhas (produto, loja, pedido_previsto, nivel) de sugestoes_pedido."""
+        for produto, loja, previsto, nivel in linhas:
+            pos = self._posicao(produto, loja)
+            if pos is not None:
+                self.previsto[pos] = np.nan if previsto is None else float(previsto)
+                self.nivel[pos] = np.nan if nivel is None else float(nivel)
+
+
+def carregar_grade(cursor, data_str, produtos, lojas):
+    """Lê as contagens e os pedidos finais de `data_str` para os produtos e lojas informados."""
+    grade = GradeRelatorio(produtos, lojas)
+    queries.executar(cursor, 'totais_pedidos_do_dia', (data_str,))
+    grade.somar_contagens(cursor.fetchall())
+    queries.executar(cursor, 'pedidos_finais_do_dia', (data_str,))
+    grade.preencher_pedidos(cursor.fetchall())
+    queries.executar(cursor, 'sugestoes_do_dia', (data_str,))
+    grade.preencher_sugestoes(cursor.fetchall())
+    return grade
+
+
+def calcular_sugestoes(grade):
+    """Pedido sugerido por célula (SEM_PEDIDO quando não há sugestão).
+
+    Nas lojas que já enviaram a contagem do dia, completa o estoque de costume
+    (nivel - caixas contadas); nas outras, usa o pedido previsto.
+    """
+    contou = grade.contagem.sum(axis=(0, 1)) > 0
+    com_nivel = contou[None, :] & ~np.isnan(grade.nivel)
+    sugestao = np.where(com_nivel, np.maximum(grade.nivel - grade.contagem[CAIXA], 0), grade.previsto)
+    return np.where(np.isnan(sugestao), SEM_PEDIDO, np.rint(sugestao)).astype(np.int64)
+
+
+class ValoresPedido:
+    """Valor estimado do pedido: `celulas[i, j]` = quantidade × custo do produto i na loja j."""
+
+    def __init__(self, quantidades, custos):
+        self.celulas = np.asarray(quantidades, dtype=np.float64) * np.asarray(custos, dtype=np.float64)[:, None]
+        self.por_produto = self.celulas.sum(axis=1)
+        self.por_loja = self.celulas.sum(axis=0)
+        self.total = float(self.celulas.sum())
+
+
+def formatar_reais(valor):
+    """'R$ 1.234,56'."""
+    return "R$ " + f"{valor:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def custos_da_grade(grade):
+    return np.fromiter((float(p.get('custo') or 0) for p in grade.produtos), dtype=np.float64, count=len(grade.produtos))
+
+
+def calcular_valores(grade):
+    """Valores do pedido final salvo na grade (células sem pedido valem zero)."""
+    quantidades = np.where(grade.pedido == SEM_PEDIDO, 0, grade.pedido)
+    return ValoresPedido(quantidades, custos_da_grade(grade))
+
+
+def montar_totais(grade, valores):
+    """Totais do pedido por loja e geral, no formato usado pelo template e pela API."""
+    return {
+        "por_loja": [{"nome": loja, "valor": round(v, 2), "valor_fmt": formatar_reais(v)}
+                     for loja, v in zip(grade.lojas, valores.por_loja.tolist())],
+        "total": round(valores.total, 2),
+        "total_fmt": formatar_reais(valores.total),
+    }
+
+
+def montar_report_data(grade, valores=None):
+    """Converte a grade na lista `report_data` usada pelo template relatorio.html."""
+    if valores is None:
+        valores = calcular_valores(grade)
+    caixas = grade.contagem[CAIXA].tolist()
+    fracionados = grade.contagem[FRACIONADO].tolist()
+    pedidos = grade.pedido.tolist()
+    sugestoes = calcular_sugestoes(grade).tolist()
+    niveis = np.where(np.isnan(grade.nivel), None, np.round(grade.nivel, 2)).tolist()
+    custos = custos_da_grade(grade).tolist()
+    valor_produto = valores.por_produto.tolist()
+    report_data = []
+    for i, produto in enumerate(grade.produtos):
+        produto_nome = produto['nome']
+        unidade = produto['unidade_fracionada'].lower()
+        id_base = produto_nome.replace(' ', '_').replace('.', '')
+        produto_row = {"produto_nome": produto_nome, "custo": f"R$ {produto['custo']:.2f}".replace('.', ','),
+                       "custo_valor": custos[i], "valor_pedido": round(valor_produto[i], 2),
+                       "valor_pedido_fmt": formatar_reais(valor_produto[i]), "lojas": []}
+        for j, loja_nome in enumerate(grade.lojas):
+            fracao_val = fracionados[i][j]
+            pedido_salvo = pedidos[i][j]
+            produto_row["lojas"].append({
+                "nome": loja_nome,
+                "caixa": caixas[i][j],
+                "fracao": f"{fracao_val} {unidade}" if fracao_val > 0 else "0",
+                "pedido_id": f"pedido_{id_base}_{loja_nome}",
+                "pedido_salvo": pedido_salvo if pedido_salvo != SEM_PEDIDO else '',
+                "sugestao": sugestoes[i][j] if sugestoes[i][j] != SEM_PEDIDO else '',
+                "nivel": niveis[i][j],
+            })
+        report_data.append(produto_row)
+    return report_data
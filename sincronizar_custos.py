@@ -1,12 +1,42 @@
 # sincronizar_custos.py
+"""
+Sincroniza os custos do DB2 com o app, enviando só o que mudou.
+
+O último estado enviado fica em SNAPSHOT_FILE ({codigo_interno: custo} dos
+produtos do app, com o hash desse conteúdo e um resumo do DB2). A cada
+execução:
+
+1. pergunta ao app a assinatura do catálogo (/api/catalog-fingerprint), uma
+   requisição pequena;
+2. consulta no DB2 só um resumo (quantidade, soma dos custos e somas dos
+   custos ponderadas pelo código, que mudam quando custos trocam de código);
+3. se os dois batem com o snapshot, nada mudou e o script termina;
+4. senão, lê os custos do DB2 em lotes (fetchmany) e, conforme lê, envia para
+   /api/update-costs apenas os códigos cujo custo é diferente do que o app
+   tem, em partes (envio_custos.py). A memória usada não cresce com o
+   tamanho do catálogo do DB2.
+
+Cada execução acrescenta um registro ao diário (diario_sincronizacao.py), com
+os tempos de cada fase, as contagens e as alterações de custo aplicadas.
+
+Uso:
+    python sincronizar_custos.py          # envio incremental
+    python sincronizar_custos.py --full   # ignora o snapshot e envia todos os custos
+"""
+import argparse
+import hashlib
 import os
+import time
+import uuid
 import pyodbc
 import requests
 import json
-import psycopg2 # Precisamos para conectar ao nosso BD e verificar os códigos
 from dotenv import load_dotenv
 from datetime import datetime
 
+import diario_sincronizacao
+from envio_custos import EnviadorCustos
+
 # Carrega as variáveis do arquivo .env
 load_dotenv()
 
@@ -19,136 +49,255 @@ DB2_PASSWORD = os.getenv('DB2_PASSWORD')
 
 RENDER_APP_URL = os.getenv('RENDER_APP_URL')
 API_SECRET_KEY = os.getenv('API_SECRET_KEY')
-POSTGRES_URL = os.getenv('DATABASE_URL') # URL do nosso banco de dados na Render
 
-LOG_FILE = "sincronizacao_log.txt"
+SNAPSHOT_FILE = os.getenv('SYNC_SNAPSHOT_FILE', "custos_enviados.json")
+
+# Filtro dos produtos de hortifruti no DB2 (seção 44, exceto o grupo 4410)
+SQL_FROM_DB2 = """
+    FROM DBA.PRODUTO AS A
+    LEFT JOIN DBA.PRODUTO_GRADE AS B ON (A.IDPRODUTO = B.IDPRODUTO)
+    LEFT JOIN DBA.SECAO AS C ON (A.IDSECAO = C.IDSECAO)
+    LEFT JOIN DBA.PRODUTO_CADEIA_PRECO AS D ON (B.IDCADEIAPRECO = D.IDCADEIAPRECO)
+    LEFT JOIN DBA.POLITICA_PRECO_PRODUTO AS E ON (B.IDPRODUTO = E.IDPRODUTO AND B.IDSUBPRODUTO = E.IDSUBPRODUTO AND E.IDEMPRESA = 1)
+    WHERE B.FLAGINATIVO = 'F' AND A.IDSECAO = 44 AND A.IDGRUPO <> 4410
+"""
 
-def get_existing_codes_from_app():
-    """Busca todos os códigos internos existentes no banco de dados do nosso app."""
-    if not POSTGRES_URL:
-        print("ERRO: Variavel DATABASE_URL nao encontrada no .env. Nao e possivel verificar os codigos existentes.")
-        return set() # Retorna um conjunto vazio
+SQL_CUSTOS_DB2 = "SELECT B.IDSUBPRODUTO AS CODIGO_INTERNO, CAST(E.CUSTOGERENCIAL AS DECIMAL(15,2)) AS CUSTO_GERENCIAL " + SQL_FROM_DB2
 
-    existing_codes = set()
+# Resumo dos custos numa linha só. As somas ponderadas pelo código (e pelo seu
+# quadrado) fazem cada custo contar de um jeito diferente conforme o produto:
+# dois produtos trocando de custo mudam o resumo, o que COUNT e SUM sozinhos não pegam.
+SQL_RESUMO_DB2 = """
+    SELECT COUNT(E.CUSTOGERENCIAL),
+           SUM(CAST(E.CUSTOGERENCIAL AS DECIMAL(31,2))),
+           SUM(CAST(E.CUSTOGERENCIAL AS DECIMAL(31,2)) * CAST(E.CUSTOGERENCIAL AS DECIMAL(31,2))),
+           SUM(CAST(B.IDSUBPRODUTO AS DECIMAL(31,0)) * CAST(E.CUSTOGERENCIAL AS DECIMAL(31,2))),
+           SUM(CAST(B.IDSUBPRODUTO AS DECIMAL(31,0)) * CAST(B.IDSUBPRODUTO AS DECIMAL(31,0)) * CAST(E.CUSTOGERENCIAL AS DECIMAL(31,2)))
+""" + SQL_FROM_DB2
+
+# Linhas lidas do DB2 por vez (fetchmany)
+TAMANHO_LOTE_DB2 = int(os.getenv('DB2_FETCH_SIZE', 1000))
+
+# --- ASSINATURAS E SNAPSHOT ---
+
+def formatar_custo(custo):
+    """Mesmo formato de custos.formatar_custo no app: 2 casas, '' quando não há custo."""
+    return '' if custo is None else f"{float(custo):.2f}"
+
+def assinatura_custos(custos):
+    """Mesmo hash de custos.assinatura_custos no app, calculado sobre {codigo_interno: custo}."""
+    h = hashlib.sha256()
+    for codigo in sorted(custos):
+        h.update(f"{codigo}\t{formatar_custo(custos[codigo])}\n".encode('utf-8'))
+    return h.hexdigest()
+
+def load_snapshot():
+    """Último estado enviado: {"custos": {...}, "assinatura": ..., "resumo_db2": [...]} ou None."""
     try:
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT codigo_interno FROM products WHERE codigo_interno IS NOT NULL AND codigo_interno != '';")
-        rows = cur.fetchall()
-        for row in rows:
-            existing_codes.add(row[0])
-        cur.close()
-        conn.close()
-        print(f"Encontrados {len(existing_codes)} codigos internos no banco de dados do aplicativo.")
-    except Exception as e:
-        print(f"ERRO ao buscar codigos do app: {e}")
-    return existing_codes
+        with open(SNAPSHOT_FILE, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Snapshot editado ou corrompido: não confia nele.
+    if snapshot.get("assinatura") != assinatura_custos(snapshot.get("custos", {})):
+        return None
+    return snapshot
 
-def fetch_costs_from_db2():
-    """Conecta ao DB2 e busca os custos."""
-    costs_list = []
-    print("Tentando conectar ao banco de dados DB2...")
+def save_snapshot(custos, resumo_db2):
+    snapshot = {
+        "custos": custos,
+        "assinatura": assinatura_custos(custos),
+        "resumo_db2": resumo_db2,
+        "atualizado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    temporario = SNAPSHOT_FILE + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, sort_keys=True)
+    os.replace(temporario, SNAPSHOT_FILE)
+
+# --- APP ---
+
+def get_catalog_fingerprint(com_custos=False):
+    """Assinatura dos custos do app (e, com com_custos=True, o próprio {codigo_interno: custo})."""
+    api_url = f"{RENDER_APP_URL}/api/catalog-fingerprint"
+    params = {'custos': '1'} if com_custos else None
+    response = requests.get(api_url, headers={'X-API-KEY': API_SECRET_KEY}, params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+# --- DB2 ---
+
+def connect_db2():
+    conn_str = (
+        f"DRIVER={{IBM DB2 ODBC DRIVER}};"
+        f"DATABASE={DB2_DATABASE};"
+        f"HOSTNAME={DB2_HOSTNAME};"
+        f"PORT={DB2_PORT};"
+        f"PROTOCOL=TCPIP;"
+        f"UID={DB2_USERNAME};"
+        f"PWD={DB2_PASSWORD};"
+    )
+    return pyodbc.connect(conn_str, timeout=10)
+
+def fetch_db2_summary():
+    """Resumo barato dos custos no DB2: [quantidade, soma, soma dos quadrados, somas ponderadas pelo código]."""
     try:
-        conn_str = (
-            f"DRIVER={{IBM DB2 ODBC DRIVER}};"
-            f"DATABASE={DB2_DATABASE};"
-            f"HOSTNAME={DB2_HOSTNAME};"
-            f"PORT={DB2_PORT};"
-            f"PROTOCOL=TCPIP;"
-            f"UID={DB2_USERNAME};"
-            f"PWD={DB2_PASSWORD};"
-        )
-        with pyodbc.connect(conn_str, timeout=10) as cnxn:
-            # ... (código da query SQL inalterado) ...
+        with connect_db2() as cnxn:
             cursor = cnxn.cursor()
-            sql_query = """
-                SELECT B.IDSUBPRODUTO AS CODIGO_INTERNO, CAST(E.CUSTOGERENCIAL AS DECIMAL(15,2)) AS CUSTO_GERENCIAL
-                FROM DBA.PRODUTO AS A
-                LEFT JOIN DBA.PRODUTO_GRADE AS B ON (A.IDPRODUTO = B.IDPRODUTO)
-                LEFT JOIN DBA.SECAO AS C ON (A.IDSECAO = C.IDSECAO)
-                LEFT JOIN DBA.PRODUTO_CADEIA_PRECO AS D ON (B.IDCADEIAPRECO = D.IDCADEIAPRECO)
-                LEFT JOIN DBA.POLITICA_PRECO_PRODUTO AS E ON (B.IDPRODUTO = E.IDPRODUTO AND B.IDSUBPRODUTO = E.IDSUBPRODUTO AND E.IDEMPRESA = 1)
-                WHERE B.FLAGINATIVO = 'F' AND A.IDSECAO = 44 AND A.IDGRUPO <> 4410
-            """
-            cursor.execute(sql_query)
-            rows = cursor.fetchall()
-            for row in rows:
-                if row.CODIGO_INTERNO and row.CUSTO_GERENCIAL is not None:
-                    costs_list.append({
-                        "codigo_interno": str(row.CODIGO_INTERNO).strip(), # .strip() para remover espaços extras
-                        "custo": float(row.CUSTO_GERENCIAL) / 100.0
-                    })
-            print(f"Sucesso: {len(costs_list)} custos carregados do DB2.")
+            cursor.execute(SQL_RESUMO_DB2)
+            row = cursor.fetchone()
+            return [str(valor) if valor is not None else None for valor in row]
     except Exception as e:
-        print(f"ERRO CRÍTICO AO CONECTAR COM O DB2: {e}")
+        print(f"AVISO: nao foi possivel consultar o resumo do DB2 ({e}); seguindo com a extracao completa.")
         return None
-    return costs_list
-
-def send_costs_to_api(costs_list, existing_codes):
-    """Envia a lista de custos para a API e gera um log detalhado."""
-    if not API_SECRET_KEY:
-        print("ERRO: A chave da API (API_SECRET_KEY) não foi configurada no arquivo .env.")
-        return
-
-    # Filtra apenas os custos para produtos que realmente existem no nosso app
-    costs_to_send = [item for item in costs_list if item['codigo_interno'] in existing_codes]
-    codes_not_found = [item for item in costs_list if item['codigo_interno'] not in existing_codes]
-
-    with open(LOG_FILE, "w", encoding="utf-8") as f:
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"--- Log de Sincronizacao de Custos - {now} ---\n\n")
-        f.write(f"Total de custos encontrados no DB2: {len(costs_list)}\n")
-        f.write(f"Total de codigos correspondentes encontrados no app: {len(costs_to_send)}\n")
-        f.write(f"Total de codigos NAO encontrados no app: {len(codes_not_found)}\n\n")
-
-        if not costs_to_send:
-            f.write("Nenhum custo para enviar. Verifique se os codigos internos correspondem.\n")
-            print("Nenhum custo correspondente para enviar.")
-            return
-
-        api_url = f"{RENDER_APP_URL}/api/update-costs"
-        headers = {'Content-Type': 'application/json', 'X-API-KEY': API_SECRET_KEY}
-        payload = json.dumps({"costs": costs_to_send})
-
-        print(f"Enviando {len(costs_to_send)} custos para a API...")
-        f.write(f"--- DETALHES DA EXECUCAO ---\n")
-        try:
-            response = requests.post(api_url, headers=headers, data=payload, timeout=60)
-            if response.status_code == 200:
-                print("Sucesso! Resposta da API:")
-                print(response.json())
-                f.write(f"Status do Envio: SUCESSO\n")
-                f.write(f"Resposta da API: {response.json().get('message')}\n\n")
-            else:
-                print(f"Erro ao enviar dados. Status: {response.status_code}")
-                print("Resposta:", response.text)
-                f.write(f"Status do Envio: ERRO {response.status_code}\n")
-                f.write(f"Resposta da API: {response.text}\n\n")
 
+def iter_costs_from_db2(cursor, tamanho_lote=TAMANHO_LOTE_DB2, cronometro=None):
+    """Gera os custos {"codigo_interno", "custo"} lendo o cursor aos poucos (fetchmany).
+
+    Funciona com qualquer cursor DB-API (pyodbc no DB2, sqlite3 nos testes locais):
+    as colunas são lidas por posição, sem depender dos nomes. Com `cronometro`,
+    o tempo gasto esperando o DB2 é somado na fase 'leitura_db2'.
+    """
+    cronometro = cronometro or diario_sincronizacao.Cronometro()
+    with cronometro.fase('leitura_db2'):
+        cursor.execute(SQL_CUSTOS_DB2)
+    while True:
+        with cronometro.fase('leitura_db2'):
+            rows = cursor.fetchmany(tamanho_lote)
+        if not rows:
+            break
+        for row in rows:
+            codigo, custo = row[0], row[1]
+            if codigo and custo is not None:
+                yield {"codigo_interno": str(codigo).strip(), "custo": round(float(custo) / 100.0, 2)}
+
+# --- ENVIO ---
+
+def filtrar_alterados(itens, custos_no_app, contagem, full=False):
+    """Deixa passar só os custos de códigos do app que mudaram (todos os do app, com full=True).
+
+    Conta em `contagem` os itens lidos, inalterados e não encontrados no app, e
+    guarda em contagem['enviados'] o {codigo_interno: custo} de cada item que passou.
+    """
+    for item in itens:
+        contagem['lidos'] += 1
+        codigo = item['codigo_interno']
+        if codigo not in custos_no_app:
+            contagem['nao_encontrados'] += 1
+        elif not full and formatar_custo(custos_no_app[codigo]) == formatar_custo(item['custo']):
+            contagem['inalterados'] += 1
+        else:
+            contagem['enviados'][codigo] = item['custo']
+            yield item
+
+def send_costs_to_api(itens, run_id):
+    """Envia os custos (gerador) para a API conforme são lidos. Retorna o ResultadoEnvio."""
+    print("Lendo os custos do DB2 e enviando os alterados para a API...")
+    enviador = EnviadorCustos(RENDER_APP_URL, API_SECRET_KEY)
+    try:
+        return enviador.enviar(itens, run_id=run_id)
+    finally:
+        enviador.fechar()
+
+def _sincronizar(full, registro, cronometro):
+    """Executa a sincronização, preenchendo o registro do diário. Retorna o status da execução."""
+    snapshot = None if full else load_snapshot()
+
+    # 1. Assinatura do catálogo no app (requisição pequena)
+    try:
+        with cronometro.fase('catalogo_app'):
+            fingerprint = get_catalog_fingerprint()
+    except requests.exceptions.RequestException as e:
+        print(f"Falha ao consultar a assinatura do catalogo no app: {e}")
+        registro['erro'] = str(e)
+        return 'falha_app'
+
+    # 2. Resumo do DB2: se nada mudou nos dois lados, não há o que enviar
+    with cronometro.fase('resumo_db2'):
+        resumo_db2 = fetch_db2_summary()
+    if (snapshot and resumo_db2 is not None
+            and fingerprint['assinatura'] == snapshot['assinatura']
+            and resumo_db2 == snapshot.get('resumo_db2')):
+        print("Nada mudou desde a ultima sincronizacao (catalogo do app e custos do DB2 iguais). Nada a enviar.")
+        return 'sem_alteracoes'
+
+    # 3. Estado atual do app: o snapshot, se ainda confere; senão, a lista completa do app
+    if snapshot and fingerprint['assinatura'] == snapshot['assinatura']:
+        custos_no_app = snapshot['custos']
+    else:
+        try:
+            with cronometro.fase('catalogo_app'):
+                custos_no_app = get_catalog_fingerprint(com_custos=True)['custos']
         except requests.exceptions.RequestException as e:
-            print(f"Falha na conexão com a API: {e}")
-            f.write(f"Status do Envio: FALHA NA CONEXAO\n")
-            f.write(f"Erro: {e}\n\n")
+            print(f"Falha ao buscar os custos do app: {e}")
+            registro['erro'] = str(e)
+            return 'falha_app'
+        print(f"Encontrados {len(custos_no_app)} codigos internos no aplicativo.")
 
-        # Escreve os logs detalhados
-        f.write("\n--- Produtos com Custo ATUALIZADO ---\n")
-        for item in costs_to_send:
-            f.write(f"Codigo: {item['codigo_interno']} - Novo Custo: R$ {item['custo']:.2f}\n")
-        
-        f.write("\n--- Produtos com Custo NAO ATUALIZADO (Codigo nao encontrado no app) ---\n")
-        for item in codes_not_found:
-            f.write(f"Codigo do DB2: {item['codigo_interno']}\n")
+    # 4. Extração do DB2 em streaming, enviando só o que mudou conforme é lido
+    contagem = {'lidos': 0, 'inalterados': 0, 'nao_encontrados': 0, 'enviados': {}}
+    print("Tentando conectar ao banco de dados DB2...")
+    inicio = time.perf_counter()
+    try:
+        with connect_db2() as cnxn:
+            itens = filtrar_alterados(iter_costs_from_db2(cnxn.cursor(), cronometro=cronometro), custos_no_app, contagem, full=full)
+            resultado = send_costs_to_api(itens, registro['run_id'])
+    except pyodbc.Error as e:
+        print(f"ERRO CRÍTICO AO LER OS CUSTOS DO DB2: {e}")
+        registro['erro'] = str(e)
+        registro['contagens'] = {'lidos': contagem['lidos']}
+        return 'falha_db2'
+    finally:
+        # Leitura e envio acontecem juntos: o envio é o tempo total menos a espera pelo DB2.
+        cronometro.somar('envio', time.perf_counter() - inicio - cronometro.tempos.get('leitura_db2', 0.0))
 
-    print(f"Processo finalizado. Log detalhado foi salvo no arquivo: {LOG_FILE}")
+    registro['contagens'] = {
+        'lidos': contagem['lidos'], 'inalterados': contagem['inalterados'],
+        'nao_encontrados': contagem['nao_encontrados'], 'enviados': len(contagem['enviados']),
+        'atualizados': len(resultado.atualizados), 'desconhecidos': len(resultado.desconhecidos),
+        'partes': resultado.total_partes,
+        'tentativas': resultado.tentativas,
+    }
+    registro['alteracoes'] = {codigo: [custos_no_app.get(codigo), contagem['enviados'][codigo]]
+                              for codigo in resultado.atualizados if codigo in contagem['enviados']}
+    if not contagem['lidos']:
+        print("Nenhum custo encontrado para sincronizar.")
+        return 'vazio'
+    if not contagem['enviados']:
+        print("Nenhum custo alterado para enviar.")
+    elif resultado.sucesso:
+        print(f"Sucesso! {resultado.resumo()}")
+    else:
+        print(f"Envio incompleto: {resultado.resumo()}")
+        print("As partes que faltam serao enviadas na proxima execucao.")
+        registro['falhas'] = {str(parte): erro for parte, erro in sorted(resultado.falhas.items())}
+        return 'incompleto'
+
+    novo_estado = dict(custos_no_app)
+    novo_estado.update(contagem['enviados'])
+    save_snapshot(novo_estado, resumo_db2)
+    return 'sucesso'
+
+def sincronizar(full=False):
+    registro = diario_sincronizacao.novo_registro(uuid.uuid4().hex)
+    registro['full'] = full
+    registro['status'] = 'erro'
+    cronometro = diario_sincronizacao.Cronometro()
+    inicio = time.perf_counter()
+    try:
+        registro['status'] = _sincronizar(full, registro, cronometro)
+    finally:
+        cronometro.somar('total', time.perf_counter() - inicio)
+        registro['tempos'] = cronometro.em_segundos()
+        diario_sincronizacao.registrar(registro)
+    print(f"Execucao {registro['run_id']} registrada no diario: {diario_sincronizacao.ARQUIVO_DIARIO}")
 
 if __name__ == "__main__":
-    # É necessário ter a URL do banco da Render no .env para este script funcionar
-    if not POSTGRES_URL:
-        print("ERRO: Variavel DATABASE_URL (do banco PostgreSQL da Render) nao foi encontrada no arquivo .env.")
+    parser = argparse.ArgumentParser(description="Sincroniza os custos do DB2 com o app de contagem.")
+    parser.add_argument('--full', action='store_true', help="ignora o snapshot local e envia todos os custos")
+    args = parser.parse_args()
+
+    if not API_SECRET_KEY or not RENDER_APP_URL:
+        print("ERRO: RENDER_APP_URL e API_SECRET_KEY precisam estar configuradas no arquivo .env.")
     else:
-        codigos_no_app = get_existing_codes_from_app()
-        custos_do_db2 = fetch_costs_from_db2()
-        if custos_do_db2:
-            send_costs_to_api(custos_do_db2, codigos_no_app)
-        else:
-            print("Nenhum custo encontrado para sincronizar.")
\ No newline at end of file
+        sincronizar(full=args.full)
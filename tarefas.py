@@ -0,0 +1,89 @@
+# tarefas.py - Tarefas executadas pelo worker (worker.py) a partir da fila de jobs.py
+"""
+Cada função recebe a conexão e o payload do job e devolve o resultado (dict).
+As escritas ficam na transação do job: jobs.executar() faz o commit junto
+com a conclusão, ou o rollback se algo falhar.
+
+- pdf_pedido: PDF do pedido final; o arquivo fica no próprio job (o worker
+  e o web não compartilham disco no Render) e é baixado em /api/jobs/<id>/arquivo.
+- sugestoes: sugestões de pedido de uma data (previsao.py).
+- reconstruir_agregados: recalcula agregados_diarios num período.
+
+/api/update-costs não passa pela fila: o envio já chega em partes
+(envio_custos.py) e cada parte é aplicada na própria requisição.
+
+O payload leva as lojas do app ("lojas"), que o web preenche ao enfileirar.
+"""
+
+from datetime import date
+
+import agregados
+import cache
+import custos
+import jobs
+import pdf_pedido
+import previsao
+import queries
+
+
+def _data(payload, campo='data'):
+    try:
+        return date.fromisoformat(payload[campo]).isoformat()
+    except (KeyError, TypeError, ValueError):
+        raise jobs.FalhaDefinitiva(f"'{campo}' deve ser uma data AAAA-MM-DD.")
+
+
+def _lojas(payload):
+    lojas = payload.get('lojas')
+    if not lojas:
+        raise jobs.FalhaDefinitiva("Payload sem 'lojas'.")
+    return lojas
+
+
+@jobs.tarefa('pdf_pedido', admin=True)
+def gerar_pdf_pedido(conn, payload):
+    """payload: {data, lojas, pedidos: [[produto, loja, quantidade], ...]}; sem pedidos, usa o pedido final salvo."""
+    data_pedido, lojas = _data(payload), _lojas(payload)
+    dia = date.fromisoformat(data_pedido).weekday()
+    cursor = conn.cursor()
+    try:
+        pedidos = payload.get('pedidos')
+        if pedidos is None:
+            queries.executar(cursor, 'pedidos_finais_do_dia', (data_pedido,))
+            pedidos = cursor.fetchall()
+        tabela = pdf_pedido.montar_tabela(pedidos, lojas)
+        if not tabela:
+            raise jobs.FalhaDefinitiva("Nenhum dado de pedido.")
+        produtos = custos.custos_dos_produtos(cursor, cache.catalogo.produtos_do_dia(cursor, dia), data_pedido, dia)
+    finally:
+        cursor.close()
+    with pdf_pedido.abrir_pdf(data_pedido, lojas, tabela, {p['nome']: p['custo'] for p in produtos}) as f:
+        conteudo = f.read()
+    return {"nome": pdf_pedido.nome_arquivo(data_pedido), "mimetype": "application/pdf", "produtos": len(tabela), "arquivo": conteudo}
+
+
+@jobs.tarefa('sugestoes', admin=True)
+def calcular_sugestoes(conn, payload):
+    """payload: {data, lojas}. Recalcula todas as sugestões da data."""
+    data_pedido, lojas = _data(payload), _lojas(payload)
+    cursor = conn.cursor()
+    try:
+        produtos = [p['nome'] for p in cache.catalogo.produtos_do_dia(cursor, date.fromisoformat(data_pedido).weekday())]
+        total = previsao.calcular_sugestoes(cursor, data_pedido, produtos, lojas) if produtos else 0
+    finally:
+        cursor.close()
+    return {"data": data_pedido, "sugestoes": total}
+
+
+@jobs.tarefa('reconstruir_agregados', admin=True)
+def reconstruir_agregados(conn, payload):
+    """payload: {inicio, fim}. Regrava agregados_diarios no período a partir de pedidos e pedidos_finais."""
+    inicio, fim = _data(payload, 'inicio'), _data(payload, 'fim')
+    if fim < inicio:
+        raise jobs.FalhaDefinitiva("'fim' anterior a 'inicio'.")
+    cursor = conn.cursor()
+    try:
+        linhas = agregados.reconstruir_periodo(cursor, inicio, fim)
+    finally:
+        cursor.close()
+    return {"inicio": inicio, "fim": fim, "linhas": linhas}
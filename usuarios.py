@@ -0,0 +1,82 @@
+# usuarios.py - Senhas com hash e login pelo cache de usuários
+"""
+As senhas ficam em users.password como hash PBKDF2-SHA256 com salt, no formato
+do werkzeug ("pbkdf2:sha256:<iterações>$<salt>$<hash>"). O número de
+iterações (PASSWORD_HASH_ITERATIONS) é o custo do login: cada verificação leva
+tempo proporcional a ele, então é escolhido com `benchmark.py senha` para
+caber em ORCAMENTO_LOGIN_MS na instância do Render.
+
+Senhas antigas, ainda em texto, continuam aceitas: no primeiro login certo
+elas são trocadas pelo hash. O mesmo acontece com um hash de custo diferente
+do atual, quando PASSWORD_HASH_ITERATIONS muda.
+
+O login não consulta o banco com a senha: o usuário vem do cache
+cache.usuarios (role, loja e hash, por username), invalidado pela versão
+'usuarios' de cache_versao sempre que um usuário é gravado.
+"""
+
+import hmac
+import os
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import cache
+import queries
+
+ITERACOES = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000))
+METODO = f"pbkdf2:sha256:{ITERACOES}"
+TAMANHO_SALT = 16
+# Tempo máximo aceitável de uma verificação de senha no login.
+ORCAMENTO_LOGIN_MS = float(os.environ.get('LOGIN_BUDGET_MS', 300))
+
+_PREFIXOS_HASH = ('pbkdf2:', 'scrypt:')
+
+
+def hash_senha(senha, metodo=None):
+    return generate_password_hash(senha, method=metodo or METODO, salt_length=TAMANHO_SALT)
+
+
+def em_texto(armazenada):
+    """A senha gravada ainda está em texto (anterior ao hash)?"""
+    return not armazenada.startswith(_PREFIXOS_HASH)
+
+
+def conferir(armazenada, senha):
+    if em_texto(armazenada):
+        return hmac.compare_digest(armazenada.encode('utf-8'), senha.encode('utf-8'))
+    return check_password_hash(armazenada, senha)
+
+
+def precisa_atualizar(armazenada):
+    """Texto ou hash com outro método/custo: deve ser regravada com METODO."""
+    return em_texto(armazenada) or armazenada.split('$', 1)[0] != METODO
+
+
+# Hash usado quando o usuário não existe, para o login levar o mesmo tempo
+# com usuário certo ou errado.
+_HASH_FICTICIO = None
+
+
+def autenticar(cursor, username, senha):
+    """(usuario, regravada): o cache.Usuario (username, senha, role, store_name) se a senha confere, ou None.
+
+    Regrava a senha com o hash atual quando necessário; com regravada=True
+    quem chama faz o commit.
+    """
+    global _HASH_FICTICIO
+    principal = cache.usuarios.obter(cursor, username)
+    if principal is None:
+        if _HASH_FICTICIO is None:
+            _HASH_FICTICIO = hash_senha(os.urandom(16).hex())
+        check_password_hash(_HASH_FICTICIO, senha)
+        return None, False
+    if not conferir(principal.senha, senha):
+        return None, False
+    regravada = False
+    if precisa_atualizar(principal.senha):
+        novo = hash_senha(senha)
+        # Só troca se ninguém alterou a senha no meio tempo.
+        if queries.executar(cursor, 'atualizar_senha_usuario', (novo, username, principal.senha)).rowcount:
+            cache.invalidar(cursor, cache.USUARIOS)
+            regravada = True
+    return principal, regravada
@@ -0,0 +1,16 @@
+# usuarios_config.py - Usuários iniciais do sistema
+
+# (username, senha inicial, role, loja). Usado pelo init_db.py e pelo
+# add_fcl4_user.py; a senha é gravada no banco só como hash (usuarios.hash_senha).
+USUARIOS = [
+    ('bcs', 'bcs123', 'loja', 'BCS'),
+    ('sjn', 'sjn123', 'loja', 'SJN'),
+    ('mep', 'mep123', 'loja', 'MEP'),
+    ('fcl1', 'fcl123', 'loja', 'FCL1'),
+    ('fcl2', 'fcl223', 'loja', 'FCL2'),
+    ('fcl3', 'fcl323', 'loja', 'FCL3'),
+    ('fcl4', 'fcl423', 'loja', 'FCL4'),
+    ('Igor', 'S4nt4n4', 'admin', None),
+    ('Gabriel', 'G1a2l', 'admin', None),
+    ('Paulo', 'paulo123', 'admin', None)
+]
@@ -0,0 +1,36 @@
+# worker.py - Processo que executa a fila de jobs (tarefas em segundo plano)
+"""
+Roda ao lado do gunicorn (linha `worker:` do Procfile, ou um Background
+Worker no Render com o mesmo DATABASE_URL). Localmente, com SQLite:
+    python worker.py              # fica processando a fila
+    python worker.py --uma-vez    # executa o que estiver pendente e sai
+
+SIGTERM (deploy/parada do serviço) termina o job em andamento e sai.
+"""
+
+import argparse
+import signal
+import threading
+
+import jobs
+import tarefas  # noqa: F401 - registra as tarefas em jobs.TAREFAS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Executa os jobs da fila (tabela jobs).")
+    parser.add_argument('--uma-vez', action='store_true', help="processa os jobs disponíveis e sai")
+    parser.add_argument('--intervalo', type=float, default=jobs.INTERVALO, help="segundos entre consultas à fila vazia")
+    args = parser.parse_args()
+
+    parar = threading.Event()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, lambda *_: parar.set())
+
+    worker = jobs.nome_do_worker()
+    print(f"🚀 Worker {worker}: tarefas {', '.join(sorted(jobs.TAREFAS))}")
+    total = jobs.rodar(worker, intervalo=args.intervalo, parar=parar, uma_vez=args.uma_vez)
+    print(f"👋 Worker {worker} encerrado ({total} jobs executados).")
+
+
+if __name__ == "__main__":
+    main()